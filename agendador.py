@@ -0,0 +1,324 @@
+# agendador.py
+# Agendamento adaptativo do scraping a partir do histórico de mudanças de preço.
+# - Aprende a probabilidade de mudança por hora da semana (168 faixas, UTC)
+# - Distribui um orçamento fixo de execuções onde mudanças são mais prováveis
+# - Dispara execuções extras logo após uma mudança detectada
+# - Modo simulação: reexecuta o histórico e compara com o cron fixo (8/8h)
+
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+# ---------------- Configurações ----------------
+URL = os.getenv("STORE_URL", "https://app.cardapioweb.com/acai_moto_food")
+HOURS_PER_WEEK = 24 * 7
+
+# Orçamento semanal de execuções (21 = o mesmo gasto do cron a cada 8h)
+SCRAPE_BUDGET = int(os.getenv("SCRAPE_BUDGET", "21"))
+# Após uma mudança: roda de novo a cada FOLLOWUP_INTERVAL horas, até FOLLOWUP_WINDOW horas
+FOLLOWUP_INTERVAL = int(os.getenv("FOLLOWUP_INTERVAL", "1"))
+FOLLOWUP_WINDOW = int(os.getenv("FOLLOWUP_WINDOW", "3"))
+# Parte do orçamento reservada para as execuções extras pós-mudança
+FOLLOWUP_RESERVE = int(os.getenv("FOLLOWUP_RESERVE", "6"))
+# Reaprende as taxas quando o plano salvo for mais velho que isso
+PLAN_MAX_AGE_HOURS = int(os.getenv("PLAN_MAX_AGE_HOURS", "24"))
+# Suavização (prior Beta) para faixas com pouco histórico
+PRIOR_ALPHA = 1.0
+PRIOR_BETA = 4.0
+
+FIXED_CRON_HOURS = (0, 8, 16)
+
+# ---------------- Firestore ----------------
+def init_firestore():
+    cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "serviceAccountKey.json")
+    if not os.path.isfile(cred_path):
+        raise FileNotFoundError(f"Credencial não encontrada: {cred_path}")
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(cred_path)
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+def store_key(url: str = URL) -> str:
+    return url.rstrip('/').rsplit('/', 1)[-1]
+
+def to_utc(x) -> datetime:
+    if x.tzinfo is None:
+        return x.replace(tzinfo=timezone.utc)
+    return x.astimezone(timezone.utc)
+
+def hour_of_week(dt: datetime) -> int:
+    dt = to_utc(dt)
+    return dt.weekday() * 24 + dt.hour
+
+def floor_hour(dt: datetime) -> datetime:
+    return to_utc(dt).replace(minute=0, second=0, microsecond=0)
+
+# ---------------- Histórico de mudanças ----------------
+def load_change_events(db) -> list[datetime]:
+    """
+    Retorna os instantes (UTC, ordenados) em que algum preço mudou.
+    Usa a subcoleção 'prices' de todos os produtos numa única consulta
+    (collection group); o primeiro ponto de cada produto é a criação, não mudança.
+    Produtos sem histórico contribuem com price_changed_at.
+    """
+    by_pid: dict[str, list[datetime]] = {}
+    for s in db.collection_group('prices').select(['at']).stream():
+        at = (s.to_dict() or {}).get('at')
+        if at is None:
+            continue
+        pid = s.reference.parent.parent.id
+        by_pid.setdefault(pid, []).append(to_utc(at))
+
+    events = []
+    for points in by_pid.values():
+        points.sort()
+        events.extend(points[1:])
+
+    q = db.collection('products').where('change_count', '>', 0).select(['price_changed_at'])
+    for d in q.stream():
+        if d.id in by_pid:
+            continue
+        at = (d.to_dict() or {}).get('price_changed_at')
+        if at is not None:
+            events.append(to_utc(at))
+
+    events.sort()
+    return events
+
+def change_rates(events: list[datetime], start: datetime, end: datetime) -> list[float]:
+    """
+    Probabilidade de haver ao menos uma mudança em cada hora da semana.
+    Conta, por faixa, em quantas semanas observadas houve mudança (Beta-Binomial).
+    """
+    start, end = floor_hour(start), floor_hour(end)
+    hit_hours = {floor_hour(e) for e in events if start <= e < end}
+    hits = [0] * HOURS_PER_WEEK
+    for h in hit_hours:
+        hits[hour_of_week(h)] += 1
+
+    total_hours = max(0, int((end - start).total_seconds() // 3600))
+    trials = [total_hours // HOURS_PER_WEEK] * HOURS_PER_WEEK
+    first = hour_of_week(start)
+    for k in range(total_hours % HOURS_PER_WEEK):
+        trials[(first + k) % HOURS_PER_WEEK] += 1
+
+    return [
+        (hits[i] + PRIOR_ALPHA) / (trials[i] + PRIOR_ALPHA + PRIOR_BETA)
+        for i in range(HOURS_PER_WEEK)
+    ]
+
+def expected_latency(probs: list[float], slots: list[int]) -> float:
+    """Latência esperada (horas) até a próxima execução, ponderada pela chance de mudança."""
+    if not slots:
+        return float('inf')
+    ordered = sorted(slots)
+    total, j = 0.0, 0
+    for h in range(HOURS_PER_WEEK):
+        # Mudança durante a hora h é vista pela primeira execução em h+1 ou depois
+        while j < len(ordered) and ordered[j] <= h:
+            j += 1
+        nxt = ordered[j] if j < len(ordered) else ordered[0] + HOURS_PER_WEEK
+        total += probs[h] * (nxt - h)
+    return total
+
+def plan_size(budget: int = SCRAPE_BUDGET) -> int:
+    return max(1, budget - FOLLOWUP_RESERVE)
+
+def allocate_budget(probs: list[float], budget: int = SCRAPE_BUDGET) -> list[int]:
+    """
+    Escolhe 'budget' horas da semana para rodar, de forma gulosa:
+    cada nova faixa é a que mais reduz a latência esperada de detecção.
+    """
+    budget = max(1, min(budget, HOURS_PER_WEEK))
+    slots: list[int] = []
+    for _ in range(budget):
+        best, best_cost = None, None
+        for h in range(HOURS_PER_WEEK):
+            if h in slots:
+                continue
+            cost = expected_latency(probs, slots + [h])
+            if best_cost is None or cost < best_cost:
+                best, best_cost = h, cost
+        slots.append(best)
+    return sorted(slots)
+
+# ---------------- Decisão ----------------
+def should_run(now: datetime, slots: list[int], last_run: datetime | None,
+               last_change: datetime | None, runs_last_week: int = 0) -> tuple[bool, str]:
+    """
+    Roda nas faixas do plano; fora delas, só roda para acompanhar uma mudança
+    recente e enquanto as execuções dos últimos 7 dias couberem no orçamento.
+    """
+    now = to_utc(now)
+    if last_run is not None and floor_hour(last_run) == floor_hour(now):
+        return False, "já rodou nesta hora"
+    if hour_of_week(now) in slots:
+        return True, "faixa do plano"
+    if runs_last_week >= SCRAPE_BUDGET:
+        return False, "orçamento semanal esgotado"
+    if last_change is not None and last_run is not None:
+        since_change = (now - to_utc(last_change)).total_seconds() / 3600
+        # Em horas cheias, como a guarda acima: a coleta termina alguns minutos depois do
+        # cron, e a diferença exata (~0,97 h) empurraria o acompanhamento para 2 h depois
+        since_run = (floor_hour(now) - floor_hour(last_run)).total_seconds() / 3600
+        if since_change <= FOLLOWUP_WINDOW and since_run >= FOLLOWUP_INTERVAL:
+            return True, "acompanhamento pós-mudança"
+    return False, "fora do plano"
+
+def load_or_refresh_plan(db, now: datetime, force: bool = False) -> tuple[list[int], list[datetime]]:
+    """Retorna (faixas do plano, execuções recentes) do doc 'scheduler/{loja}'."""
+    ref = db.collection('scheduler').document(store_key())
+    snap = ref.get()
+    plan = snap.to_dict() if snap.exists else None
+    recent = [to_utc(r) for r in (plan or {}).get('recent_runs', [])]
+    if plan and not force and plan.get('budget') == SCRAPE_BUDGET:
+        age = now - to_utc(plan['learned_at'])
+        if age < timedelta(hours=PLAN_MAX_AGE_HOURS):
+            return list(plan.get('slots', [])), recent
+
+    events = load_change_events(db)
+    start = events[0] if events else now - timedelta(days=7)
+    probs = change_rates(events, start, now)
+    slots = allocate_budget(probs, plan_size())
+    ref.set({
+        'url': URL,
+        'learned_at': now,
+        'budget': SCRAPE_BUDGET,
+        'slots': slots,
+        'probs': [round(p, 4) for p in probs],
+        'events': len(events),
+    }, merge=True)
+    return slots, recent
+
+def latest_timestamp(db, field: str):
+    q = (db.collection('products')
+          .order_by(field, direction=firestore.Query.DESCENDING)
+          .limit(1)
+          .select([field]))
+    for d in q.stream():
+        return (d.to_dict() or {}).get(field)
+    return None
+
+def decide(db, now: datetime | None = None) -> tuple[bool, str]:
+    now = now or datetime.now(timezone.utc)
+    slots, recent = load_or_refresh_plan(db, now)
+    recent = [r for r in recent if now - r < timedelta(days=7)]
+    last_run = latest_timestamp(db, 'last_seen_at')
+    last_change = latest_timestamp(db, 'price_changed_at')
+    run, reason = should_run(now, slots, last_run, last_change, len(recent))
+    if run:
+        db.collection('scheduler').document(store_key()).set(
+            {'recent_runs': recent + [now]}, merge=True)
+    return run, reason
+
+# ---------------- Simulação ----------------
+def simulate(events: list[datetime], policy: str, budget: int = SCRAPE_BUDGET) -> dict:
+    """
+    Reexecuta o histórico hora a hora. Para 'adaptive', as taxas de cada semana
+    são aprendidas só com o histórico anterior a ela (sem olhar o futuro).
+    Retorna execuções, latência média/p95/máx (horas) e mudanças detectadas.
+    """
+    if not events:
+        return {'policy': policy, 'runs': 0, 'events': 0}
+    start = floor_hour(events[0]) - timedelta(days=7)
+    end = floor_hour(events[-1]) + timedelta(hours=FOLLOWUP_WINDOW + HOURS_PER_WEEK)
+
+    runs: list[datetime] = []
+    pending = list(events)
+    latencies: list[float] = []
+    last_run, last_change = None, None
+    slots: list[int] = []
+    week_start = None
+
+    t = start
+    while t <= end:
+        if policy == 'adaptive' and (week_start is None or t - week_start >= timedelta(days=7)):
+            week_start = t
+            probs = change_rates([e for e in events if e < t], start, t)
+            slots = allocate_budget(probs, plan_size(budget))
+
+        if policy == 'fixed':
+            run = t.hour in FIXED_CRON_HOURS
+        else:
+            recent = sum(1 for r in runs[-HOURS_PER_WEEK:] if t - r < timedelta(days=7))
+            run, _ = should_run(t, slots, last_run, last_change, recent)
+
+        if run:
+            runs.append(t)
+            last_run = t
+            seen = [e for e in pending if e <= t]
+            if seen:
+                pending = pending[len(seen):]
+                latencies.extend((t - e).total_seconds() / 3600 for e in seen)
+                last_change = t
+        t += timedelta(hours=1)
+
+    weeks = max(1.0, (end - start).total_seconds() / (3600 * HOURS_PER_WEEK))
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None
+    return {
+        'policy': policy,
+        'runs': len(runs),
+        'runs_per_week': round(len(runs) / weeks, 1),
+        'events': len(events),
+        'detected': len(latencies),
+        'latency_mean_h': round(sum(latencies) / len(latencies), 2) if latencies else None,
+        'latency_p95_h': round(p95, 2) if p95 is not None else None,
+        'latency_max_h': round(latencies[-1], 2) if latencies else None,
+    }
+
+def print_simulation(events: list[datetime]):
+    print(f"Eventos de mudança no histórico: {len(events)}")
+    if not events:
+        print("Sem histórico suficiente para simular.")
+        return
+    print(f"Período: {events[0]:%Y-%m-%d %H:%M} -> {events[-1]:%Y-%m-%d %H:%M} (UTC)")
+    print(f"Orçamento: {SCRAPE_BUDGET}/semana | pós-mudança: a cada {FOLLOWUP_INTERVAL}h por {FOLLOWUP_WINDOW}h\n")
+    header = f"{'Política':<10} {'Execuções':>9} {'/semana':>8} {'Detect.':>8} {'Lat. média':>11} {'Lat. p95':>9} {'Lat. máx':>9}"
+    print(header)
+    print("-" * len(header))
+    for policy in ('fixed', 'adaptive'):
+        r = simulate(events, policy)
+        print(f"{policy:<10} {r['runs']:>9} {r['runs_per_week']:>8} {r['detected']:>8} "
+              f"{r['latency_mean_h']!s:>11} {r['latency_p95_h']!s:>9} {r['latency_max_h']!s:>9}")
+
+# -------- Main --------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agendador adaptativo do scraping")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("decidir", help="decide se o scraping deve rodar agora")
+    sub.add_parser("plano", help="reaprende e mostra as faixas escolhidas")
+    sub.add_parser("simular", help="compara cron fixo x adaptativo no histórico")
+    args = parser.parse_args(argv)
+
+    db = init_firestore()
+    now = datetime.now(timezone.utc)
+
+    if args.cmd == "decidir":
+        run, reason = decide(db, now)
+        print(f"Rodar agora: {'sim' if run else 'não'} ({reason})")
+        # Saída para o GitHub Actions
+        gh_out = os.getenv("GITHUB_OUTPUT")
+        if gh_out:
+            with open(gh_out, "a", encoding="utf-8") as f:
+                f.write(f"run={'true' if run else 'false'}\n")
+    elif args.cmd == "plano":
+        slots, _ = load_or_refresh_plan(db, now, force=True)
+        dias = ["seg", "ter", "qua", "qui", "sex", "sáb", "dom"]
+        print(f"Plano ({len(slots)} execuções/semana, UTC):")
+        for h in slots:
+            print(f"- {dias[h // 24]} {h % 24:02d}h")
+    else:
+        print_simulation(load_change_events(db))
+
+
+if __name__ == "__main__":
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+    except Exception:
+        pass
+    main()
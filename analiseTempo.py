@@ -8,6 +8,8 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 import pandas as pd
 
+from armazenamento import as_repository, get_repository
+
 # ---------- Firebase ----------
 def init_firestore():
     cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "serviceAccountKey.json")
@@ -30,16 +32,14 @@ def get_price_history(db, product_name: str, hours: int | None = None) -> pd.Dat
     """
     Retorna DataFrame com colunas: at (datetime), price (float).
     Se hours for informado, filtra por janela de tempo.
+    db: cliente Firestore ou Repository (armazenamento.py).
     """
-    ref = product_ref(db, product_name)
-    q = ref.collection('prices').order_by('at')
+    since = None
     if hours:
-        cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
-        q = q.where('at', '>=', cutoff)
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
 
     rows = []
-    for s in q.stream():
-        d = s.to_dict()
+    for d in as_repository(db).price_history(slugify(product_name), since=since):
         at = d['at']
         # Converte Firestore Timestamp -> datetime naive (para pandas)
         if hasattr(at, 'replace'):
@@ -84,17 +84,68 @@ def compute_metrics(df: pd.DataFrame, window: int = 7) -> dict:
         'slope': slope
     }
 
+def products_frame(docs: list[dict], search: str | None = None) -> pd.DataFrame:
+    """
+    Tabela de produtos com delta (atual - último) e delta_pct.
+    search: filtro "contém" no nome (sem diferenciar maiúsculas).
+    Usado pelo dashboard e pela API.
+    """
+    import numpy as np
+    if not docs:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(docs)
+    # Garantir numérico
+    df['current_price'] = pd.to_numeric(df.get('current_price', 0), errors='coerce')
+    df['last_price'] = pd.to_numeric(df.get('last_price', np.nan), errors='coerce')
+    # Fallback: se last_price ausente, usa o current_price
+    df['last_price'] = df['last_price'].fillna(df['current_price'])
+    # Cálculos
+    df['delta'] = (df['current_price'] - df['last_price'])
+    df['delta_pct'] = np.where(
+        df['last_price'] > 0,
+        (df['delta'] / df['last_price']) * 100,
+        np.nan
+    )
+    # Filtro: busca por nome (texto literal, não regex)
+    if search:
+        s = search.strip().lower()
+        if 'name' in df.columns:
+            df = df[df['name'].str.lower().str.contains(s, na=False, regex=False)]
+
+    return df.reset_index(drop=True)
+
+def menu_frame(menu: dict[str, dict]) -> pd.DataFrame:
+    """Cardápio reconstruído (armazenamento.menu_as_of) como tabela pid/name/price."""
+    df = pd.DataFrame([{'pid': pid, 'name': v.get('name') or pid, 'price': v['price']}
+                       for pid, v in menu.items()], columns=['pid', 'name', 'price'])
+    return df.sort_values('name').reset_index(drop=True)
+
+def compare_menus(a: dict[str, dict], b: dict[str, dict]) -> pd.DataFrame:
+    """
+    Compara dois cardápios reconstruídos: price_a, price_b, delta, delta_pct e
+    status (novo / removido / mudou / igual).
+    """
+    import numpy as np
+    fa = menu_frame(a).rename(columns={'price': 'price_a'})
+    fb = menu_frame(b).rename(columns={'price': 'price_b'})
+    df = fa.merge(fb, on='pid', how='outer', suffixes=('_a', '_b'))
+    df['name'] = df['name_b'].fillna(df['name_a'])
+    df['delta'] = df['price_b'] - df['price_a']
+    df['delta_pct'] = np.where(df['price_a'] > 0, df['delta'] / df['price_a'] * 100, np.nan)
+    df['status'] = np.select(
+        [df['price_a'].isna(), df['price_b'].isna(), df['delta'].abs() > 1e-9],
+        ['novo', 'removido', 'mudou'], default='igual')
+    return (df[['pid', 'name', 'price_a', 'price_b', 'delta', 'delta_pct', 'status']]
+            .sort_values(['status', 'name']).reset_index(drop=True))
+
 def get_recent_changes(db, hours: int = 24, limit: int = 100) -> list[dict]:
     """
     Retorna produtos com price_changed_at nas últimas 'hours' horas.
     Obs.: só retorna docs que tiveram mudança (price_changed_at setado).
     """
     cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
-    q = (db.collection('products')
-          .where('price_changed_at', '>=', cutoff)
-          .order_by('price_changed_at')
-          .limit(limit))
-    return [doc.to_dict() for doc in q.stream()]
+    return as_repository(db).recent_changes(cutoff, limit=limit)
 
 def get_top_movers(db, hours: int = 24, top: int = 5, by='abs') -> list[dict]:
     """
@@ -121,7 +172,7 @@ def get_top_movers(db, hours: int = 24, top: int = 5, by='abs') -> list[dict]:
 
 # ---------- Execução de exemplo ----------
 if __name__ == "__main__":
-    db = init_firestore()
+    db = get_repository(init_firestore)
     # Exemplo: histórico + métricas de um produto
     produto = "Açaí 300ml"  # ajuste conforme seu Firestore
     df = get_price_history(db, produto, hours=720)  # último mês
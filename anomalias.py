@@ -0,0 +1,70 @@
+# anomalias.py
+# Detecção de preços suspeitos no momento da ingestão, em tempo O(1) por produto
+# - Estatística online no próprio doc do produto ('price_stats'):
+#   média/variância EWMA + últimos N preços
+# - 'erro_extracao': preço fora de escala em relação à mediana recente
+#   (ex.: parse_price leu "1.234" em vez de 1234,00, ou pegou outro número)
+# - 'anomalia': desvio grande em relação à EWMA (promoção forte, reajuste brusco)
+# - 'leitura_ambigua': o texto do preço foi lido com confiança baixa (precos.parse)
+
+import os
+import math
+
+# ---------------- Configurações ----------------
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.2"))  # peso da observação nova na EWMA
+ANOMALY_Z = float(os.getenv("ANOMALY_Z", "4.0"))  # |z| a partir do qual é anomalia
+ANOMALY_WINDOW = int(os.getenv("ANOMALY_WINDOW", "8"))  # últimos N preços guardados
+ANOMALY_MIN_OBS = 3  # antes disso só acumula
+EXTRACTION_RATIO = 5.0  # preço/mediana >= 5x (ou <= 1/5) = provável erro de extração
+MIN_REL_STD = 0.10  # desvio mínimo = 10% da média (preço estável tem variância ~0)
+# HOLD_ANOMALIES=1: preço sinalizado não vira current_price até se repetir na coleta seguinte
+HOLD_ANOMALIES = os.getenv("HOLD_ANOMALIES", "0") == "1"
+# Confiança do precos.parse abaixo disso: leitura ambígua, sempre retida até se repetir
+MIN_PRICE_CONFIDENCE = float(os.getenv("PRICE_MIN_CONFIDENCE", "0.7"))
+
+ANOMALY = "anomalia"
+EXTRACTION_ERROR = "erro_extracao"
+AMBIGUOUS_READ = "leitura_ambigua"
+
+
+def new_stats(price: float) -> dict:
+    return {'mean': price, 'var': 0.0, 'n': 1, 'last': [price]}
+
+
+def median(values: list[float]) -> float:
+    s = sorted(values)  # N fixo e pequeno: custo constante
+    mid = len(s) // 2
+    return s[mid] if len(s) % 2 else (s[mid - 1] + s[mid]) / 2
+
+
+def score_price(stats: dict | None, price: float) -> tuple[str | None, float | None]:
+    """Classifica 'price' contra as estatísticas atuais. Retorna (flag, z)."""
+    if not stats or not stats.get('n'):
+        return None, None
+    ref = median(stats.get('last') or [stats['mean']])
+    if ref > 0 and price > 0:
+        ratio = price / ref
+        if ratio >= EXTRACTION_RATIO or ratio <= 1 / EXTRACTION_RATIO:
+            return EXTRACTION_ERROR, None
+
+    mean = stats['mean']
+    std = max(math.sqrt(max(stats.get('var', 0.0), 0.0)), MIN_REL_STD * abs(mean), 1e-9)
+    z = (price - mean) / std
+    if stats['n'] >= ANOMALY_MIN_OBS and abs(z) >= ANOMALY_Z:
+        return ANOMALY, round(z, 2)
+    return None, round(z, 2)
+
+
+def update_stats(stats: dict | None, price: float) -> dict:
+    """Atualização incremental da EWMA (média e variância) e da janela dos últimos N."""
+    if not stats or not stats.get('n'):
+        return new_stats(price)
+    mean, var = stats['mean'], stats.get('var', 0.0)
+    diff = price - mean
+    incr = ANOMALY_ALPHA * diff
+    return {
+        'mean': round(mean + incr, 4),
+        'var': round((1 - ANOMALY_ALPHA) * (var + diff * incr), 6),
+        'n': stats['n'] + 1,
+        'last': (list(stats.get('last') or []) + [price])[-ANOMALY_WINDOW:],
+    }
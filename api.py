@@ -0,0 +1,546 @@
+# api.py
+# API HTTP somente leitura com preços atuais, histórico e maiores variações (ASGI)
+# - GET /products?hours=&search=      (mesma lógica do dashboard.load_products)
+# - GET /products/{slug}/history?hours=
+# - GET /movers?hours=&top=&by=       (mesma lógica do analiseTempo.get_top_movers)
+# Respostas vêm de um cache LRU em memória com ETag/If-None-Match e gzip. Os produtos
+# ficam espelhados na memória (listener do Firestore: só lê o que mudou), então
+# milhares de requisições custam poucas leituras no banco.
+#
+# Servir:  uvicorn api:app --port 8000      (ou: python api.py servir)
+# Carga:   python api.py carga --url http://127.0.0.1:8000
+#          (use FIRESTORE_EMULATOR_HOST=localhost:8080 para rodar contra o emulador)
+
+import os
+import sys
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs
+
+from analiseTempo import products_frame, get_top_movers
+from armazenamento import (BACKEND, DEFAULT_LIMIT, UNCATEGORIZED, Repository, get_repository, init_firestore,
+                           slugify)
+
+# ---------------- Configurações ----------------
+API_CACHE_TTL = float(os.getenv("API_CACHE_TTL", "60"))  # janelas de tempo "deslizam"
+API_CACHE_MAX = int(os.getenv("API_CACHE_MAX", "1024"))  # respostas guardadas (LRU)
+MAX_HOURS = 24 * 365 * 10  # 'hours' maior que isso vale como esse teto
+MIRROR_POLL_S = float(os.getenv("API_MIRROR_POLL", "30"))  # backend SQL (sem listener)
+GZIP_MIN_BYTES = 1024
+MAX_TOP = 100
+
+# ---------------- Espelho dos produtos ----------------
+class ProductMirror(Repository):
+    """
+    Cópia em memória da coleção 'products'. Com Firestore, um on_snapshot mantém a
+    cópia atualizada (leitura inicial + 1 leitura por documento alterado); no backend
+    SQL, recarrega no máximo a cada MIRROR_POLL_S segundos.
+    Implementa as leituras do Repository para reaproveitar products_frame/get_top_movers.
+    """
+
+    def __init__(self, backing: Repository):
+        self.backing = backing
+        self.docs: dict[str, dict] = {}
+        self.version = 0
+        self.history_versions: dict[str, int] = {}
+        self.reads = 0  # documentos lidos do banco (produtos + histórico)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._watch = None
+        self._polled_at = 0.0
+
+    def start(self):
+        db = getattr(self.backing, 'db', None)
+        if db is not None:
+            self._watch = db.collection('products').on_snapshot(self._on_snapshot)
+            self._ready.wait(timeout=30)
+        else:
+            self.poll(force=True)
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+
+    def _on_snapshot(self, _docs, changes, _read_time):
+        with self._lock:
+            for change in changes:
+                pid = change.document.id
+                if change.type.name == 'REMOVED':
+                    self.docs.pop(pid, None)
+                else:
+                    self.docs[pid] = change.document.to_dict()
+                    self.reads += 1
+                self.history_versions[pid] = self.history_versions.get(pid, 0) + 1
+            if changes:
+                self.version += 1
+        self._ready.set()
+
+    def poll(self, force: bool = False):
+        if self._watch is not None or (not force and time.monotonic() - self._polled_at < MIRROR_POLL_S):
+            return
+        rows = self.backing.list_products(since=None, limit=None)
+        docs = {}
+        for r in rows:
+            docs[slugify_doc(r)] = r
+        with self._lock:
+            self._polled_at = time.monotonic()
+            self.reads += len(rows)
+            if docs != self.docs:
+                for pid, doc in docs.items():
+                    if self.docs.get(pid) != doc:
+                        self.history_versions[pid] = self.history_versions.get(pid, 0) + 1
+                self.docs = docs
+                self.version += 1
+
+    def _snapshot(self) -> list[dict]:
+        with self._lock:
+            return [dict(d) for d in self.docs.values()]
+
+    def list_products(self, since=None, limit=DEFAULT_LIMIT, listed_only=False, category=None):
+        docs = self._snapshot()
+        if listed_only:
+            docs = [d for d in docs if d.get('delisted_at') is None]
+        if category:
+            docs = [d for d in docs if (d.get('category') or UNCATEGORIZED) == category]
+        if since is not None:
+            return [d for d in docs if d.get('last_seen_at') and d['last_seen_at'] >= since]
+        return docs[:limit] if limit else docs
+
+    def recent_changes(self, since, limit=100):
+        docs = [d for d in self._snapshot() if d.get('price_changed_at') and d['price_changed_at'] >= since]
+        docs.sort(key=lambda d: d['price_changed_at'])
+        return docs[:limit]
+
+    def price_history(self, pid, since=None):
+        rows = self.backing.price_history(pid, since=since)
+        with self._lock:
+            self.reads += len(rows)
+        return rows
+
+    # Demais operações: direto no banco (o espelho só cobre a coleção 'products')
+    def upsert_products(self, products, now=None, strict=False, batch_size=400):
+        return self.backing.upsert_products(products, now=now, strict=strict, batch_size=batch_size)
+
+    def search_prefix(self, term, limit=10):
+        return self.backing.search_prefix(term, limit=limit)
+
+    def load_manifest(self, store):
+        return self.backing.load_manifest(store)
+
+    def record_menu_diff(self, store, manifest, diff, now):
+        return self.backing.record_menu_diff(store, manifest, diff, now)
+
+    def delete_product(self, pid):
+        return self.backing.delete_product(pid)
+
+    def menu_diffs(self, limit=10):
+        return self.backing.menu_diffs(limit=limit)
+
+    def write_history(self, points, batch_size=450):
+        return self.backing.write_history(points, batch_size=batch_size)
+
+    def prices_before(self, pids, at):
+        return self.backing.prices_before(pids, at)
+
+    def replace_history(self, histories, run_times):
+        return self.backing.replace_history(histories, run_times)
+
+    def save_checkpoint(self, store, at, entries):
+        return self.backing.save_checkpoint(store, at, entries)
+
+    def load_checkpoint(self, store, at):
+        return self.backing.load_checkpoint(store, at)
+
+    def latest_checkpoint_at(self, store):
+        return self.backing.latest_checkpoint_at(store)
+
+    def price_changes(self, since, until, pids=None):
+        return self.backing.price_changes(since, until, pids)
+
+    def list_categories(self):
+        return self.backing.list_categories()
+
+    def menu_events(self, store, since, until):
+        return self.backing.menu_events(store, since, until)
+
+    def history_generation(self):
+        return self.backing.history_generation()
+
+    def bump_history_generation(self):
+        return self.backing.bump_history_generation()
+
+def slugify_doc(doc: dict) -> str:
+    return slugify(doc.get('name', ''))
+
+# ---------------- Cache de respostas ----------------
+class CachedResponse:
+    __slots__ = ('body', 'gz', 'etag', 'etag_gz', 'version', 'created')
+
+    def __init__(self, payload, version):
+        self.body = json.dumps(payload, ensure_ascii=False, default=json_default,
+                               separators=(',', ':')).encode('utf-8')
+        self.gz = gzip.compress(self.body, compresslevel=6) if len(self.body) >= GZIP_MIN_BYTES else None
+        # ETag forte por representação: o corpo gzip tem bytes diferentes do original
+        digest = hashlib.sha1(self.body).hexdigest()[:20]
+        self.etag = f'"{digest}"'
+        self.etag_gz = f'"{digest}-gzip"'
+        self.version = version
+        self.created = time.monotonic()
+
+def json_default(x):
+    if isinstance(x, datetime):
+        if x.tzinfo is None:
+            x = x.replace(tzinfo=timezone.utc)
+        return x.isoformat()
+    if hasattr(x, 'item'):  # escalares NumPy
+        return x.item()
+    return str(x)
+
+def clean_record(row: dict) -> dict:
+    # NaN/NaT (valor != ele mesmo) viram null
+    return {k: (None if v is None or v != v else v) for k, v in row.items()}
+
+class PriceAPI:
+    def __init__(self, mirror: ProductMirror):
+        self.mirror = mirror
+        self.cache: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # Uma reconstrução por chave por vez (requisições simultâneas esperam a mesma)
+        self._building: dict[tuple, threading.Lock] = {}
+
+    # ----- Consultas -----
+    def products(self, hours: int | None, search: str | None):
+        since = datetime.now(timezone.utc) - timedelta(hours=hours) if hours else None
+        # Só quem está no cardápio, como no dashboard (load_products)
+        df = products_frame(self.mirror.list_products(since=since, limit=None, listed_only=True), search)
+        cols = ['name', 'category', 'current_price', 'last_price', 'delta', 'delta_pct',
+                'last_seen_at', 'price_changed_at', 'change_count', 'price_flag', 'pending_price', 'delisted_at']
+        if df.empty:
+            return {'count': 0, 'products': []}
+        df = df.reindex(columns=cols)
+        records = [clean_record(r) for r in df.to_dict(orient='records')]
+        for r in records:
+            r['slug'] = slugify_doc(r)
+        return {'count': len(records), 'products': records}
+
+    def history(self, slug: str, hours: int | None):
+        since = datetime.now(timezone.utc) - timedelta(hours=hours) if hours else None
+        rows = self.mirror.price_history(slug, since=since)
+        return {'slug': slug, 'count': len(rows), 'history': rows}
+
+    def movers(self, hours: int, top: int, by: str):
+        items = get_top_movers(self.mirror, hours=hours, top=top, by=by)
+        keep = ('name', 'current_price', 'last_price', 'delta', 'price_changed_at')
+        return {'hours': hours, 'by': by, 'movers': [{k: it.get(k) for k in keep} for it in items]}
+
+    # ----- Cache -----
+    def version_for(self, key: tuple) -> int:
+        if key[0] == 'history':
+            return self.mirror.history_versions.get(key[1], 0)
+        return self.mirror.version
+
+    def _cached(self, key: tuple) -> CachedResponse | None:
+        version = self.version_for(key)
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is None or entry.version != version or time.monotonic() - entry.created >= API_CACHE_TTL:
+                return None
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get(self, key: tuple, build) -> CachedResponse:
+        self.mirror.poll()
+        entry = self._cached(key)
+        if entry is not None:
+            return entry
+        with self._lock:
+            lock = self._building.setdefault(key, threading.Lock())
+        try:
+            with lock:
+                entry = self._cached(key)
+                if entry is not None:
+                    return entry
+                version = self.version_for(key)
+                entry = CachedResponse(build(), version)
+                with self._lock:
+                    self.misses += 1
+                    self.cache[key] = entry
+                    self.cache.move_to_end(key)
+                    while len(self.cache) > API_CACHE_MAX:
+                        self.cache.popitem(last=False)
+                        self.evictions += 1
+                return entry
+        finally:
+            with self._lock:
+                if self._building.get(key) is lock and not lock.locked():
+                    del self._building[key]
+
+    def stats(self) -> dict:
+        return {
+            'backend': BACKEND,
+            'products_in_memory': len(self.mirror.docs),
+            'db_reads': self.mirror.reads,
+            'cache_entries': len(self.cache),
+            'cache_evictions': self.evictions,
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+            'not_modified': self.not_modified,
+        }
+
+# ---------------- ASGI ----------------
+class BadRequest(Exception):
+    pass
+
+class NotFound(Exception):
+    pass
+
+def int_param(qs: dict, name: str, default, lo: int = 0, hi: int = MAX_HOURS):
+    raw = qs.get(name, [None])[0]
+    if raw in (None, ""):
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise BadRequest(f"'{name}' deve ser inteiro")
+    if not lo <= value <= hi:
+        raise BadRequest(f"'{name}' fora do intervalo [{lo}, {hi}]")
+    return value
+
+def hours_param(qs: dict, default=None, lo: int = 0):
+    # Uma chave de cache por janela efetiva: fora do intervalo vale o limite, 0 = sem filtro
+    raw = qs.get('hours', [None])[0]
+    if raw in (None, ""):
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise BadRequest("'hours' deve ser inteiro")
+    return min(max(value, lo), MAX_HOURS) or None
+
+def search_param(qs: dict) -> str | None:
+    # Mesmo filtro de products_frame (contém, sem maiúsculas): uma chave por termo efetivo
+    return " ".join((qs.get('search', [''])[0] or '').lower().split()) or None
+
+def route(api: PriceAPI, path: str, qs: dict):
+    """Retorna (chave do cache, função que monta o payload) ou None se a rota não existe."""
+    parts = [p for p in path.split('/') if p]
+    if parts == ['products']:
+        hours = hours_param(qs)
+        search = search_param(qs)
+        return ('products', hours, search), lambda: api.products(hours, search)
+    if len(parts) == 3 and parts[0] == 'products' and parts[2] == 'history':
+        slug = parts[1]
+        hours = hours_param(qs)
+        # Slug fora do espelho não chega ao banco (nem ocupa o cache)
+        api.mirror.poll()
+        if slug not in api.mirror.docs:
+            raise NotFound(f"produto '{slug}' não encontrado")
+        return ('history', slug, hours), lambda: api.history(slug, hours)
+    if parts == ['movers']:
+        hours = hours_param(qs, 24, lo=1)
+        top = int_param(qs, 'top', 5, lo=1, hi=MAX_TOP)
+        by = qs.get('by', ['abs'])[0]
+        if by not in ('abs', 'up', 'down'):
+            raise BadRequest("'by' deve ser abs, up ou down")
+        return ('movers', hours, top, by), lambda: api.movers(hours, top, by)
+    return None
+
+async def send_json(send, status: int, body: bytes, headers: list, head: bool = False):
+    headers = [(b'content-type', b'application/json; charset=utf-8'),
+               (b'content-length', str(len(body)).encode())] + headers
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+def create_app(repo: Repository | None = None):
+    state = {'api': None}
+
+    def get_api() -> PriceAPI:
+        if state['api'] is None:
+            mirror = ProductMirror(repo or get_repository(init_firestore))
+            mirror.start()
+            state['api'] = PriceAPI(mirror)
+        return state['api']
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                msg = await receive()
+                if msg['type'] == 'lifespan.startup':
+                    await asyncio.to_thread(get_api)
+                    await send({'type': 'lifespan.startup.complete'})
+                elif msg['type'] == 'lifespan.shutdown':
+                    if state['api'] is not None:
+                        state['api'].mirror.stop()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+
+        method = scope['method']
+        if method not in ('GET', 'HEAD'):
+            await send_json(send, 405, b'{"error":"somente GET"}', [(b'allow', b'GET, HEAD')])
+            return
+
+        api = await asyncio.to_thread(get_api)
+        path = scope['path']
+        qs = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        if path.rstrip('/') == '/_stats':
+            await send_json(send, 200, json.dumps(api.stats()).encode(), [(b'cache-control', b'no-store')])
+            return
+
+        try:
+            # route pode consultar o banco (poll do espelho SQL): fora do event loop
+            matched = await asyncio.to_thread(route, api, path, qs)
+        except BadRequest as e:
+            await send_json(send, 400, json.dumps({'error': str(e)}, ensure_ascii=False).encode(), [])
+            return
+        except NotFound as e:
+            await send_json(send, 404, json.dumps({'error': str(e)}, ensure_ascii=False).encode(), [])
+            return
+        if matched is None:
+            await send_json(send, 404, b'{"error":"rota inexistente"}', [])
+            return
+
+        key, build = matched
+        try:
+            entry = await asyncio.to_thread(api.get, key, build)
+        except Exception as e:
+            await send_json(send, 502, json.dumps({'error': f"falha no banco: {e}"}, ensure_ascii=False).encode(), [])
+            return
+
+        headers = dict((k.lower(), v) for k, v in scope.get('headers', []))
+        use_gz = entry.gz is not None and b'gzip' in headers.get(b'accept-encoding', b'')
+        etag = entry.etag_gz if use_gz else entry.etag
+        common = [(b'etag', etag.encode()), (b'cache-control', b'public, max-age=0, must-revalidate'),
+                  (b'vary', b'accept-encoding')]
+        # If-None-Match usa comparação fraca: ignora o prefixo W/
+        inm = headers.get(b'if-none-match', b'').decode('latin-1')
+        if inm and (inm.strip() == '*' or etag in [t.strip().removeprefix('W/') for t in inm.split(',')]):
+            api.not_modified += 1
+            await send({'type': 'http.response.start', 'status': 304, 'headers': common})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        if use_gz:
+            await send_json(send, 200, entry.gz, common + [(b'content-encoding', b'gzip')], head=method == 'HEAD')
+        else:
+            await send_json(send, 200, entry.body, common, head=method == 'HEAD')
+
+    return app
+
+app = create_app()
+
+# ---------------- Teste de carga ----------------
+def load_test(base_url: str, requests: int = 5000, concurrency: int = 50, revalidate: float = 0.5) -> dict:
+    """
+    Dispara 'requests' GETs (mistura das rotas) com 'concurrency' threads em keep-alive.
+    'revalidate' é a fração de requisições que reenviam o ETag recebido (If-None-Match).
+    """
+    import random
+    import http.client
+    from urllib.parse import urlsplit
+
+    u = urlsplit(base_url)
+    conn0 = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=30)
+    conn0.request('GET', '/products')
+    resp = conn0.getresponse()
+    slugs = [p['slug'] for p in json.loads(resp.read() or b'{}').get('products', [])][:50] or ['x']
+    conn0.request('GET', '/_stats')
+    reads_before = json.loads(conn0.getresponse().read())['db_reads']
+
+    paths = ['/products', '/products?hours=24', '/movers', '/movers?by=up&top=10']
+    lat, statuses = [], {}
+    lock = threading.Lock()
+    # Divide 'requests' entre as threads (o resto vai para as primeiras); nunca mais threads que requisições
+    concurrency = max(1, min(concurrency, requests))
+    share = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def worker(n: int):
+        conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=30)
+        etags = {}
+        local_lat, local_status = [], {}
+        for _ in range(n):
+            path = random.choice(paths + [f'/products/{random.choice(slugs)}/history'])
+            headers = {'Accept-Encoding': 'gzip'}
+            if path in etags and random.random() < revalidate:
+                headers['If-None-Match'] = etags[path]
+            t0 = time.perf_counter()
+            conn.request('GET', path, headers=headers)
+            r = conn.getresponse()
+            r.read()
+            local_lat.append((time.perf_counter() - t0) * 1000)
+            local_status[r.status] = local_status.get(r.status, 0) + 1
+            if r.getheader('ETag'):
+                etags[path] = r.getheader('ETag')
+        conn.close()
+        with lock:
+            lat.extend(local_lat)
+            for k, v in local_status.items():
+                statuses[k] = statuses.get(k, 0) + v
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in share]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    conn0.request('GET', '/_stats')
+    stats = json.loads(conn0.getresponse().read())
+    conn0.close()
+    lat.sort()
+    return {
+        'requests': len(lat),
+        'seconds': round(elapsed, 2),
+        'req_per_s': round(len(lat) / elapsed, 1),
+        'p50_ms': round(lat[len(lat) // 2], 2) if lat else None,
+        'p95_ms': round(lat[int(len(lat) * 0.95)], 2) if lat else None,
+        'status': statuses,
+        'db_reads_during_test': stats['db_reads'] - reads_before,
+        'server': stats,
+    }
+
+# -------- Main --------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP de preços (somente leitura)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_serve = sub.add_parser("servir", help="sobe a API com uvicorn")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--porta", type=int, default=8000)
+    p_load = sub.add_parser("carga", help="teste de carga contra uma API rodando")
+    p_load.add_argument("--url", default="http://127.0.0.1:8000")
+    p_load.add_argument("--requisicoes", type=int, default=5000)
+    p_load.add_argument("--concorrencia", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "servir":
+        import uvicorn
+        uvicorn.run("api:app", host=args.host, port=args.porta)
+    else:
+        r = load_test(args.url, args.requisicoes, args.concorrencia)
+        print(f"{r['requests']} requisições em {r['seconds']}s -> {r['req_per_s']} req/s "
+              f"| p50 {r['p50_ms']} ms | p95 {r['p95_ms']} ms")
+        print(f"Status: {r['status']}")
+        print(f"Leituras no banco durante o teste: {r['db_reads_during_test']}")
+        print(f"Servidor: {r['server']}")
+
+
+if __name__ == "__main__":
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+    except Exception:
+        pass
+    main()
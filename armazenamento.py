@@ -0,0 +1,1370 @@
+# armazenamento.py
+# Camada de armazenamento plugável
+# - FirestoreRepository: o comportamento atual (coleção 'products' + subcoleção 'prices')
+# - SQLRepository: banco embutido (SQLite)
+# Escolha com STORAGE_BACKEND=firestore|sql. As duas implementações expõem as
+# mesmas operações e devolvem dicts no mesmo formato dos documentos do Firestore.
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+import unicodedata
+import re as regex
+from datetime import datetime, timedelta, timezone
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+from google.api_core.retry import Retry
+try:
+    from google.api_core.exceptions import DeadlineExceeded, GoogleAPIError
+except Exception:
+    class DeadlineExceeded(Exception): ...
+    class GoogleAPIError(Exception): ...
+from google.cloud.firestore_v1 import Increment
+
+from anomalias import (AMBIGUOUS_READ, EXTRACTION_ERROR, HOLD_ANOMALIES, MIN_PRICE_CONFIDENCE, new_stats,
+                       score_price, update_stats)
+
+# ---------------- Configurações ----------------
+BACKEND = os.getenv("STORAGE_BACKEND", "firestore")
+SQL_PATH = os.getenv("SQL_PATH", "precos.sqlite3")
+DEFAULT_LIMIT = 300
+# Não marca fora do cardápio se a coleta tiver menos que essa fração do manifesto anterior
+# (página quebrada / seletor mudou: seria tudo "removido")
+DELIST_MIN_FRACTION = float(os.getenv("DELIST_MIN_FRACTION", "0.5"))
+# Checkpoint do cardápio inteiro (consultas "como estava em"): no máximo um a cada N horas
+CHECKPOINT_EVERY_HOURS = float(os.getenv("CHECKPOINT_EVERY_HOURS", "24"))
+CHECKPOINT_CHUNK = 2000  # entradas por documento (bem abaixo de 1 MiB)
+LIST_CHUNK = 4000  # itens por documento nos manifestos e diffs do Firestore (limite de 1 MiB)
+# Agregados por categoria (coleção 'categories'): últimas mudanças guardadas em cada uma
+CATEGORY_RECENT = int(os.getenv("CATEGORY_RECENT", "10"))
+UNCATEGORIZED = "Sem categoria"
+
+# Campos com coluna própria na tabela 'products'; o resto vai para 'extra' (JSON)
+PRODUCT_COLUMNS = ('pid', 'name', 'description', 'current_price', 'last_price', 'created_at',
+                   'last_seen_at', 'price_changed_at', 'change_count', 'delisted_at')
+TIMESTAMP_FIELDS = ('created_at', 'last_seen_at', 'price_changed_at', 'delisted_at')
+
+# ---------------- Firestore ----------------
+def init_firestore():
+    # Emulador local (FIRESTORE_EMULATOR_HOST): dispensa a chave de serviço
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        from google.cloud import firestore as gc_firestore
+        return gc_firestore.Client(project=os.getenv("GCLOUD_PROJECT", "demo-cardapio"))
+    cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "serviceAccountKey.json")
+    if not os.path.isfile(cred_path):
+        raise FileNotFoundError(f"Credencial não encontrada: {cred_path}")
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(cred_path)
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+def slugify(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return regex.sub(r'[^a-zA-Z0-9]+', '-', text).strip('-').lower()
+
+def store_key(url: str) -> str:
+    return url.rstrip('/').rsplit('/', 1)[-1]
+
+def category_id(name: str | None) -> str:
+    return slugify(name or UNCATEGORIZED) or slugify(UNCATEGORIZED)
+
+def history_doc_id(at: datetime) -> str:
+    """ID determinístico do ponto de histórico: reaplicar a mesma execução não duplica."""
+    return at.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+
+# ---------------- Regras do upsert (comuns aos backends) ----------------
+def fix_from_history(last: list[dict], until: datetime) -> dict | None:
+    """
+    Campos de preço do produto a partir dos dois últimos pontos do histórico (mais
+    recente primeiro), se o mais recente não passa de 'until'; senão None (há mudança
+    posterior ao trecho regravado e o documento já reflete ela).
+    """
+    if not last or last[0]['at'] > until:
+        return None
+    fix = {'current_price': float(last[0]['price']),
+           'last_price': float(last[1]['price'] if len(last) > 1 else last[0]['price'])}
+    if len(last) > 1:
+        fix['price_changed_at'] = last[0]['at']
+    return fix
+
+def plan_upsert(products: list[dict], existing: dict[str, dict], now: datetime) -> tuple[list[dict], list[dict]]:
+    """
+    Decide o que gravar para cada produto coletado, dado o estado atual ('existing', por pid).
+    Retorna (results, ops). Cada op: {'pid', 'create', 'changed', 'data', 'history',
+    'category', 'prev_category', 'member', 'change'}, onde 'history' é {'price', 'at'}
+    ou None e 'member'/'change' alimentam os agregados (plan_categories). O incremento
+    de change_count fica a cargo do backend (op['changed']).
+    Cada preço novo é pontuado pelas estatísticas online do produto (anomalias.py);
+    com HOLD_ANOMALIES=1 o preço sinalizado fica em 'pending_price' até se confirmar.
+    Preço lido com 'price_confidence' < MIN_PRICE_CONFIDENCE é sempre retido assim.
+    """
+    # Um produto por pid (nomes que diferem só em acento/caixa): vale a última leitura
+    by_id = {}
+    for p in products:
+        by_id[slugify(p['name'])] = p
+
+    results, ops = [], []
+    for pid, p in by_id.items():
+        current_price = float(p.get('price', 0.0))
+        description = p.get('description', '')
+        name = p.get('name', '').strip()
+        category = (p.get('category') or '').strip()  # vazio: título não encontrado na coleta
+        ambiguous = float(p.get('price_confidence', 1.0)) < MIN_PRICE_CONFIDENCE
+        display = {
+            'display_prev_price': float(p.get('extracted_prev_price', 0.0)),
+            'display_base_price': float(p.get('extracted_base_price', 0.0)),
+            'display_current_green': float(p.get('extracted_current_price', 0.0)),
+        }
+
+        if pid in existing:
+            prev = existing[pid]
+            prev_price = float(prev.get('current_price', 0.0))
+            changed = (current_price != prev_price)
+            data = {'name': name, 'description': description, 'last_seen_at': now, **display}
+            if category or not prev.get('category'):
+                data['category'] = category or UNCATEGORIZED
+            if prev.get('delisted_at') is not None or 'delisted_at' not in prev:
+                data['delisted_at'] = None  # voltou ao cardápio (ou doc antigo sem o campo)
+
+            # Pontuação O(1) contra a estatística online guardada no próprio doc
+            stats = prev.get('price_stats') or new_stats(prev_price)
+            flag, z, held = None, None, False
+            if changed:
+                flag, z = score_price(stats, current_price)
+                if ambiguous:
+                    flag = AMBIGUOUS_READ
+                # Segura o preço suspeito até ele se repetir na próxima coleta
+                held = (bool(flag) and (HOLD_ANOMALIES or flag == AMBIGUOUS_READ)
+                        and prev.get('pending_price') != current_price)
+                data.update({'price_flag': flag, 'price_score': z})
+            elif prev.get('pending_price') is not None and prev.get('price_flag'):
+                # O preço retido não se repetiu: o alerta não vale mais
+                data.update({'price_flag': None, 'price_score': None})
+            if held:
+                changed = False
+                data['pending_price'] = current_price
+            elif prev.get('pending_price') is not None:
+                data['pending_price'] = None
+            # Estatística só avança com preço novo aplicado e em ordem (stats['at']): replay
+            # do WAL e coletas sem mudança não contam a mesma observação de novo
+            stats_at, now_key = stats.get('at'), ts_to_sql(now)
+            if changed and (stats_at is None or now_key > stats_at) \
+                    and (flag not in (EXTRACTION_ERROR, AMBIGUOUS_READ) or prev.get('pending_price') == current_price):
+                stats = dict(update_stats(stats, current_price), at=now_key)
+            data['price_stats'] = stats
+
+            if changed:
+                data.update({
+                    'last_price': prev_price,
+                    'current_price': current_price,
+                    'price_changed_at': now,
+                })
+            price = current_price if changed else prev_price
+            ops.append({'pid': pid, 'create': False, 'changed': changed, 'data': data,
+                        'history': {'price': current_price, 'at': now} if changed else None,
+                        'category': category or prev.get('category') or UNCATEGORIZED,
+                        'prev_category': prev.get('category') or UNCATEGORIZED,
+                        'member': [price, display['display_prev_price'] > price],
+                        'change': {'pid': pid, 'name': name, 'prev_price': prev_price,
+                                   'price': current_price, 'at': now} if changed else None})
+            results.append({
+                'name': name,
+                'prev_price': prev_price,
+                'current_price': prev_price if held else current_price,
+                'changed': changed,
+                'delta': round(current_price - prev_price, 2) if changed else 0.0,
+                'flag': flag,
+                'z': z,
+                'held': held,
+                'pending_price': current_price if held else None,
+            })
+        else:
+            data = {
+                'name': name,
+                'description': description,
+                'current_price': current_price,
+                'last_price': current_price,
+                'created_at': now,
+                'last_seen_at': now,
+                'change_count': 0,
+                'price_stats': new_stats(current_price),
+                # Sempre presentes: list_products filtra os dois na consulta
+                'category': category or UNCATEGORIZED,
+                'delisted_at': None,
+                **display,
+            }
+            if ambiguous:
+                data['price_flag'] = AMBIGUOUS_READ  # sem preço anterior para reter: só sinaliza
+            ops.append({'pid': pid, 'create': True, 'changed': False, 'data': data,
+                        'history': {'price': current_price, 'at': now},
+                        'category': category or UNCATEGORIZED, 'prev_category': None,
+                        'member': [current_price, display['display_prev_price'] > current_price],
+                        'change': None})
+            results.append({
+                'name': name,
+                'prev_price': None,
+                'current_price': current_price,
+                'changed': False,
+                'delta': 0.0,
+                'flag': AMBIGUOUS_READ if ambiguous else None,
+                'z': None,
+                'held': False,
+                'pending_price': None,
+            })
+    return results, ops
+
+# ---------------- Agregados por categoria ----------------
+def plan_categories(ops: list[dict], docs: dict[str, dict], now: datetime) -> dict[str, dict]:
+    """
+    Aplica as ops do upsert (ou saídas do cardápio, op['remove']) nos agregados das
+    categorias tocadas. docs: estado atual por category_id (ausente = categoria nova).
+    Remoção com category None (produto purgado, categoria perdida): sai de todas as
+    categorias de docs em que aparecer.
+    Cada agregado guarda os membros {pid: [preço, em_promoção]}: contagem e
+    mínimo/média/máximo continuam exatos com lotes parciais (modo watch).
+    Retorna {category_id: doc completo} só das categorias alteradas.
+    """
+    out: dict[str, dict] = {}
+
+    def agg(name: str) -> dict:
+        cid = category_id(name)
+        if cid not in out:
+            cur = docs.get(cid) or {}
+            out[cid] = {'name': cur.get('name') or name, 'members': dict(cur.get('members') or {}),
+                        'recent_changes': list(cur.get('recent_changes') or [])}
+        return out[cid]
+
+    for op in ops:
+        if op.get('remove') and op['category'] is None:
+            for cid, cur in docs.items():
+                if op['pid'] in (out.get(cid) or cur).get('members', {}):
+                    agg(cur.get('name') or cid)['members'].pop(op['pid'], None)
+            continue
+        prev = op.get('prev_category')
+        if prev and category_id(prev) != category_id(op['category']):
+            agg(prev)['members'].pop(op['pid'], None)  # mudou de categoria
+        doc = agg(op['category'])
+        if op.get('remove'):
+            doc['members'].pop(op['pid'], None)
+            continue
+        doc['name'] = op['category']
+        doc['members'][op['pid']] = list(op['member'])
+        if op.get('change'):
+            doc['recent_changes'].append(op['change'])
+
+    for doc in out.values():
+        prices = [m[0] for m in doc['members'].values()]
+        doc.update({
+            'count': len(prices),
+            'min_price': min(prices) if prices else None,
+            'avg_price': round(sum(prices) / len(prices), 2) if prices else None,
+            'max_price': max(prices) if prices else None,
+            'promo_count': sum(1 for m in doc['members'].values() if m[1]),
+            'recent_changes': sorted(doc['recent_changes'], key=lambda c: c['at'])[-CATEGORY_RECENT:],
+            'updated_at': now,
+        })
+    return out
+
+# ---------------- Manifesto do cardápio ----------------
+DIFF_LISTS = ('added', 'removed', 'changed', 'added_entries')
+# Membros dos agregados no Firestore: listas paralelas em pedaços (não um mapa {pid: ...},
+# que conta um campo indexado por produto e esbarra em 1 MiB por documento)
+CATEGORY_LISTS = ('member_pids', 'member_prices', 'member_promo')
+
+def split_lists(lists: dict[str, list], size: int) -> list[dict[str, list]]:
+    """Divide as listas em pedaços de até 'size' itens no total, na ordem (join_lists desfaz)."""
+    chunks, cur, n = [], {}, 0
+    for key, items in lists.items():
+        i = 0
+        while i < len(items):
+            take = min(size - n, len(items) - i)
+            cur.setdefault(key, []).extend(items[i:i + take])
+            n += take
+            i += take
+            if n == size:
+                chunks.append(cur)
+                cur, n = {}, 0
+    if cur or not chunks:
+        chunks.append(cur)
+    return chunks
+
+def join_lists(docs: list[dict], keys: tuple[str, ...]) -> dict[str, list]:
+    return {k: [x for d in docs for x in d.get(k) or []] for k in keys}
+
+def content_hash(p: dict) -> str:
+    """Hash curto do conteúdo visível do produto (nome, preço, descrição)."""
+    raw = f"{p.get('name', '').strip()}\x1f{float(p.get('price', 0.0)):.2f}\x1f{p.get('description', '')}"
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=8).hexdigest()
+
+def build_manifest(products: list[dict]) -> list[tuple[str, str]]:
+    """[(pid, hash)] ordenado por pid; nomes repetidos ficam com o último (como no upsert)."""
+    return sorted({slugify(p['name']): content_hash(p) for p in products}.items())
+
+def diff_manifests(prev: list[tuple[str, str]], cur: list[tuple[str, str]]) -> dict:
+    """
+    Merge linear de dois manifestos ordenados: O(n + m), sem montar conjuntos.
+    Retorna {'added', 'removed', 'changed': [pid], 'unchanged': int}.
+    """
+    added, removed, changed = [], [], []
+    unchanged = 0
+    i = j = 0
+    while i < len(prev) and j < len(cur):
+        (pa, ha), (pb, hb) = prev[i], cur[j]
+        if pa == pb:
+            if ha == hb:
+                unchanged += 1
+            else:
+                changed.append(pb)
+            i += 1
+            j += 1
+        elif pa < pb:
+            removed.append(pa)
+            i += 1
+        else:
+            added.append(pb)
+            j += 1
+    removed.extend(p for p, _ in prev[i:])
+    added.extend(p for p, _ in cur[j:])
+    return {'added': added, 'removed': removed, 'changed': changed, 'unchanged': unchanged}
+
+def update_manifest(repo: 'Repository', store: str, products: list[dict], run_id: str,
+                    now: datetime | None = None, complete: bool = True) -> dict:
+    """
+    Compara a coleta com o manifesto anterior da loja, grava o novo manifesto e o diff
+    da execução e marca 'delisted_at' nos removidos (um lote só).
+    complete=False (coleta limitada por MAX_ITEMS): só calcula, não grava nem marca.
+    Retorna o diff com 'delisted' (quantos foram marcados) e 'skipped' (motivo, se não gravou).
+    """
+    now = now or datetime.now(timezone.utc)
+    cur = build_manifest(products)
+    prev = repo.load_manifest(store) or []
+    diff = diff_manifests(prev, cur)
+    diff.update({'run_id': run_id, 'store': store, 'at': now, 'total': len(cur), 'delisted': 0, 'skipped': None})
+    # Nome e preço de quem entrou: o replay "as of" recoloca o produto sem ler mais nada
+    if diff['added']:
+        by_pid = {slugify(p['name']): p for p in products}
+        diff['added_entries'] = [[pid, by_pid[pid]['name'].strip(), float(by_pid[pid].get('price', 0.0))]
+                                 for pid in diff['added']]
+    if not complete:
+        diff['skipped'] = "coleta parcial"
+    elif prev and len(cur) < DELIST_MIN_FRACTION * len(prev):
+        diff['skipped'] = f"coleta com {len(cur)} de {len(prev)} produtos"
+    if diff['skipped']:
+        return diff
+    diff['delisted'] = repo.record_menu_diff(store, cur, diff, now)
+    return diff
+
+# ---------------- Cardápio em um instante ("as of") ----------------
+def maybe_checkpoint(repo: 'Repository', store: str, results: list[dict], at: datetime,
+                     every_hours: float = CHECKPOINT_EVERY_HOURS) -> bool:
+    """
+    Grava o checkpoint do cardápio a partir dos resultados de uma coleta completa
+    (sem leituras extras), se o último tiver mais de 'every_hours'. Retorna se gravou.
+    """
+    last = repo.latest_checkpoint_at(store)
+    if last is not None and at - last < timedelta(hours=every_hours):
+        return False
+    entries = sorted({slugify(r['name']): (slugify(r['name']), r['name'], float(r['current_price']))
+                      for r in results}.values())
+    repo.save_checkpoint(store, at, entries)
+    return True
+
+def replay_menu(entries: list[tuple[str, str, float]], changes: list[dict], diffs: list[dict],
+                times: list[datetime]) -> dict[datetime, dict[str, dict]]:
+    """
+    Reaplica sobre o checkpoint os pontos de preço ({'pid', 'at', 'price'}) e os diffs do
+    manifesto (entradas/saídas do cardápio) em ordem de tempo, fotografando o estado em
+    cada instante de 'times' (crescente). Retorna {t: {pid: {'name', 'price'}}}.
+    No mesmo horário, preços vêm antes do diff (a coleta grava os dois com o mesmo 'at').
+    """
+    state = {pid: {'name': name, 'price': price} for pid, name, price in entries}
+    hidden: dict[str, dict] = {}  # fora do cardápio (guardados para quando voltarem)
+    events = sorted([(p['at'], 0, p) for p in changes] + [(d['at'], 1, d) for d in diffs],
+                    key=lambda e: (e[0], e[1]))
+    out, k = {}, 0
+    for t in times:
+        while k < len(events) and events[k][0] <= t:
+            _, kind, ev = events[k]
+            if kind == 0:
+                prev = state.pop(ev['pid'], None) or hidden.pop(ev['pid'], None) or {'name': None}
+                state[ev['pid']] = {'name': prev['name'], 'price': float(ev['price'])}
+            else:
+                for pid in ev.get('removed') or []:
+                    if pid in state:
+                        hidden[pid] = state.pop(pid)
+                for pid in ev.get('added') or []:
+                    if pid in hidden:
+                        state[pid] = hidden.pop(pid)
+                for e in ev.get('added_entries') or []:
+                    pid, name, price = (e['pid'], e['name'], e['price']) if isinstance(e, dict) else e
+                    cur = state.setdefault(pid, {'name': name, 'price': float(price)})
+                    if cur['name'] is None:
+                        cur['name'] = name  # ponto de preço do mesmo horário chegou antes do diff
+            k += 1
+        out[t] = {pid: dict(v) for pid, v in state.items()}
+    return out
+
+def menu_pids(entries: list[tuple[str, str, float]], diffs: list[dict]) -> set[str]:
+    """Produtos que passaram pelo cardápio da loja: checkpoint + entradas/saídas dos diffs."""
+    pids = {e[0] for e in entries}
+    for d in diffs:
+        pids.update(d.get('added') or [])
+        pids.update(d.get('removed') or [])
+        pids.update(e['pid'] if isinstance(e, dict) else e[0] for e in d.get('added_entries') or [])
+    return pids
+
+def menu_as_of(repo: 'Repository', store: str, times: list[datetime]) -> dict[datetime, dict]:
+    """
+    Reconstrói o cardápio em cada instante: checkpoint mais próximo (<= t) + replay do
+    log de mudanças desde ele (só produtos da loja). Instantes que caem depois do mesmo
+    checkpoint dividem a leitura dele e uma consulta de mudanças só.
+    Instante anterior ao primeiro checkpoint: ValueError (o replay teria de ler tudo
+    desde o início; veja bootstrap_checkpoint).
+    Retorna {t: {'menu': {pid: {'name', 'price'}}, 'checkpoint_at', 'replayed'}}.
+    """
+    out = {}
+    pending = sorted(times, reverse=True)
+    while pending:
+        ck = repo.load_checkpoint(store, pending[0])
+        if ck is None:
+            raise ValueError(f"Sem checkpoint do cardápio de '{store}' até {pending[0]:%d/%m/%Y %H:%M} UTC. "
+                             "Escolha uma data mais recente ou rode 'python manutencao.py checkpoint-inicial'.")
+        ck_at, entries = ck
+        group = sorted(t for t in pending if t >= ck_at)
+        pending = [t for t in pending if t < ck_at]
+        diffs = repo.menu_events(store, ck_at, group[-1])
+        changes = repo.price_changes(ck_at, group[-1], pids=menu_pids(entries, diffs))
+        snaps = replay_menu(entries, changes, diffs, group)
+        for t in group:
+            replayed = sum(1 for c in changes if c['at'] <= t) + sum(1 for d in diffs if d['at'] <= t)
+            out[t] = {'menu': snaps[t], 'checkpoint_at': ck_at, 'replayed': replayed}
+    return out
+
+def bootstrap_checkpoint(repo: 'Repository', store: str) -> datetime | None:
+    """
+    Primeiro checkpoint da loja, no horário do diff mais antigo (a primeira coleta completa
+    entra inteira em 'added_entries'): libera o "as of" desde o começo do registro.
+    Lê todos os diffs da loja uma vez; não grava se já houver checkpoint nesse horário.
+    Retorna o 'at' gravado (None se não gravou).
+    """
+    diffs = repo.menu_events(store, datetime(1970, 1, 1, tzinfo=timezone.utc), datetime.now(timezone.utc))
+    if not diffs or repo.load_checkpoint(store, diffs[0]['at']) is not None:
+        return None
+    at = diffs[0]['at']
+    menu = replay_menu([], [], diffs[:1], [at])[at]
+    repo.save_checkpoint(store, at, sorted((pid, v['name'], v['price']) for pid, v in menu.items()))
+    return at
+
+# ---------------- Interface ----------------
+class Repository(ABC):
+    """Operações usadas pelo scraper, dashboard e análises."""
+
+    @abstractmethod
+    def upsert_products(self, products: list[dict], now: datetime | None = None,
+                        strict: bool = False, batch_size: int = 400) -> list[dict]:
+        """Grava a coleta (regras em plan_upsert) e retorna um resultado por produto."""
+
+    @abstractmethod
+    def list_products(self, since: datetime | None = None, limit: int | None = DEFAULT_LIMIT,
+                      listed_only: bool = False, category: str | None = None) -> list[dict]:
+        """
+        Produtos vistos desde 'since' (sem limite); sem 'since', os primeiros 'limit'.
+        listed_only (só quem está no cardápio) e category (nome) filtram na consulta,
+        antes do 'limit'.
+        """
+
+    @abstractmethod
+    def price_history(self, pid: str, since: datetime | None = None) -> list[dict]:
+        """Pontos {'at', 'price'} do produto, ordenados por 'at'."""
+
+    @abstractmethod
+    def recent_changes(self, since: datetime, limit: int = 100) -> list[dict]:
+        """Produtos com price_changed_at >= since, em ordem crescente de mudança."""
+
+    @abstractmethod
+    def search_prefix(self, term: str, limit: int = 10) -> list[dict]:
+        """Produtos cujo 'name' começa com 'term' (case-sensitive)."""
+
+    @abstractmethod
+    def load_manifest(self, store: str) -> list[tuple[str, str]] | None:
+        """Último manifesto [(pid, hash)] gravado para a loja."""
+
+    @abstractmethod
+    def record_menu_diff(self, store: str, manifest: list[tuple[str, str]], diff: dict, now: datetime) -> int:
+        """Grava manifesto e diff da execução; marca delisted_at nos removidos. Retorna quantos marcou."""
+
+    @abstractmethod
+    def delete_product(self, pid: str) -> int:
+        """
+        Apaga o produto e todo o histórico; na mesma transação, tira o pid dos membros
+        da categoria. Retorna quantos documentos/linhas apagou (0 se não existia).
+        """
+
+    @abstractmethod
+    def menu_diffs(self, limit: int = 10) -> list[dict]:
+        """Diffs das últimas execuções, do mais recente para o mais antigo."""
+
+    @abstractmethod
+    def write_history(self, points: list[dict], batch_size: int = 450) -> int:
+        """Grava pontos {'pid', 'at', 'price'} com ID determinístico (sobrescreve o mesmo horário)."""
+
+    @abstractmethod
+    def prices_before(self, pids: list[str], at: datetime) -> dict[str, float]:
+        """Último preço de cada produto com ponto anterior a 'at' (sem ponto: fora do dict)."""
+
+    @abstractmethod
+    def replace_history(self, histories: dict[str, list[dict]], run_times: list[datetime]) -> dict:
+        """
+        Backfill: regrava os pontos de cada produto nos horários das coletas re-extraídas
+        ('run_times'): os de histories[pid] ({'at', 'price'}) entram, os outros desses
+        horários saem. Pontos de outros horários (modo watch, coletas sem captura) ficam.
+        Se o último ponto do produto não passa da última coleta, corrige
+        current_price/last_price/price_changed_at a partir dele.
+        Produtos sem documento são ignorados. Retorna {'written', 'deleted', 'fixed'}.
+        """
+
+    @abstractmethod
+    def save_checkpoint(self, store: str, at: datetime, entries: list[tuple[str, str, float]]) -> None:
+        """Foto compacta do cardápio [(pid, name, price)] no instante 'at'."""
+
+    @abstractmethod
+    def load_checkpoint(self, store: str, at: datetime) -> tuple[datetime, list[tuple[str, str, float]]] | None:
+        """Checkpoint mais recente com horário <= at."""
+
+    @abstractmethod
+    def latest_checkpoint_at(self, store: str) -> datetime | None:
+        """Horário do checkpoint mais recente da loja (None se não houver)."""
+
+    @abstractmethod
+    def price_changes(self, since: datetime, until: datetime, pids: set[str] | None = None) -> list[dict]:
+        """Pontos {'pid', 'at', 'price'} com since < at <= until, por 'at'; pids: só desses produtos."""
+
+    @abstractmethod
+    def list_categories(self) -> list[dict]:
+        """Agregados por categoria ({'id', 'name', 'count', 'min_price', 'avg_price', 'max_price',
+        'promo_count', 'recent_changes', 'updated_at'}), sem a lista de membros."""
+
+    @abstractmethod
+    def history_generation(self) -> int:
+        """Contador que sobe a cada reescrita de pontos antigos do histórico (0 se nunca)."""
+
+    @abstractmethod
+    def bump_history_generation(self) -> None:
+        """Avisa os caches de histórico (cacheHistorico) que pontos antigos mudaram."""
+
+    @abstractmethod
+    def menu_events(self, store: str, since: datetime, until: datetime) -> list[dict]:
+        """Diffs do manifesto da loja com since < at <= until, em ordem crescente."""
+
+# ---------------- Backend Firestore ----------------
+class FirestoreRepository(Repository):
+    def __init__(self, db):
+        self.db = db
+
+    def upsert_products(self, products, now=None, strict=False, batch_size=400):
+        if not products:
+            return []
+        now = now or datetime.now(timezone.utc)
+        col = self.db.collection('products')
+
+        # 1) Lê todos de uma vez
+        refs = {}
+        for p in products:
+            pid = slugify(p['name'])
+            refs[pid] = col.document(pid)
+        existing = {}
+        try:
+            snapshots = self.db.get_all(list(refs.values()), field_paths=('current_price', 'name', 'last_price',
+                                                                           'price_stats', 'pending_price',
+                                                                           'delisted_at', 'category'),
+                                        timeout=20, retry=Retry())
+            for snap in snapshots:
+                if snap.exists:
+                    existing[snap.id] = snap.to_dict()
+        except DeadlineExceeded:
+            if strict:
+                raise
+            print("AVISO: Timeout ao ler documentos existentes. Tratando como novos.")
+            existing = {}
+        except GoogleAPIError as e:
+            if strict:
+                raise
+            print(f"AVISO: Falha ao ler documentos existentes: {e}. Prosseguindo.")
+            existing = {}
+
+        # 2) Monta operações
+        results, ops = plan_upsert(products, existing, now)
+        writes = []
+        for op in ops:
+            ref = refs[op['pid']]
+            data = dict(op['data'])
+            if op['changed']:
+                data['change_count'] = Increment(1)
+            if op['history']:
+                subdoc = ref.collection('prices').document(history_doc_id(op['history']['at']))
+                writes.append((subdoc, op['history'], False))
+            writes.append((ref, data, not op['create']))
+
+        # 3) Commit em lotes (limite do Firestore: 500 operações por batch)
+        batch_size = max(1, min(batch_size, 450))
+        for i in range(0, len(writes), batch_size):
+            batch = self.db.batch()
+            for ref, data, merge in writes[i:i + batch_size]:
+                batch.set(ref, data, merge=merge)
+            batch.commit()
+        self._update_categories(ops, now, strict)
+        return results
+
+    def _update_categories(self, ops, now, strict=False):
+        """
+        Read-modify-write dos agregados tocados pelas ops (poucas categorias) numa
+        transação: coletas simultâneas (watch e agendada) não apagam os membros uma da outra.
+        """
+        if not ops:
+            return
+
+        @firestore.transactional
+        def apply(tx):
+            self._apply_categories(tx, ops, now)
+
+        try:
+            apply(self.db.transaction())
+        except (DeadlineExceeded, GoogleAPIError, ValueError) as e:
+            if strict:
+                raise
+            # Nada gravado (transação desfeita): a próxima coleta refaz os agregados tocados
+            print(f"AVISO: Agregados de categoria não atualizados ({e}).")
+
+    def _apply_categories(self, tx, ops, now):
+        """Lê na transação os agregados tocados pelas ops e grava o resultado nela."""
+        col = self.db.collection('categories')
+        if any(op['category'] is None for op in ops):
+            # Purgado de categoria desconhecida: lê todas (são poucas)
+            cids = sorted(ref.id for ref in col.list_documents())
+        else:
+            cids = sorted({category_id(n) for op in ops for n in (op['category'], op.get('prev_category')) if n})
+        docs = {}
+        for snap in tx.get_all([col.document(cid) for cid in cids]):
+            if snap.exists:
+                doc = self._read_chunked(snap, CATEGORY_LISTS, tx)
+                lists = [doc.pop(k) for k in CATEGORY_LISTS]
+                # Doc gravado antes das listas: ainda com o mapa 'members'
+                doc['members'] = doc.get('members') or {pid: [price, promo] for pid, price, promo in zip(*lists)}
+                docs[snap.id] = doc
+        writes = []
+        for cid, doc in plan_categories(ops, docs, now).items():
+            members = doc.pop('members')
+            self._write_chunked(writes, col.document(cid), doc, {
+                'member_pids': list(members), 'member_prices': [m[0] for m in members.values()],
+                'member_promo': [m[1] for m in members.values()],
+            })
+        for ref, data, merge in writes:
+            tx.set(ref, data, merge=merge)
+
+    def list_products(self, since=None, limit=DEFAULT_LIMIT, listed_only=False, category=None):
+        # Filtros com 'since' usam os índices compostos de firestore.indexes.json
+        q = self.db.collection('products')
+        if listed_only:
+            q = q.where('delisted_at', '==', None)
+        if category:
+            q = q.where('category', '==', category)
+        if since is not None:
+            q = q.where('last_seen_at', '>=', since)
+        elif limit:
+            q = q.limit(limit)
+        return [d.to_dict() for d in q.stream()]
+
+    def price_history(self, pid, since=None):
+        q = self.db.collection('products').document(pid).collection('prices').order_by('at')
+        if since is not None:
+            q = q.where('at', '>=', since)
+        rows = []
+        for s in q.stream():
+            d = s.to_dict()
+            rows.append({'at': d.get('at'), 'price': float(d.get('price', 0.0))})
+        return rows
+
+    def recent_changes(self, since, limit=100):
+        q = (self.db.collection('products')
+              .where('price_changed_at', '>=', since)
+              .order_by('price_changed_at')
+              .limit(limit))
+        return [doc.to_dict() for doc in q.stream()]
+
+    def search_prefix(self, term, limit=10):
+        q = (self.db.collection('products')
+              .order_by('name')
+              .start_at([term])
+              .end_at([term + '\uf8ff'])
+              .limit(limit))
+        return [doc.to_dict() for doc in q.stream()]
+
+    def _write_chunked(self, writes: list, ref, head: dict, lists: dict[str, list]):
+        # Listas grandes: primeiro pedaço no próprio doc e o resto em 'chunks' (como os
+        # checkpoints). O doc principal vai por último e sem merge: só aponta para
+        # pedaços já gravados e não herda listas da versão anterior.
+        chunks = split_lists(lists, LIST_CHUNK)
+        for i, chunk in enumerate(chunks[1:], start=1):
+            writes.append((ref.collection('chunks').document(f"{i:04d}"), chunk, False))
+        writes.append((ref, {**head, **chunks[0], 'n_chunks': len(chunks)}, False))
+
+    def _read_chunked(self, snap, keys: tuple[str, ...], tx=None) -> dict:
+        doc = snap.to_dict()
+        n = doc.pop('n_chunks', 1)
+        docs = [doc]
+        if n > 1:
+            # Pedaços além de n_chunks são sobras de uma versão maior: ignorados
+            q = snap.reference.collection('chunks').order_by('__name__').limit(n - 1)
+            docs += [c.to_dict() for c in (tx.get(q) if tx is not None else q.stream())]
+        return {**doc, **join_lists(docs, keys)}
+
+    def load_manifest(self, store):
+        snap = self.db.collection('manifests').document(store).get()
+        if not snap.exists:
+            return None
+        d = self._read_chunked(snap, ('pids', 'hashes'))
+        return list(zip(d['pids'], d['hashes']))
+
+    def record_menu_diff(self, store, manifest, diff, now):
+        # Só marca quem ainda existe e não está marcado (purgados não viram doc vazio)
+        col = self.db.collection('products')
+        to_mark, leaving = [], []
+        if diff['removed']:
+            refs = [col.document(pid) for pid in diff['removed']]
+            for snap in self.db.get_all(refs, field_paths=('delisted_at', 'category'), timeout=20, retry=Retry()):
+                if not snap.exists:
+                    # Purgado por fora: categoria perdida, sai de todos os agregados
+                    leaving.append({'pid': snap.id, 'category': None, 'remove': True})
+                elif snap.to_dict().get('delisted_at') is None:
+                    to_mark.append(snap.reference)
+                    leaving.append({'pid': snap.id, 'category': snap.to_dict().get('category') or UNCATEGORIZED,
+                                    'remove': True})
+
+        writes = [(ref, {'delisted_at': now}, True) for ref in to_mark]
+        self._write_chunked(writes, self.db.collection('manifests').document(store),
+                            {'run_id': diff['run_id'], 'at': now},
+                            {'pids': [p for p, _ in manifest], 'hashes': [h for _, h in manifest]})
+        self._write_chunked(writes, self.db.collection('menu_diffs').document(diff['run_id']), {
+            'store': store, 'run_id': diff['run_id'], 'at': now, 'total': diff['total'],
+            'unchanged': diff['unchanged'], 'delisted': len(to_mark),
+        }, {
+            'added': diff['added'], 'removed': diff['removed'], 'changed': diff['changed'],
+            'added_entries': [{'pid': e[0], 'name': e[1], 'price': e[2]} for e in diff.get('added_entries', [])],
+        })
+        for i in range(0, len(writes), 450):
+            batch = self.db.batch()
+            for ref, data, merge in writes[i:i + 450]:
+                batch.set(ref, data, merge=merge)
+            batch.commit()
+        # Quem saiu do cardápio deixa de contar nos agregados da categoria
+        self._update_categories(leaving, now)
+        return len(to_mark)
+
+    def write_history(self, points, batch_size=450):
+        col = self.db.collection('products')
+        batch_size = max(1, min(batch_size, 450))
+        for i in range(0, len(points), batch_size):
+            batch = self.db.batch()
+            for pt in points[i:i + batch_size]:
+                ref = col.document(pt['pid']).collection('prices').document(history_doc_id(pt['at']))
+                batch.set(ref, {'price': pt['price'], 'at': pt['at']})
+            batch.commit()
+        return len(points)
+
+    def prices_before(self, pids, at):
+        col = self.db.collection('products')
+        out = {}
+        for pid in pids:
+            q = (col.document(pid).collection('prices')
+                  .where('at', '<', at)
+                  .order_by('at', direction=firestore.Query.DESCENDING)
+                  .limit(1))
+            for s in q.stream():
+                out[pid] = float(s.to_dict().get('price', 0.0))
+        return out
+
+    def replace_history(self, histories, run_times):
+        col = self.db.collection('products')
+        counts = {'written': 0, 'deleted': 0, 'fixed': 0}
+        if not run_times:
+            return counts
+        since, until = min(run_times), max(run_times)
+        runs = {history_doc_id(at) for at in run_times}  # ID do ponto = horário da coleta
+        refs = [col.document(pid) for pid in histories]
+        exists = {s.id for s in self.db.get_all(refs, field_paths=('current_price',), timeout=20, retry=Retry())
+                  if s.exists}
+        for pid in sorted(exists):
+            prices = col.document(pid).collection('prices')
+            points = histories[pid]
+            keep = {history_doc_id(pt['at']) for pt in points}
+            # Lê o trecho (só mudanças: poucos pontos) e apaga apenas os das coletas re-extraídas
+            stale = [s.reference for s in prices.where('at', '>=', since).where('at', '<=', until).stream()
+                     if s.id in runs and s.id not in keep]
+            ops = [(ref, None) for ref in stale]
+            ops += [(prices.document(history_doc_id(pt['at'])), {'price': pt['price'], 'at': pt['at']})
+                    for pt in points]
+            for i in range(0, len(ops), 450):
+                batch = self.db.batch()
+                for ref, data in ops[i:i + 450]:
+                    if data is None:
+                        batch.delete(ref)
+                    else:
+                        batch.set(ref, data)
+                batch.commit()
+            counts['written'] += len(points)
+            counts['deleted'] += len(stale)
+            last = [s.to_dict() for s in prices.order_by('at', direction=firestore.Query.DESCENDING).limit(2).stream()]
+            fix = fix_from_history(last, until)
+            if fix:
+                col.document(pid).set(fix, merge=True)
+                counts['fixed'] += 1
+        return counts
+
+    def delete_product(self, pid):
+        ref = self.db.collection('products').document(pid)
+
+        @firestore.transactional
+        def unlist(tx):
+            snap = ref.get(field_paths=('category',), transaction=tx)
+            if not snap.exists:
+                return False
+            category = (snap.to_dict() or {}).get('category') or UNCATEGORIZED
+            self._apply_categories(tx, [{'pid': pid, 'category': category, 'remove': True}],
+                                   datetime.now(timezone.utc))
+            tx.delete(ref)
+            return True
+
+        # Doc e membros somem juntos; depois a subcoleção 'prices' (BulkWriter, em paralelo)
+        gone = unlist(self.db.transaction())
+        return int(gone) + self.db.recursive_delete(ref, bulk_writer=self.db.bulk_writer())
+
+    def menu_diffs(self, limit=10):
+        q = (self.db.collection('menu_diffs')
+              .order_by('at', direction=firestore.Query.DESCENDING)
+              .limit(limit))
+        return [self._read_chunked(snap, DIFF_LISTS) for snap in q.stream()]
+
+    def _checkpoints(self, store):
+        return self.db.collection('menu_checkpoints').document(store).collection('checkpoints')
+
+    def save_checkpoint(self, store, at, entries):
+        # Primeiro pedaço no próprio doc: cardápio típico = 1 leitura; o resto em 'chunks'
+        chunks = [entries[i:i + CHECKPOINT_CHUNK] for i in range(0, len(entries), CHECKPOINT_CHUNK)] or [[]]
+        ref = self._checkpoints(store).document(history_doc_id(at))
+
+        def body(chunk):
+            return {'pids': [e[0] for e in chunk], 'names': [e[1] for e in chunk], 'prices': [e[2] for e in chunk]}
+
+        batch = self.db.batch()
+        batch.set(ref, {'at': at, 'n_products': len(entries), 'n_chunks': len(chunks), **body(chunks[0])})
+        for i, chunk in enumerate(chunks[1:], start=1):
+            batch.set(ref.collection('chunks').document(f"{i:04d}"), body(chunk))
+        batch.commit()
+
+    def load_checkpoint(self, store, at):
+        q = (self._checkpoints(store)
+              .where('at', '<=', at)
+              .order_by('at', direction=firestore.Query.DESCENDING)
+              .limit(1))
+        snap = next(iter(q.stream()), None)
+        if snap is None:
+            return None
+        docs = [snap.to_dict()]
+        if docs[0].get('n_chunks', 1) > 1:
+            docs += [c.to_dict() for c in snap.reference.collection('chunks').order_by('__name__').stream()]
+        entries = [e for d in docs for e in zip(d.get('pids', []), d.get('names', []), d.get('prices', []))]
+        return docs[0]['at'], entries
+
+    def latest_checkpoint_at(self, store):
+        q = (self._checkpoints(store)
+              .order_by('at', direction=firestore.Query.DESCENDING)
+              .limit(1)
+              .select(['at']))
+        snap = next(iter(q.stream()), None)
+        return snap.to_dict()['at'] if snap is not None else None
+
+    def price_changes(self, since, until, pids=None):
+        if pids is not None:
+            # Uma consulta por produto na subcoleção (índice automático de prices.at):
+            # lê só os pontos desses produtos, ao custo de len(pids) consultas
+            rows = []
+            for pid in sorted(pids):
+                q = (self.db.collection('products').document(pid).collection('prices')
+                      .where('at', '>', since)
+                      .where('at', '<=', until))
+                for s in q.stream():
+                    d = s.to_dict()
+                    rows.append({'pid': pid, 'at': d['at'], 'price': float(d.get('price', 0.0))})
+            rows.sort(key=lambda r: (r['at'], r['pid']))
+            return rows
+        # Sem pids: grupo de coleções 'prices', que lê todos os pontos do intervalo.
+        # Requer a isenção de campo único em prices.at (COLLECTION_GROUP) de firestore.indexes.json
+        q = (self.db.collection_group('prices')
+              .where('at', '>', since)
+              .where('at', '<=', until)
+              .order_by('at'))
+        rows = []
+        for s in q.stream():
+            d = s.to_dict()
+            rows.append({'pid': s.reference.parent.parent.id, 'at': d['at'], 'price': float(d.get('price', 0.0))})
+        return rows
+
+    def list_categories(self):
+        fields = ['name', 'count', 'min_price', 'avg_price', 'max_price', 'promo_count', 'recent_changes', 'updated_at']
+        return [{'id': s.id, **s.to_dict()} for s in self.db.collection('categories').select(fields).stream()]
+
+    def menu_events(self, store, since, until):
+        # Índice composto (store, at): firestore.indexes.json
+        q = (self.db.collection('menu_diffs')
+              .where('store', '==', store)
+              .where('at', '>', since)
+              .where('at', '<=', until)
+              .order_by('at'))
+        return [self._read_chunked(snap, DIFF_LISTS) for snap in q.stream()]
+
+    def history_generation(self):
+        snap = self.db.collection('meta').document('history').get()
+        return int((snap.to_dict() or {}).get('generation', 0)) if snap.exists else 0
+
+    def bump_history_generation(self):
+        self.db.collection('meta').document('history').set(
+            {'generation': Increment(1), 'updated_at': datetime.now(timezone.utc)}, merge=True)
+
+# ---------------- SQL embutido ----------------
+SQL_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS products (
+        pid              TEXT PRIMARY KEY,
+        name             TEXT NOT NULL,
+        description      TEXT,
+        current_price    DOUBLE,
+        last_price       DOUBLE,
+        created_at       TEXT,
+        last_seen_at     TEXT,
+        price_changed_at TEXT,
+        change_count     INTEGER DEFAULT 0,
+        delisted_at      TEXT,
+        extra            TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS prices (
+        pid   TEXT NOT NULL,
+        at    TEXT NOT NULL,
+        price DOUBLE NOT NULL,
+        PRIMARY KEY (pid, at)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_prices_pid_at ON prices(pid, at)",
+    "CREATE INDEX IF NOT EXISTS idx_products_last_seen ON products(last_seen_at)",
+    "CREATE INDEX IF NOT EXISTS idx_products_changed ON products(price_changed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_products_name ON products(name)",
+    """CREATE TABLE IF NOT EXISTS manifests (
+        store   TEXT PRIMARY KEY,
+        run_id  TEXT,
+        at      TEXT,
+        entries TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS menu_diffs (
+        run_id TEXT PRIMARY KEY,
+        store  TEXT,
+        at     TEXT NOT NULL,
+        body   TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_menu_diffs_at ON menu_diffs(at)",
+    """CREATE TABLE IF NOT EXISTS meta (
+        key   TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS menu_checkpoints (
+        store      TEXT NOT NULL,
+        at         TEXT NOT NULL,
+        n_products INTEGER NOT NULL,
+        entries    TEXT NOT NULL,
+        PRIMARY KEY (store, at)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_prices_at ON prices(at)",
+    """CREATE TABLE IF NOT EXISTS categories (
+        cid        TEXT PRIMARY KEY,
+        name       TEXT NOT NULL,
+        updated_at TEXT,
+        body       TEXT NOT NULL
+    )""",
+]
+# Colunas acrescentadas depois da primeira versão do schema (bancos já existentes)
+SQL_MIGRATIONS = [
+    "ALTER TABLE products ADD COLUMN delisted_at TEXT",
+]
+
+def ts_to_sql(dt: datetime | None) -> str | None:
+    # Sempre UTC e com microssegundos: a ordem textual é a ordem cronológica
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat(timespec='microseconds')
+
+def ts_from_sql(s: str | None) -> datetime | None:
+    return datetime.fromisoformat(s) if s else None
+
+class SQLRepository(Repository):
+    def __init__(self, path: str = SQL_PATH):
+        self.path = path
+        # Uma conexão compartilhada (dashboard usa várias threads): serializa o acesso
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        for stmt in SQL_SCHEMA:
+            self.conn.execute(stmt)
+        for stmt in SQL_MIGRATIONS:
+            try:
+                self.conn.execute(stmt)
+            except Exception:
+                pass  # coluna já existe
+        self.conn.commit()
+
+    def _query(self, sql: str, params=()) -> list[dict]:
+        with self._lock:
+            cur = self.conn.execute(sql, params)
+            cols = [c[0] for c in cur.description]
+            rows = cur.fetchall()
+        return [dict(zip(cols, row)) for row in rows]
+
+    def _product_row(self, row: dict) -> dict:
+        doc = {k: v for k, v in row.items() if k not in ('pid', 'extra') and v is not None}
+        for key in TIMESTAMP_FIELDS:
+            if key in doc:
+                doc[key] = ts_from_sql(doc[key])
+        if row.get('extra'):
+            doc.update(json.loads(row['extra']))
+        return doc
+
+    def _load_categories(self, ops) -> dict[str, dict]:
+        if any(op['category'] is None for op in ops):
+            # Purgado de categoria desconhecida: carrega todas (são poucas)
+            return {row['cid']: self._category_row(row)
+                    for row in self._query("SELECT cid, name, updated_at, body FROM categories")}
+        cids = list({category_id(n) for op in ops for n in (op['category'], op.get('prev_category')) if n})
+        docs = {}
+        for i in range(0, len(cids), 500):
+            chunk = cids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for row in self._query(f"SELECT cid, name, updated_at, body FROM categories WHERE cid IN ({marks})", chunk):
+                docs[row['cid']] = self._category_row(row)
+        return docs
+
+    def _category_row(self, row: dict) -> dict:
+        doc = {'name': row['name'], 'updated_at': ts_from_sql(row['updated_at']), **json.loads(row['body'])}
+        for c in doc.get('recent_changes') or []:
+            c['at'] = ts_from_sql(c['at'])
+        return doc
+
+    def _write_categories(self, cur, docs: dict[str, dict]):
+        for cid, doc in docs.items():
+            body = {k: v for k, v in doc.items() if k not in ('name', 'updated_at')}
+            body['recent_changes'] = [dict(c, at=ts_to_sql(c['at'])) for c in doc['recent_changes']]
+            cur.execute("INSERT INTO categories (cid, name, updated_at, body) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (cid) DO UPDATE SET name = excluded.name, updated_at = excluded.updated_at, "
+                        "body = excluded.body",
+                        (cid, doc['name'], ts_to_sql(doc['updated_at']), json.dumps(body)))
+
+    def upsert_products(self, products, now=None, strict=False, batch_size=400):
+        if not products:
+            return []
+        now = now or datetime.now(timezone.utc)
+        pids = list({slugify(p['name']) for p in products})
+
+        existing = {}
+        for i in range(0, len(pids), 500):
+            chunk = pids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for row in self._query(f"SELECT pid, name, current_price, last_price, delisted_at, extra FROM products "
+                                   f"WHERE pid IN ({marks})", chunk):
+                existing[row['pid']] = self._product_row(row)
+
+        results, ops = plan_upsert(products, existing, now)
+        with self._lock:
+            cur = self.conn.cursor()
+            try:
+                # Agregados lidos já dentro da transação de escrita (outro processo não intercala)
+                cur.execute("BEGIN IMMEDIATE")
+                self._write_categories(cur, plan_categories(ops, self._load_categories(ops), now))
+                for op in ops:
+                    data = dict(op['data'])
+                    cols = {k: data.pop(k) for k in PRODUCT_COLUMNS if k in data}
+                    for key in TIMESTAMP_FIELDS:
+                        if key in cols:
+                            cols[key] = ts_to_sql(cols[key])
+                    if op['create']:
+                        cols['pid'] = op['pid']
+                        cols['extra'] = json.dumps(data)
+                        names = list(cols)
+                        cur.execute(
+                            f"INSERT INTO products ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+                            f"ON CONFLICT (pid) DO NOTHING",
+                            [cols[k] for k in names],
+                        )
+                    else:
+                        extra = {k: v for k, v in existing[op['pid']].items() if k not in PRODUCT_COLUMNS}
+                        extra.update(data)
+                        sets = [f"{k} = ?" for k in cols] + ["extra = ?"]
+                        params = list(cols.values()) + [json.dumps(extra)]
+                        if op['changed']:
+                            sets.append("change_count = COALESCE(change_count, 0) + 1")
+                        cur.execute(f"UPDATE products SET {', '.join(sets)} WHERE pid = ?", params + [op['pid']])
+                    if op['history']:
+                        cur.execute(
+                            "INSERT INTO prices (pid, at, price) VALUES (?, ?, ?) ON CONFLICT (pid, at) DO NOTHING",
+                            (op['pid'], ts_to_sql(op['history']['at']), op['history']['price']),
+                        )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return results
+
+    def list_products(self, since=None, limit=DEFAULT_LIMIT, listed_only=False, category=None):
+        where, params = [], []
+        if since is not None:
+            where.append("last_seen_at >= ?")
+            params.append(ts_to_sql(since))
+        if listed_only:
+            where.append("delisted_at IS NULL")
+        if category:
+            where.append("COALESCE(NULLIF(json_extract(extra, '$.category'), ''), ?) = ?")
+            params += [UNCATEGORIZED, category]
+        sql = "SELECT * FROM products" + (f" WHERE {' AND '.join(where)}" if where else "") + " ORDER BY pid"
+        if since is None and limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [self._product_row(r) for r in self._query(sql, params)]
+
+    def price_history(self, pid, since=None):
+        sql = "SELECT at, price FROM prices WHERE pid = ?"
+        params = [pid]
+        if since is not None:
+            sql += " AND at >= ?"
+            params.append(ts_to_sql(since))
+        rows = self._query(sql + " ORDER BY at", params)
+        return [{'at': ts_from_sql(r['at']), 'price': float(r['price'])} for r in rows]
+
+    def recent_changes(self, since, limit=100):
+        rows = self._query(
+            "SELECT * FROM products WHERE price_changed_at >= ? ORDER BY price_changed_at LIMIT ?",
+            (ts_to_sql(since), int(limit)),
+        )
+        return [self._product_row(r) for r in rows]
+
+    def search_prefix(self, term, limit=10):
+        # Intervalo [term, term + U+F8FF] usa o índice em 'name', como no Firestore
+        rows = self._query(
+            "SELECT * FROM products WHERE name >= ? AND name <= ? ORDER BY name LIMIT ?",
+            (term, term + '\uf8ff', int(limit)),
+        )
+        return [self._product_row(r) for r in rows]
+
+    def load_manifest(self, store):
+        rows = self._query("SELECT entries FROM manifests WHERE store = ?", (store,))
+        return [tuple(e) for e in json.loads(rows[0]['entries'])] if rows else None
+
+    def record_menu_diff(self, store, manifest, diff, now):
+        at = ts_to_sql(now)
+        body = {k: diff[k] for k in ('total', 'added', 'removed', 'changed', 'unchanged')}
+        body['added_entries'] = diff.get('added_entries', [])
+        # Quem ainda está ativo sai dos agregados da categoria; purgados (sem linha), de todos
+        leaving, found = [], set()
+        for i in range(0, len(diff['removed']), 500):
+            chunk = diff['removed'][i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for row in self._query(f"SELECT pid, delisted_at, extra FROM products WHERE pid IN ({marks})", chunk):
+                found.add(row['pid'])
+                if row['delisted_at'] is None:
+                    category = json.loads(row['extra'] or '{}').get('category') or UNCATEGORIZED
+                    leaving.append({'pid': row['pid'], 'category': category, 'remove': True})
+        leaving += [{'pid': pid, 'category': None, 'remove': True} for pid in diff['removed'] if pid not in found]
+        with self._lock:
+            cur = self.conn.cursor()
+            try:
+                cur.execute("BEGIN IMMEDIATE")
+                if leaving:
+                    self._write_categories(cur, plan_categories(leaving, self._load_categories(leaving), now))
+                marked = 0
+                for i in range(0, len(diff['removed']), 500):
+                    chunk = diff['removed'][i:i + 500]
+                    marks = ",".join("?" * len(chunk))
+                    n = cur.execute(f"UPDATE products SET delisted_at = ? WHERE delisted_at IS NULL "
+                                    f"AND pid IN ({marks})", [at] + chunk).rowcount
+                    marked += max(n or 0, 0)
+                body['delisted'] = marked
+                cur.execute("INSERT INTO manifests (store, run_id, at, entries) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT (store) DO UPDATE SET run_id = excluded.run_id, at = excluded.at, "
+                            "entries = excluded.entries",
+                            (store, diff['run_id'], at, json.dumps(manifest, separators=(',', ':'))))
+                cur.execute("INSERT INTO menu_diffs (run_id, store, at, body) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT (run_id) DO NOTHING",
+                            (diff['run_id'], store, at, json.dumps(body)))
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return marked
+
+    def write_history(self, points, batch_size=450):
+        with self._lock:
+            try:
+                self.conn.executemany(
+                    "INSERT INTO prices (pid, at, price) VALUES (?, ?, ?) "
+                    "ON CONFLICT (pid, at) DO UPDATE SET price = excluded.price",
+                    [(pt['pid'], ts_to_sql(pt['at']), pt['price']) for pt in points],
+                )
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return len(points)
+
+    def prices_before(self, pids, at):
+        out = {}
+        for i in range(0, len(pids), 500):
+            chunk = list(pids[i:i + 500])
+            marks = ",".join("?" * len(chunk))
+            # Último ponto antes de 'at' por produto (índice (pid, at) da chave primária)
+            rows = self._query(f"SELECT p.pid, p.price FROM prices p JOIN (SELECT pid, MAX(at) AS at FROM prices "
+                               f"WHERE at < ? AND pid IN ({marks}) GROUP BY pid) m ON p.pid = m.pid AND p.at = m.at",
+                               [ts_to_sql(at)] + chunk)
+            out.update({r['pid']: float(r['price']) for r in rows})
+        return out
+
+    def replace_history(self, histories, run_times):
+        counts = {'written': 0, 'deleted': 0, 'fixed': 0}
+        if not run_times:
+            return counts
+        until = max(run_times)
+        runs = sorted({ts_to_sql(at) for at in run_times})
+        pids = list(histories)
+        exists = set()
+        for i in range(0, len(pids), 500):
+            chunk = pids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            exists.update(r['pid'] for r in self._query(f"SELECT pid FROM products WHERE pid IN ({marks})", chunk))
+        with self._lock:
+            cur = self.conn.cursor()
+            try:
+                for pid in sorted(exists):
+                    keep = [ts_to_sql(pt['at']) for pt in histories[pid]]
+                    # Só os pontos das coletas re-extraídas; os demais horários ficam
+                    cur.execute("DELETE FROM prices WHERE pid = ? AND at IN (SELECT value FROM json_each(?)) "
+                                "AND at NOT IN (SELECT value FROM json_each(?))",
+                                (pid, json.dumps(runs), json.dumps(keep)))
+                    counts['deleted'] += cur.rowcount
+                    cur.executemany("INSERT INTO prices (pid, at, price) VALUES (?, ?, ?) "
+                                    "ON CONFLICT (pid, at) DO UPDATE SET price = excluded.price",
+                                    [(pid, at, pt['price']) for at, pt in zip(keep, histories[pid])])
+                    counts['written'] += len(histories[pid])
+                    last = [{'at': ts_from_sql(at), 'price': price} for at, price in cur.execute(
+                        "SELECT at, price FROM prices WHERE pid = ? ORDER BY at DESC LIMIT 2", (pid,)).fetchall()]
+                    fix = fix_from_history(last, until)
+                    if fix:
+                        sets = ", ".join(f"{k} = ?" for k in fix)
+                        params = [ts_to_sql(v) if k in TIMESTAMP_FIELDS else v for k, v in fix.items()]
+                        cur.execute(f"UPDATE products SET {sets} WHERE pid = ?", params + [pid])
+                        counts['fixed'] += 1
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return counts
+
+    def delete_product(self, pid):
+        with self._lock:
+            cur = self.conn.cursor()
+            try:
+                cur.execute("BEGIN IMMEDIATE")
+                row = cur.execute("SELECT extra FROM products WHERE pid = ?", (pid,)).fetchone()
+                if row is None:
+                    self.conn.rollback()
+                    return 0
+                category = json.loads(row[0] or '{}').get('category') or UNCATEGORIZED
+                ops = [{'pid': pid, 'category': category, 'remove': True}]
+                self._write_categories(cur, plan_categories(ops, self._load_categories(ops), datetime.now(timezone.utc)))
+                n = cur.execute("DELETE FROM prices WHERE pid = ?", (pid,)).rowcount
+                cur.execute("DELETE FROM products WHERE pid = ?", (pid,))
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+        return 1 + max(n or 0, 0)
+
+    def menu_diffs(self, limit=10):
+        rows = self._query("SELECT run_id, store, at, body FROM menu_diffs ORDER BY at DESC LIMIT ?", (int(limit),))
+        return [{'run_id': r['run_id'], 'store': r['store'], 'at': ts_from_sql(r['at']), **json.loads(r['body'])}
+                for r in rows]
+
+    def save_checkpoint(self, store, at, entries):
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO menu_checkpoints (store, at, n_products, entries) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (store, at) DO UPDATE SET n_products = excluded.n_products, entries = excluded.entries",
+                (store, ts_to_sql(at), len(entries), json.dumps(entries, ensure_ascii=False, separators=(',', ':'))),
+            )
+            self.conn.commit()
+
+    def load_checkpoint(self, store, at):
+        rows = self._query("SELECT at, entries FROM menu_checkpoints WHERE store = ? AND at <= ? "
+                           "ORDER BY at DESC LIMIT 1", (store, ts_to_sql(at)))
+        if not rows:
+            return None
+        return ts_from_sql(rows[0]['at']), [tuple(e) for e in json.loads(rows[0]['entries'])]
+
+    def latest_checkpoint_at(self, store):
+        rows = self._query("SELECT MAX(at) AS at FROM menu_checkpoints WHERE store = ?", (store,))
+        return ts_from_sql(rows[0]['at']) if rows else None
+
+    def price_changes(self, since, until, pids=None):
+        sql = "SELECT pid, at, price FROM prices WHERE at > ? AND at <= ?"
+        params = [ts_to_sql(since), ts_to_sql(until)]
+        if pids is not None:
+            sql += " AND pid IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(sorted(pids)))
+        rows = self._query(sql + " ORDER BY at", tuple(params))
+        return [{'pid': r['pid'], 'at': ts_from_sql(r['at']), 'price': float(r['price'])} for r in rows]
+
+    def list_categories(self):
+        out = []
+        for row in self._query("SELECT cid, name, updated_at, body FROM categories ORDER BY name"):
+            doc = self._category_row(row)
+            doc.pop('members', None)
+            out.append({'id': row['cid'], **doc})
+        return out
+
+    def menu_events(self, store, since, until):
+        rows = self._query("SELECT run_id, store, at, body FROM menu_diffs WHERE store = ? AND at > ? AND at <= ? "
+                           "ORDER BY at", (store, ts_to_sql(since), ts_to_sql(until)))
+        return [{'run_id': r['run_id'], 'store': r['store'], 'at': ts_from_sql(r['at']), **json.loads(r['body'])}
+                for r in rows]
+
+    def history_generation(self):
+        rows = self._query("SELECT value FROM meta WHERE key = 'history_generation'")
+        return rows[0]['value'] if rows else 0
+
+    def bump_history_generation(self):
+        with self._lock:
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('history_generation', 1) "
+                              "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+            self.conn.commit()
+
+# ---------------- Fábrica ----------------
+def get_repository(init_firestore=None, backend: str = BACKEND) -> Repository:
+    """
+    Repositório configurado. 'init_firestore' é chamado só se o backend for o Firestore
+    (cada script tem a sua inicialização de credenciais).
+    """
+    if backend == "sql":
+        return SQLRepository()
+    if init_firestore is None:
+        raise ValueError("Backend Firestore requer init_firestore.")
+    return FirestoreRepository(init_firestore())
+
+def as_repository(db) -> Repository:
+    """Aceita um Repository ou um cliente Firestore (compatibilidade com as funções antigas)."""
+    return db if isinstance(db, Repository) else FirestoreRepository(db)
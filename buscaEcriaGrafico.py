@@ -11,6 +11,8 @@ import seaborn as sns
 
 from datetime import datetime, timedelta, timezone
 
+from armazenamento import as_repository, get_repository
+
 # ---------- Firebase ----------
 def init_firestore():
     cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "serviceAccountKey.json")
@@ -35,23 +37,15 @@ def search_products_prefix(db, term: str, limit: int = 10) -> list[dict]:
     Dica: Se você tiver um campo 'name_lower', use order_by('name_lower') com term.lower().
     """
     term = term.strip()
-    q = (db.collection('products')
-          .order_by('name')
-          .start_at([term])
-          .end_at([term + '\uf8ff'])
-          .limit(limit))
-    return [doc.to_dict() for doc in q.stream()]
+    return as_repository(db).search_prefix(term, limit=limit)
 
 # ---------- Histórico ----------
 def get_price_history_df(db, product_name: str, hours: int | None = None) -> pd.DataFrame:
-    ref = product_ref(db, product_name)
-    q = ref.collection('prices').order_by('at')
+    since = None
     if hours:
-        cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
-        q = q.where('at', '>=', cutoff)
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
     rows = []
-    for s in q.stream():
-        d = s.to_dict()
+    for d in as_repository(db).price_history(slugify(product_name), since=since):
         at = d['at']
         if hasattr(at, 'replace'):
             at = at.replace(tzinfo=None)
@@ -84,7 +78,7 @@ def plot_history(df: pd.DataFrame, product_name: str, save_path: str | None = No
 
 # ---------- Execução (CLI simples) ----------
 if __name__ == "__main__":
-    db = init_firestore()
+    db = get_repository(init_firestore)
     termo = input("Digite um nome (ou prefixo) do produto: ").strip()
     sugestoes = search_products_prefix(db, termo, limit=10)
     if not sugestoes:
@@ -0,0 +1,200 @@
+# cacheHistorico.py
+# Cache de histórico de preços compartilhado pelo processo (todas as sessões do dashboard)
+# - Cada produto vira dois arrays NumPy: at (datetime64[us], UTC) e price (float32)
+# - Atualização incremental: só busca pontos com 'at' maior que a marca d'água em cache
+# - Pontos antigos reescritos (compactar/purgar do manutencao.py, capturas --backfill) não
+#   aparecem no incremental: o cache compara a geração do histórico no banco e descarta
+#   tudo quando ela muda; além disso recarrega cada produto inteiro a cada
+#   HISTORY_CACHE_FULL_RELOAD segundos (escritas feitas fora desses comandos)
+# - Filtro de período por busca binária (np.searchsorted) nos arrays
+# - Despejo LRU com teto de memória; estatísticas de uso e latência de refresh
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+# ---------------- Configurações ----------------
+HISTORY_CACHE_MB = float(os.getenv("HISTORY_CACHE_MB", "64"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "30"))  # segundos até checar pontos novos
+HISTORY_CACHE_FULL_RELOAD = float(os.getenv("HISTORY_CACHE_FULL_RELOAD", "3600"))  # segundos até reler tudo
+
+
+def to_utc_naive(x) -> datetime:
+    if getattr(x, 'tzinfo', None) is not None:
+        x = x.astimezone(timezone.utc)
+    return x.replace(tzinfo=None)
+
+
+class _Entry:
+    __slots__ = ('at', 'price', 'hwm', 'checked_at', 'loaded_at', 'lock')
+
+    def __init__(self):
+        self.at = np.empty(0, dtype='datetime64[us]')
+        self.price = np.empty(0, dtype=np.float32)
+        self.hwm = None  # maior 'at' já em cache (datetime aware, para a consulta)
+        self.checked_at = None  # time.monotonic() da última consulta ao banco
+        self.loaded_at = None  # time.monotonic() da última leitura completa
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self.at.nbytes + self.price.nbytes
+
+
+class HistoryCache:
+    """
+    fetch(pid, since) -> [{'at', 'price'}] ordenado por 'at' (ex.: Repository.price_history).
+    generation() -> int (ex.: Repository.history_generation), checado no máximo a cada 'ttl'.
+    Seguro para várias threads: um lock global para o índice LRU e os contadores e um
+    por produto para o refresh (duas sessões pedindo o mesmo produto fazem uma consulta só).
+    """
+
+    def __init__(self, fetch, max_bytes: int = int(HISTORY_CACHE_MB * 1024 * 1024),
+                 ttl: float = HISTORY_CACHE_TTL, generation=None,
+                 full_reload: float = HISTORY_CACHE_FULL_RELOAD):
+        self.fetch = fetch
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.generation = generation
+        self.full_reload = full_reload
+        self._generation = None
+        self._generation_checked_at = None
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.points_fetched = 0
+        self.refresh_ms_total = 0.0
+        self.refresh_ms_last = 0.0
+        self.reloads = 0
+
+    def _entry(self, pid: str) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(pid)
+            if entry is None:
+                entry = self._entries[pid] = _Entry()
+            self._entries.move_to_end(pid)
+            return entry
+
+    def _check_generation(self):
+        """Descarta tudo se o histórico foi reescrito desde a última checagem."""
+        if self.generation is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._generation_checked_at is not None and now - self._generation_checked_at < self.ttl:
+                return
+            self._generation_checked_at = now
+        current = self.generation()
+        with self._lock:
+            changed = self._generation is not None and current != self._generation
+            self._generation = current
+        if changed:
+            self.invalidate()
+
+    def _refresh(self, pid: str, entry: _Entry):
+        started = time.perf_counter()
+        full = entry.loaded_at is None or time.monotonic() - entry.loaded_at >= self.full_reload
+        since = None if full else entry.hwm
+        rows = self.fetch(pid, since=since)
+        if since is not None:
+            # 'since' é inclusivo: descarta o ponto que já está em cache
+            rows = [r for r in rows if r['at'] > since]
+        new_at = np.array([to_utc_naive(r['at']) for r in rows], dtype='datetime64[us]')
+        new_price = np.array([r['price'] for r in rows], dtype=np.float32)
+        with self._lock:
+            before = entry.nbytes
+            if full:
+                entry.at, entry.price = new_at, new_price
+                entry.hwm = max((r['at'] for r in rows), default=None)
+                entry.loaded_at = time.monotonic()
+                self.reloads += 1
+            elif rows:
+                entry.at = np.concatenate([entry.at, new_at])
+                entry.price = np.concatenate([entry.price, new_price])
+                entry.hwm = max(r['at'] for r in rows)
+            # Entrada descartada durante a consulta (invalidate/despejo) já saiu da conta
+            if self._entries.get(pid) is entry:
+                self._bytes += entry.nbytes - before
+            self.points_fetched += len(rows)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.refreshes += 1
+            self.refresh_ms_last = elapsed
+            self.refresh_ms_total += elapsed
+        entry.checked_at = time.monotonic()
+
+    def _evict(self, keep: str):
+        with self._lock:
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                pid, entry = next(iter(self._entries.items()))
+                if pid == keep:
+                    self._entries.move_to_end(pid)
+                    continue
+                del self._entries[pid]
+                self._bytes -= entry.nbytes
+                self.evictions += 1
+
+    def get(self, pid: str, since: datetime | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Arrays (at, price) do produto a partir de 'since' (views, não copie sem precisar)."""
+        self._check_generation()
+        entry = self._entry(pid)
+        with entry.lock:
+            stale = entry.checked_at is None or time.monotonic() - entry.checked_at >= self.ttl
+            if stale:
+                self._refresh(pid, entry)
+            else:
+                with self._lock:
+                    self.hits += 1
+            at, price = entry.at, entry.price
+        self._evict(keep=pid)
+
+        if since is None:
+            return at, price
+        i = int(np.searchsorted(at, np.datetime64(to_utc_naive(since), 'us'), side='left'))
+        return at[i:], price[i:]
+
+    def expire(self, pid: str | None = None):
+        """Força nova checagem na próxima leitura (mantém os arrays; o refresh continua incremental)."""
+        with self._lock:
+            entries = [self._entries[pid]] if pid in self._entries else (
+                list(self._entries.values()) if pid is None else [])
+        for entry in entries:
+            entry.checked_at = None
+
+    def invalidate(self, pid: str | None = None):
+        """Descarta o cache deste processo (outros processos: Repository.bump_history_generation)."""
+        with self._lock:
+            pids = [pid] if pid is not None else list(self._entries)
+            for p in pids:
+                entry = self._entries.pop(p, None)
+                if entry is not None:
+                    self._bytes -= entry.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = len(self._entries)
+            points = sum(len(e.at) for e in self._entries.values())
+            nbytes = self._bytes
+            hits, refreshes, reloads = self.hits, self.refreshes, self.reloads
+            evictions, points_fetched = self.evictions, self.points_fetched
+            ms_last, ms_total = self.refresh_ms_last, self.refresh_ms_total
+        lookups = hits + refreshes
+        return {
+            'products': n,
+            'points': points,
+            'bytes': nbytes,
+            'max_bytes': self.max_bytes,
+            'hit_rate': round(hits / lookups, 3) if lookups else None,
+            'refreshes': refreshes,
+            'full_reloads': reloads,
+            'evictions': evictions,
+            'points_fetched': points_fetched,
+            'refresh_ms_last': round(ms_last, 1),
+            'refresh_ms_avg': round(ms_total / refreshes, 1) if refreshes else None,
+        }
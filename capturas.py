@@ -0,0 +1,470 @@
+# capturas.py
+# Arquivo das páginas brutas de cada coleta (HTML final + respostas JSON do cardápio)
+# - Endereçado por conteúdo (sha256): a mesma página salva em várias coletas ocupa espaço uma vez
+# - Blobs comprimidos com zstd (pacote 'zstandard'); sem ele, gzip
+# - Índice SQLite (coleta, horário, tipo, url, sha256) para consultar por período
+# - reextrair: refaz extração + filtros (build_product do lg1, com as regras atuais)
+#   sobre as capturas de um período, sem navegador, em vários processos;
+#   --backfill regrava o histórico de preço do período a partir do resultado
+#   (remove pontos da extração antiga e corrige o preço atual)
+
+import os
+import sys
+import gzip
+import json
+import time
+import uuid
+import bisect
+import hashlib
+import sqlite3
+import argparse
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+try:
+    import zstandard
+except ImportError:  # opcional: cai para gzip
+    zstandard = None
+
+# ---------------- Configurações ----------------
+CAPTURE_ENABLED = os.getenv("CAPTURE", "1") == "1"
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", "capturas")
+ZSTD_LEVEL = int(os.getenv("CAPTURE_ZSTD_LEVEL", "10"))
+WORKERS = int(os.getenv("CAPTURE_WORKERS", str(os.cpu_count() or 2)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    capture_id  TEXT NOT NULL,
+    captured_at TEXT NOT NULL,
+    store_url   TEXT,
+    kind        TEXT NOT NULL,
+    url         TEXT,
+    sha256      TEXT NOT NULL,
+    size        INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_captures_at ON captures(captured_at, kind);
+CREATE INDEX IF NOT EXISTS idx_captures_sha ON captures(sha256);
+"""
+
+# ---------------- Blobs ----------------
+def connect(capture_dir: str = CAPTURE_DIR) -> sqlite3.Connection:
+    os.makedirs(capture_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(capture_dir, "index.sqlite3"), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def blob_path(sha: str, ext: str, capture_dir: str = CAPTURE_DIR) -> str:
+    return os.path.join(capture_dir, "objects", sha[:2], sha[2:] + ext)
+
+def find_blob(sha: str, capture_dir: str = CAPTURE_DIR) -> str | None:
+    for ext in (".zst", ".gz"):
+        path = blob_path(sha, ext, capture_dir)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def put_blob(raw: bytes, capture_dir: str = CAPTURE_DIR) -> tuple[str, bool]:
+    """Grava o conteúdo (se ainda não existir). Retorna (sha256, novo)."""
+    sha = hashlib.sha256(raw).hexdigest()
+    if find_blob(sha, capture_dir):
+        return sha, False
+    if zstandard is not None:
+        data, ext = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw), ".zst"
+    else:
+        data, ext = gzip.compress(raw, compresslevel=9), ".gz"
+    path = blob_path(sha, ext, capture_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)  # atômico: leitores nunca veem blob pela metade
+    return sha, True
+
+def read_blob(sha: str, capture_dir: str = CAPTURE_DIR) -> bytes:
+    path = find_blob(sha, capture_dir)
+    if path is None:
+        raise FileNotFoundError(f"Blob ausente: {sha}")
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("Blob em zstd: instale o pacote 'zstandard'.")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+# ---------------- Captura (durante o scraping) ----------------
+def record_responses(page) -> list:
+    """Registra as respostas JSON (xhr/fetch) da página; chame antes de navegar."""
+    responses = []
+
+    def on_response(resp):
+        try:
+            if (resp.request.resource_type in ("xhr", "fetch")
+                    and "json" in (resp.headers.get("content-type") or "")):
+                responses.append(resp)
+        except Exception:
+            pass
+
+    page.on("response", on_response)
+    return responses
+
+def save_capture(html: str, json_bodies: list[tuple[str, bytes]], captured_at: datetime,
+                 store_url: str | None = None, capture_dir: str = CAPTURE_DIR) -> str:
+    capture_id = f"{captured_at.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    rows = []
+    sha, _ = put_blob(html.encode("utf-8"), capture_dir)
+    rows.append(("html", store_url, sha, len(html.encode("utf-8"))))
+    for url, body in json_bodies:
+        sha, _ = put_blob(body, capture_dir)
+        rows.append(("json", url, sha, len(body)))
+    conn = connect(capture_dir)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO captures (capture_id, captured_at, store_url, kind, url, sha256, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(capture_id, captured_at.astimezone(timezone.utc).isoformat(), store_url, kind, url, sha, size)
+                 for kind, url, sha, size in rows],
+            )
+    finally:
+        conn.close()
+    return capture_id
+
+def capture_page(page, responses: list, captured_at: datetime, store_url: str | None = None,
+                 capture_dir: str = CAPTURE_DIR) -> str:
+    """HTML final (depois do scroll) + corpos das respostas JSON registradas."""
+    bodies = []
+    for resp in responses:
+        try:
+            bodies.append((resp.url, resp.body()))
+        except Exception:
+            pass  # resposta sem corpo (redirect, cache) ou página já navegou
+    return save_capture(page.content(), bodies, captured_at, store_url, capture_dir)
+
+# ---------------- DOM mínimo (html.parser) ----------------
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+SKIP_TEXT = {'script', 'style', 'noscript', 'template'}
+
+class Node:
+    __slots__ = ('tag', 'cls', 'classes', 'parent', 'children', 'idx', 'last')
+
+    def __init__(self, tag: str, cls: str, parent, idx: int):
+        self.tag = tag
+        self.cls = cls
+        self.classes = frozenset(cls.split())
+        self.parent = parent
+        self.children = []  # Node ou str
+        self.idx = idx  # posição em ordem de documento
+        self.last = idx  # maior idx dentro da subárvore
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node('#root', '', None, -1)
+        self.stack = [self.root]
+        self.elements: list[Node] = []
+
+    def handle_starttag(self, tag, attrs):
+        cls = next((v for k, v in attrs if k == 'class' and v), '')
+        node = Node(tag, cls, self.stack[-1], len(self.elements))
+        self.stack[-1].children.append(node)
+        self.elements.append(node)
+        if tag not in VOID_TAGS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self._close(len(self.stack) - 1)
+
+    def handle_endtag(self, tag):
+        # HTML mal formado: fecha até a abertura correspondente (se houver)
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                self._close(i)
+                return
+
+    def handle_data(self, data):
+        if self.stack[-1].tag not in SKIP_TEXT:
+            self.stack[-1].children.append(data)
+
+    def _close(self, i: int):
+        last = len(self.elements) - 1
+        for node in self.stack[i:]:
+            node.last = last
+        del self.stack[i:]
+
+    def finish(self) -> list[Node]:
+        self.close()
+        self._close(1)
+        return self.elements
+
+def parse_html(html: str) -> list[Node]:
+    builder = _TreeBuilder()
+    builder.feed(html)
+    return builder.finish()
+
+def text(node: Node | None) -> str:
+    if node is None:
+        return ""
+    parts, stack = [], [node]
+    while stack:
+        n = stack.pop()
+        if isinstance(n, str):
+            parts.append(n)
+        elif n.tag not in SKIP_TEXT:
+            stack.extend(reversed(n.children))
+    return " ".join(" ".join(parts).split())
+
+def css(selector: str) -> tuple[str | None, frozenset]:
+    """'tag.cls1.cls2' (com '\\:' escapado) -> (tag, classes). Só o que os seletores do lg1 usam."""
+    head, *classes = selector.split('.')
+    return head or None, frozenset(c.replace('\\:', ':') for c in classes)
+
+def matches_css(node: Node, sel: tuple) -> bool:
+    tag, classes = sel
+    return (tag is None or node.tag == tag) and classes <= node.classes
+
+def matches_contains(node: Node, tag: str | None, parts: tuple[str, ...]) -> bool:
+    # Equivalente ao contains(@class, "...") do XPath (substring, não token)
+    return (tag is None or node.tag == tag) and all(p in node.cls for p in parts)
+
+# ---------------- Re-extração ----------------
+def extract_cards(html: str) -> list[tuple[str, str, str, str, str, str]]:
+    """
+    Mesma busca do scrape_products/EXTRACT_DIFF_JS sobre o HTML salvo:
+    sobe até 6 ancestrais div/article/li procurando os preços; senão, o primeiro
+    elemento depois do nome (eixo following). A categoria é o último CATEGORY_SEL
+    antes do nome. Retorna (name, cur, prev, base, desc, category).
+    """
+    from lg1 import NAME_SEL, PRICE_CURRENT_SEL, PRICE_PREV_SEL, PRICE_BASE_SEL, DESC_SEL, CATEGORY_SEL, slugify
+    name_sel, cur_sel, prev_sel, base_sel, desc_sel, cat_sel = map(
+        css, (NAME_SEL, PRICE_CURRENT_SEL, PRICE_PREV_SEL, PRICE_BASE_SEL, DESC_SEL, CATEGORY_SEL))
+    base_any = ('div', ('mt-3', 'text-base', 'text-gray-700'))
+    elements = parse_html(html)
+
+    # Índices (ordem de documento) dos elementos que casam com cada predicado, montados
+    # uma vez por página na primeira consulta: "primeiro dentro de/depois de X" vira
+    # busca binária, sem copiar nem varrer a lista a cada card
+    preds = {
+        'cur': lambda e: matches_css(e, cur_sel),
+        'prev': lambda e: matches_css(e, prev_sel),
+        'desc': lambda e: matches_css(e, desc_sel),
+        'base': lambda e: matches_css(e, base_sel),
+        'base_any': lambda e: matches_contains(e, *base_any),
+        'green': lambda e: matches_contains(e, 'span', ('text-green-500',)),
+        'base_md': lambda e: matches_contains(e, 'div', base_any[1] + ('md:mt-6',)),
+        'strike': lambda e: matches_contains(e, 'span', ('line-through',)),
+        'desc_any': lambda e: matches_contains(e, None, ('text-sm', 'text-gray-500')),
+    }
+    matched: dict[str, list[int]] = {}
+
+    def first_between(key, lo, hi):
+        idx = matched.get(key)
+        if idx is None:
+            pred = preds[key]
+            idx = matched[key] = [e.idx for e in elements if pred(e)]
+        i = bisect.bisect_left(idx, lo)
+        return elements[idx[i]] if i < len(idx) and idx[i] <= hi else None
+
+    def first_in(node, key):
+        return first_between(key, node.idx + 1, node.last)
+
+    def first_after(node, key):
+        return first_between(key, node.last + 1, len(elements) - 1)
+
+    cards, seen, category = [], set(), ""
+    for name_el in elements:
+        if matches_css(name_el, cat_sel):
+            category = text(name_el)
+            continue
+        if not matches_css(name_el, name_sel):
+            continue
+        name = text(name_el)
+        if not name:
+            continue
+        pid = slugify(name)
+        if pid in seen:
+            continue
+        seen.add(pid)
+
+        cur = prev = base = desc = ""
+        found = False
+        el, depth = name_el.parent, 0
+        while el is not None and el.idx >= 0 and depth < 6:
+            if el.tag in ('div', 'article', 'li'):
+                depth += 1
+                cur = text(first_in(el, 'cur'))
+                prev = text(first_in(el, 'prev'))
+                desc = text(first_in(el, 'desc'))
+                base = text(first_in(el, 'base')) or text(first_in(el, 'base_any'))
+                if cur or base:
+                    found = True
+                    break
+            el = el.parent
+        if not found:
+            cur = text(first_after(name_el, 'green'))
+            base = text(first_after(name_el, 'base_md')) or text(first_after(name_el, 'base_any'))
+            prev = text(first_after(name_el, 'strike'))
+            desc = text(first_after(name_el, 'desc_any'))
+        cards.append((name, cur, prev, base, desc, category))
+    return cards
+
+def reextract_blob(sha: str, capture_dir: str = CAPTURE_DIR) -> tuple[str, list[tuple]]:
+    """Roda no processo filho: HTML do blob -> textos dos cards (o parse é no processo pai)."""
+    return sha, extract_cards(read_blob(sha, capture_dir).decode("utf-8"))
+
+def list_captures(since: datetime | None = None, until: datetime | None = None, kind: str = "html",
+                  capture_dir: str = CAPTURE_DIR) -> list[dict]:
+    sql = "SELECT capture_id, captured_at, store_url, url, sha256, size FROM captures WHERE kind = ?"
+    params = [kind]
+    if since is not None:
+        sql += " AND captured_at >= ?"
+        params.append(since.astimezone(timezone.utc).isoformat())
+    if until is not None:
+        sql += " AND captured_at < ?"
+        params.append(until.astimezone(timezone.utc).isoformat())
+    conn = connect(capture_dir)
+    try:
+        rows = conn.execute(sql + " ORDER BY captured_at", params).fetchall()
+    finally:
+        conn.close()
+    return [{'capture_id': r[0], 'captured_at': datetime.fromisoformat(r[1]), 'store_url': r[2],
+             'url': r[3], 'sha256': r[4], 'size': r[5]} for r in rows]
+
+def reextract(captures: list[dict], workers: int = WORKERS, capture_dir: str = CAPTURE_DIR) -> dict:
+    """
+    Re-extrai cada HTML distinto uma vez (capturas iguais compartilham o blob) num pool
+    de processos; os textos de preço de todas as páginas passam por um build_products
+    (precos.parse_unique) só, com as regras atuais do lg1.
+    Retorna {'runs': [(captured_at, capture_id, products)], 'pages', 'cards', 'elapsed_s'}.
+    """
+    from lg1 import build_products
+    started = time.perf_counter()
+    shas = list(dict.fromkeys(c['sha256'] for c in captures))
+    spans, cards = {}, []
+    if shas:
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            chunk = max(1, len(shas) // (max(1, workers) * 4))
+            for sha, page_cards in pool.map(reextract_blob, shas, [capture_dir] * len(shas), chunksize=chunk):
+                spans[sha] = (len(cards), len(cards) + len(page_cards))
+                cards.extend(page_cards)
+    built = build_products(cards)
+    by_sha = {sha: [p for p in built[a:b] if p is not None] for sha, (a, b) in spans.items()}
+    runs = [(c['captured_at'], c['capture_id'], by_sha[c['sha256']]) for c in captures]
+    return {'runs': runs, 'pages': len(shas), 'cards': len(cards),
+            'elapsed_s': time.perf_counter() - started}
+
+def history_points(runs: list[tuple[datetime, str, list[dict]]],
+                   previous: dict[str, float] | None = None) -> list[dict]:
+    """
+    Pontos de histórico no formato do upsert: só as capturas em que o preço re-extraído
+    difere do anterior. 'previous' é o último preço gravado antes da primeira captura
+    (por pid); sem ele, a primeira captura de cada produto gera ponto. O horário é o da
+    captura, que é o mesmo 'now' da coleta no WAL (mesmo ID determinístico do ponto).
+    """
+    from armazenamento import slugify
+    last, points = dict(previous or {}), []
+    for at, _, products in sorted(runs, key=lambda r: r[0]):
+        for p in products:
+            pid, price = slugify(p['name']), float(p['price'])
+            if last.get(pid) != price:
+                points.append({'pid': pid, 'at': at, 'price': price})
+                last[pid] = price
+    return points
+
+def backfill_history(repo, runs: list[tuple[datetime, str, list[dict]]]) -> dict:
+    """
+    Regrava o histórico nos horários das capturas com o resultado da re-extração: pontos
+    errados da extração antiga somem, os corrigidos entram, e current_price acompanha
+    quando as capturas chegam até a última mudança do produto (Repository.replace_history).
+    Pontos de horários sem captura (modo watch, CAPTURE=0, captura que falhou) ficam.
+    """
+    from armazenamento import slugify
+    if not runs:
+        return {'written': 0, 'deleted': 0, 'fixed': 0, 'products': 0}
+    pids = sorted({slugify(p['name']) for _, _, products in runs for p in products})
+    # Preço em vigor antes da primeira captura: ela só vira ponto se mudou
+    previous = repo.prices_before(pids, min(r[0] for r in runs))
+    histories = {pid: [] for pid in pids}
+    for pt in history_points(runs, previous):
+        histories[pt['pid']].append(pt)
+    counts = repo.replace_history(histories, [r[0] for r in runs])
+    repo.bump_history_generation()  # caches de histórico relêem os pontos reescritos
+    return {**counts, 'products': len(pids)}
+
+def archive_stats(capture_dir: str = CAPTURE_DIR) -> dict:
+    conn = connect(capture_dir)
+    try:
+        n, runs, raw = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT capture_id), COALESCE(SUM(size), 0) FROM captures").fetchone()
+        shas = [r[0] for r in conn.execute("SELECT DISTINCT sha256 FROM captures")]
+        first, last = conn.execute("SELECT MIN(captured_at), MAX(captured_at) FROM captures").fetchone()
+    finally:
+        conn.close()
+    stored = sum(os.path.getsize(p) for p in (find_blob(s, capture_dir) for s in shas) if p)
+    return {'captures': runs, 'files': n, 'blobs': len(shas), 'raw_bytes': raw,
+            'stored_bytes': stored, 'first': first, 'last': last}
+
+# -------- Main --------
+def parse_day(s: str) -> datetime:
+    return datetime.strptime(s, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Arquivo de capturas brutas e re-extração offline")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="tamanho do arquivo e deduplicação")
+    p_re = sub.add_parser("reextrair", help="refaz a extração sobre capturas de um período")
+    p_re.add_argument("--de", type=parse_day, help="data inicial (AAAA-MM-DD, UTC)")
+    p_re.add_argument("--ate", type=parse_day, help="data final, inclusive (AAAA-MM-DD, UTC)")
+    p_re.add_argument("--workers", type=int, default=WORKERS)
+    p_re.add_argument("--saida", help="grava os produtos re-extraídos em JSONL (uma linha por captura)")
+    p_re.add_argument("--backfill", action="store_true", help="regrava o histórico de preço do período a partir do resultado")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "status":
+        s = archive_stats()
+        ratio = s['raw_bytes'] / s['stored_bytes'] if s['stored_bytes'] else 0
+        print(f"Capturas: {s['captures']} ({s['files']} arquivos, {s['blobs']} blobs distintos)"
+              f" | {s['first'] or '—'} .. {s['last'] or '—'}")
+        print(f"Bruto: {s['raw_bytes'] / 1024 / 1024:.1f} MiB | em disco: {s['stored_bytes'] / 1024 / 1024:.1f} MiB"
+              f" ({ratio:.1f}x) | compressão: {'zstd' if zstandard else 'gzip'}")
+        return
+
+    until = args.ate + timedelta(days=1) if args.ate else None
+    captures = list_captures(args.de, until)
+    if not captures:
+        print("Nenhuma captura no período.")
+        return
+    r = reextract(captures, workers=args.workers)
+    n_products = sum(len(p) for _, _, p in r['runs'])
+    elapsed = max(r['elapsed_s'], 1e-9)
+    print(f"Re-extraídas {len(captures)} capturas ({r['pages']} páginas distintas, {r['cards']} cards,"
+          f" {n_products} produtos) em {elapsed:.2f}s com {args.workers} processos"
+          f" -> {len(captures) / elapsed:.1f} capturas/s ({r['pages'] / elapsed:.1f} páginas/s)")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            for at, capture_id, products in r['runs']:
+                f.write(json.dumps({'capture_id': capture_id, 'captured_at': at.isoformat(),
+                                    'products': products}, ensure_ascii=False) + "\n")
+        print(f"Produtos gravados em {args.saida}")
+
+    if args.backfill:
+        from lg1 import init_storage
+        from armazenamento import as_repository
+        started = time.perf_counter()
+        b = backfill_history(as_repository(init_storage()), r['runs'])
+        print(f"Histórico: {b['products']} produtos | {b['written']} pontos gravados | {b['deleted']} removidos |"
+              f" preço atual corrigido em {b['fixed']} | {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+    except Exception:
+        pass
+    main()
@@ -0,0 +1,535 @@
+# cargaSintetica.py
+# Cardápios sintéticos grandes e bancada de escala do pipeline
+# - Páginas com a mesma estrutura de classes do cardapioweb (NAME_SEL, PRICE_*_SEL, DESC_SEL),
+#   modal de promoção e carregamento preguiçoso (cards chegam via /menu.json ao rolar)
+# - Históricos de preço sintéticos (anos de pontos por produto)
+# - Servidor HTTP local; backend SQL temporário ou o emulador do Firestore
+# - Mesmo caminho do lg1.main: o que scrape_products retornou vai para o WAL + replay
+#   (batch_upsert_products), manifesto e checkpoint; depois as consultas do dashboard
+# - Contagem de operações (leituras, escritas, commits / comandos SQL) e curvas de
+#   tempo, memória e operações por tamanho do cardápio (CSV + gráfico HTML)
+#
+# Exemplo:
+#   python cargaSintetica.py servir --porta 8800            (abra /loja/5000 no navegador)
+#   python cargaSintetica.py escala --tamanhos 500,5000,50000 --backend sql --saida curvas.csv
+
+import os
+import sys
+import csv
+import json
+import html
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import urllib.request
+from urllib.parse import urlparse, parse_qs
+from datetime import datetime, timedelta, timezone
+
+# ---------------- Configurações ----------------
+CARDS_PER_CATEGORY = 25
+LAZY_CHUNK = 100  # cards por resposta do /menu.json (múltiplo de CARDS_PER_CATEGORY)
+FIRST_PAINT = 100  # cards já no HTML inicial
+DAILY_CHANGE_PROB = 0.03  # chance de um produto mudar de preço num dia
+PROMO_PROB = 0.2
+BASE_ONLY_PROB = 0.15  # card só com o preço "a partir de" (PRICE_BASE_SEL)
+
+ITEMS = ["Açaí", "Pizza", "Hambúrguer", "Combo", "Suco", "Batata", "Pastel", "Tapioca", "Salada", "Sorvete"]
+STYLES = ["Tradicional", "Especial", "da Casa", "Premium", "Light", "Duplo", "Kids", "Gourmet"]
+SIZES = ["300ml", "500ml", "700ml", "P", "M", "G", "Família", "Individual"]
+CATEGORIES = ["Promoções", "Açaís", "Lanches", "Bebidas", "Porções", "Sobremesas", "Combos", "Salgados"]
+
+# ---------------- Cardápio sintético ----------------
+def _rng(*key) -> random.Random:
+    # Determinístico por (semente, produto, dia): mesma página em qualquer processo
+    return random.Random(int.from_bytes(hashlib.blake2b(repr(key).encode(), digest_size=8).digest(), 'big'))
+
+def brl(v: float) -> str:
+    return f"R$ {v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def product_price(i: int, day: int, seed: int) -> float:
+    base = round(_rng(seed, i, 'base').uniform(6, 120), 1) - 0.1
+    price, r = base, _rng(seed, i, 'drift')
+    for _ in range(day):
+        if r.random() < DAILY_CHANGE_PROB:
+            price = round(base * r.uniform(0.85, 1.2), 1) - 0.1
+    return max(price, 0.9)
+
+def synthetic_cards(n: int, day: int = 0, seed: int = 1, start: int = 0, stop: int | None = None) -> list[dict]:
+    """Cards [start, stop) do cardápio de n produtos no 'day': textos como aparecem na página."""
+    cards = []
+    for i in range(start, min(n, stop if stop is not None else n)):
+        r = _rng(seed, i, 'card')
+        name = f"{r.choice(ITEMS)} {r.choice(STYLES)} {r.choice(SIZES)} nº {i}"
+        price = product_price(i, day, seed)
+        kind = r.random()
+        card = {'i': i, 'category': CATEGORIES[(i // CARDS_PER_CATEGORY) % len(CATEGORIES)],
+                'name': name, 'cur': '', 'prev': '', 'base': '',
+                'desc': f"{r.choice(STYLES)} com {r.choice(ITEMS).lower()} e complementos à escolha."}
+        if kind < BASE_ONLY_PROB:
+            card['base'] = f"A partir de {brl(price)}"
+        elif kind < BASE_ONLY_PROB + PROMO_PROB:
+            card['cur'], card['prev'] = brl(price), brl(round(price * 1.25, 2))
+        else:
+            card['cur'] = brl(price)
+        cards.append(card)
+    return cards
+
+def card_html(c: dict) -> str:
+    e = html.escape
+    if c['base']:
+        price = f'<div class="mt-3 text-base text-gray-700 md:mt-6">{e(c["base"])}</div>'
+    else:
+        prev = f'<span class="text-sm text-gray-500 line-through">{e(c["prev"])}</span> ' if c['prev'] else ''
+        price = f'<div class="mt-3 flex gap-2">{prev}<span class="text-base text-green-500">{e(c["cur"])}</span></div>'
+    return (
+        '<li class="border-b border-gray-200"><div class="flex cursor-pointer justify-between p-4">'
+        '<div class="flex flex-col">'
+        f'<h3 class="text-base font-medium leading-6 text-gray-700 line-clamp-2">{e(c["name"])}</h3>'
+        f'<p class="mt-1 text-sm font-light text-gray-500 line-clamp-3">{e(c["desc"])}</p>'
+        f'{price}</div><img class="h-24 w-24 rounded" alt="" src="data:,"></div></li>'
+    )
+
+def sections_html(cards: list[dict]) -> str:
+    """Agrupa em <section> por categoria (fatias alinhadas a CARDS_PER_CATEGORY)."""
+    out, current = [], None
+    for c in cards:
+        if c['category'] != current or c['i'] % CARDS_PER_CATEGORY == 0:
+            if current is not None:
+                out.append('</ul></section>')
+            current = c['category']
+            out.append(f'<section><h2 class="px-4 pt-6 text-lg font-semibold text-gray-900">{html.escape(current)}</h2>'
+                       '<ul role="list">')
+        out.append(card_html(c))
+    if current is not None:
+        out.append('</ul></section>')
+    return "".join(out)
+
+PAGE_TEMPLATE = """<!doctype html>
+<html lang="pt-BR"><head><meta charset="utf-8"><title>Loja sintética ({n} produtos)</title>
+<style>
+body {{ font-family: sans-serif; margin: 0; }}
+.z-30 {{ position: fixed; inset: 0; z-index: 30; background: rgba(0,0,0,.5); }}
+li {{ min-height: 120px; list-style: none; }}
+</style></head>
+<body>
+<div class="z-30 flex items-center justify-between p-4" id="promo">
+  <div class="rounded bg-white p-6">Promoção do dia! <button class="MuiButtonBase-root" aria-label="Close">X</button></div>
+</div>
+<main id="menu">{first}</main>
+<script>
+const TOTAL = {n}, CHUNK = {chunk};
+let next = {first_n}, loading = false;
+document.querySelector('#promo button').addEventListener('click', () => document.getElementById('promo').remove());
+async function more() {{
+  if (loading || next >= TOTAL) return;
+  loading = true;
+  const r = await fetch(`/menu.json?n=${{TOTAL}}&dia={day}&semente={seed}&offset=${{next}}&limit=${{CHUNK}}`);
+  const data = await r.json();
+  document.getElementById('menu').insertAdjacentHTML('beforeend', data.html);
+  next += data.count;
+  loading = false;
+  if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 2000) more();
+}}
+window.addEventListener('scroll', () => {{
+  if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 2000) more();
+}});
+</script>
+</body></html>"""
+
+def menu_page(n: int, day: int = 0, seed: int = 1) -> str:
+    first = synthetic_cards(n, day, seed, 0, FIRST_PAINT)
+    return PAGE_TEMPLATE.format(n=n, day=day, seed=seed, chunk=LAZY_CHUNK, first_n=len(first),
+                                first=sections_html(first))
+
+# ---------------- Servidor local ----------------
+def start_server(port: int = 0):
+    """/loja/<n>?dia=&semente= (página) e /menu.json (cards seguintes). Retorna (server, base_url)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            u = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(u.query).items()}
+            day, seed = int(q.get('dia', 0)), int(q.get('semente', 1))
+            if u.path.startswith('/loja/'):
+                body = menu_page(int(u.path.rsplit('/', 1)[-1]), day, seed).encode('utf-8')
+                ctype = 'text/html; charset=utf-8'
+            elif u.path == '/menu.json':
+                offset, limit = int(q.get('offset', 0)), int(q.get('limit', LAZY_CHUNK))
+                cards = synthetic_cards(int(q['n']), day, seed, offset, offset + limit)
+                body = json.dumps({'count': len(cards), 'html': sections_html(cards)}).encode('utf-8')
+                ctype = 'application/json'
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+# ---------------- Histórico sintético ----------------
+def synthetic_history(pids: list[str], days: int, changes_per_week: float = 1.0, seed: int = 1,
+                      end: datetime | None = None) -> list[dict]:
+    """Pontos {'pid', 'at', 'price'} em 'days' dias (mudanças ~Poisson por semana, horário comercial)."""
+    end = end or datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    rate = changes_per_week / 7 / 24  # por hora
+    points = []
+    for pid in pids:
+        r = _rng(seed, pid, 'hist')
+        price = round(r.uniform(6, 120), 1) - 0.1
+        at = start
+        points.append({'pid': pid, 'at': at, 'price': price})
+        while True:
+            at += timedelta(hours=r.expovariate(rate)) if rate > 0 else timedelta(days=days + 1)
+            if at >= end:
+                break
+            price = max(0.9, round(price * r.uniform(0.9, 1.15), 1) - 0.1)
+            points.append({'pid': pid, 'at': at.replace(minute=r.randrange(60)), 'price': price})
+    points.sort(key=lambda p: (p['pid'], p['at']))
+    return points
+
+# ---------------- Contagem de operações ----------------
+class OpCounter:
+    def __init__(self):
+        self.reads = self.writes = self.commits = self.queries = self.statements = 0
+
+    def snapshot(self) -> dict:
+        return {'reads': self.reads, 'writes': self.writes, 'commits': self.commits,
+                'queries': self.queries, 'statements': self.statements}
+
+def _unwrap(x):
+    if isinstance(x, _Counted):
+        return x._target
+    if isinstance(x, list):
+        return [_unwrap(i) for i in x]
+    return x
+
+class _Counted:
+    """Proxy de referências/consultas do Firestore: conta docs lidos por stream()/get()."""
+
+    def __init__(self, target, counter: OpCounter):
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        counter = self._counter
+
+        if name == 'stream':
+            def stream(*a, **k):
+                counter.queries += 1
+                for doc in attr(*a, **k):
+                    counter.reads += 1
+                    yield doc
+            return stream
+
+        def call(*a, **k):
+            res = attr(*[_unwrap(x) for x in a], **{key: _unwrap(v) for key, v in k.items()})
+            if name == 'get':
+                counter.reads += len(res) if isinstance(res, list) else 1
+                return res
+            if hasattr(res, 'stream') or hasattr(res, 'collection'):
+                return _Counted(res, counter)
+            return res
+        return call
+
+class _CountedBatch:
+    def __init__(self, batch, counter: OpCounter):
+        self._batch = batch
+        self._counter = counter
+
+    def set(self, ref, *a, **k):
+        self._counter.writes += 1
+        return self._batch.set(_unwrap(ref), *a, **k)
+
+    def update(self, ref, *a, **k):
+        self._counter.writes += 1
+        return self._batch.update(_unwrap(ref), *a, **k)
+
+    def delete(self, ref, *a, **k):
+        self._counter.writes += 1
+        return self._batch.delete(_unwrap(ref), *a, **k)
+
+    def commit(self, *a, **k):
+        self._counter.commits += 1
+        return self._batch.commit(*a, **k)
+
+class _CountedTransaction(_Counted):
+    """Transação (agregados de categoria): leituras, escritas e o commit feito pelo @transactional."""
+
+    def get_all(self, refs, *a, **k):
+        for snap in self._target.get_all(_unwrap(list(refs)), *a, **k):
+            self._counter.reads += 1
+            yield snap
+
+    def get(self, ref_or_query, *a, **k):
+        for snap in self._target.get(_unwrap(ref_or_query), *a, **k):
+            self._counter.reads += 1
+            yield snap
+
+    def set(self, ref, *a, **k):
+        self._counter.writes += 1
+        return self._target.set(_unwrap(ref), *a, **k)
+
+    def _commit(self):
+        self._counter.commits += 1
+        return self._target._commit()
+
+class CountingFirestore(_Counted):
+    """Cliente Firestore que conta leituras de documentos, escritas e commits (passe ao FirestoreRepository)."""
+
+    def get_all(self, refs, *a, **k):
+        for snap in self._target.get_all(_unwrap(list(refs)), *a, **k):
+            self._counter.reads += 1  # doc inexistente também é cobrado
+            yield snap
+
+    def batch(self):
+        return _CountedBatch(self._target.batch(), self._counter)
+
+    def transaction(self, **k):
+        return _CountedTransaction(self._target.transaction(**k), self._counter)
+
+def counting_sql(repo, counter: OpCounter):
+    """Conta comandos executados no SQLite (cada linha de um executemany conta uma vez)."""
+    def trace(_stmt):
+        counter.statements += 1
+    if hasattr(repo.conn, 'set_trace_callback'):
+        repo.conn.set_trace_callback(trace)
+    return repo
+
+# ---------------- Backends da bancada ----------------
+def reset_emulator():
+    host = os.environ["FIRESTORE_EMULATOR_HOST"]
+    project = os.getenv("GCLOUD_PROJECT", "demo-cardapio")
+    req = urllib.request.Request(
+        f"http://{host}/emulator/v1/projects/{project}/databases/(default)/documents", method="DELETE")
+    urllib.request.urlopen(req, timeout=30).close()
+
+def fresh_repository(backend: str, counter: OpCounter, workdir: str, tag: str):
+    """Repositório vazio para uma rodada (arquivo SQL novo ou emulador limpo)."""
+    from armazenamento import FirestoreRepository, SQLRepository, init_firestore
+    if backend == "sql":
+        return counting_sql(SQLRepository(path=os.path.join(workdir, f"{tag}.sqlite3")), counter)
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        raise SystemExit("Defina FIRESTORE_EMULATOR_HOST (ex.: gcloud emulators firestore start "
+                         "--host-port=localhost:8681) para usar o emulador.")
+    reset_emulator()
+    return FirestoreRepository(CountingFirestore(init_firestore(), counter))
+
+# ---------------- Bancada ----------------
+class Stage:
+    """Mede tempo, pico de memória Python alocada no trecho (tracemalloc) e operações."""
+
+    def __init__(self, rows: list, counter: OpCounter, **labels):
+        self.rows, self.counter, self.labels = rows, counter, labels
+        self.items = None
+
+    def __enter__(self):
+        self.before = self.counter.snapshot()
+        tracemalloc.reset_peak()
+        self.mem_before, _ = tracemalloc.get_traced_memory()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *_):
+        elapsed = time.perf_counter() - self.started
+        _, peak = tracemalloc.get_traced_memory()
+        after = self.counter.snapshot()
+        row = {**self.labels, 'seconds': round(elapsed, 4),
+               'peak_mb': round(max(peak - self.mem_before, 0) / 1024 / 1024, 2),
+               'items': self.items, 'error': exc_type.__name__ if exc_type else None}
+        row.update({k: after[k] - self.before[k] for k in after})
+        self.rows.append(row)
+        print(f"  {row['stage']:<22} n={row['size']:<7} lote={row.get('batch_size') or '-':<4} "
+              f"{elapsed:8.2f}s {row['peak_mb']:8.1f} MB  leituras={row['reads']} escritas={row['writes']} "
+              f"commits={row['commits']} sql={row['statements']} itens={self.items}", flush=True)
+        return exc_type is not None and not issubclass(exc_type, (KeyboardInterrupt, SystemExit))
+
+def run_scale(sizes: list[int], backend: str, batch_sizes: list[int], browser_max: int, history_days: int,
+              history_products: int, changes_per_week: float, seed: int = 1) -> list[dict]:
+    """
+    Mesmo caminho do lg1.main por tamanho: coleta (navegador até browser_max) -> WAL + replay com
+    batch_upsert_products -> manifesto -> checkpoint, em dois dias seguidos; depois o histórico
+    sintético e as consultas dos loaders do dashboard (agregados de categoria, diffs, cardápio em data).
+    """
+    import lg1
+    import wal
+    from analiseTempo import compare_menus, products_frame
+    from armazenamento import maybe_checkpoint, menu_as_of, slugify, update_manifest
+    from cacheHistorico import HistoryCache
+
+    rows, counter = [], OpCounter()
+    server, base = start_server()
+    workdir = tempfile.mkdtemp(prefix="carga-")
+    capture_dir = os.path.join(workdir, "capturas")  # capturas brutas da bancada fora do arquivo real
+    store = "carga"
+    # Duas coletas com um dia de distância: o checkpoint (CHECKPOINT_EVERY_HOURS) entra nas duas
+    t1 = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(minutes=5)
+    t0 = t1 - timedelta(days=1)
+    days = ((0, t0, 'novos'), (1, t1, 'dia_seguinte'))
+    tracemalloc.start()
+    try:
+        for n in sizes:
+            print(f"\n== {n} produtos ==")
+            url = f"{base}/loja/{n}?semente={seed}"
+
+            # 1) Navegador: scraping card a card (com captura bruta) e extração em JS (watch)
+            scraped = {}
+            if n <= browser_max:
+                for day, at, _ in days:
+                    with Stage(rows, counter, size=n, stage=f'scrape_products_dia{day}') as st:
+                        scraped[day] = lg1.scrape_products(headless=True, url=f"{url}&dia={day}", captured_at=at,
+                                                           capture_dir=capture_dir)
+                        st.items = len(scraped[day])
+                with Stage(rows, counter, size=n, stage='extracao_js') as st:
+                    from playwright.sync_api import sync_playwright
+                    with sync_playwright() as p:
+                        browser = p.chromium.launch(headless=True)
+                        page = browser.new_page()
+                        page.set_default_timeout(120000)
+                        lg1.load_menu(page, url=f"{url}&dia=0")
+                        st.items = lg1.extract_changed_cards(page, {})['total']
+                        browser.close()
+            # Acima de browser_max (ou se a coleta falhou): os mesmos textos dos cards pelo build_products
+            for day, _, _ in days:
+                if not scraped.get(day):
+                    cards = [(c['name'], c['cur'], c['prev'], c['base'], c['desc'], c['category'])
+                             for c in synthetic_cards(n, day, seed)]
+                    scraped[day] = [p for p in lg1.build_products(cards) if p]
+
+            # 2) Gravação como no lg1.main, por tamanho de lote: WAL + replay, manifesto e checkpoint
+            repo = None
+            for bs in batch_sizes:
+                repo = fresh_repository(backend, counter, workdir, f"n{n}-b{bs}")
+                wal_path = os.path.join(workdir, f"n{n}-b{bs}-wal.sqlite3")
+                for day, at, label in days:
+                    products, run_id, results = scraped[day], None, []
+                    with Stage(rows, counter, size=n, stage=f'upsert_{label}', batch_size=bs) as st:
+                        run_id = wal.append(products, scraped_at=at, store_url=url, path=wal_path)
+                        results = wal.replay(repo, lg1.batch_upsert_products, path=wal_path, batch_size=bs)[run_id]
+                        st.items = len(results) if day == 0 else sum(1 for r in results if r['changed'])
+                    with Stage(rows, counter, size=n, stage=f'manifesto_{label}', batch_size=bs) as st:
+                        menu = update_manifest(repo, store, products, run_id, now=at)
+                        st.items = len(menu['added']) + len(menu['removed']) + len(menu['changed'])
+                    with Stage(rows, counter, size=n, stage=f'checkpoint_{label}', batch_size=bs) as st:
+                        st.items = int(maybe_checkpoint(repo, store, results, at=at))
+
+            # 3) Histórico sintético (amostra de produtos, história longa) e leitores do dashboard
+            sample = [slugify(p['name']) for p in scraped[0][:history_products]]
+            points = synthetic_history(sample, history_days, changes_per_week, seed, end=t0)
+            with Stage(rows, counter, size=n, stage='carga_historico') as st:
+                st.items = repo.write_history(points)
+            # Mesmas consultas dos loaders do dashboard.py (load_products, load_categories,
+            # load_menu_diffs, load_menu_as_of), sem o Streamlit
+            with Stage(rows, counter, size=n, stage='list_products') as st:
+                docs = repo.list_products(since=None, limit=None, listed_only=True)
+                st.items = len(docs)
+            with Stage(rows, counter, size=n, stage='products_frame') as st:
+                st.items = len(products_frame(docs, search="açaí"))
+            with Stage(rows, counter, size=n, stage='list_categories') as st:
+                st.items = sum(c['count'] for c in repo.list_categories())
+            with Stage(rows, counter, size=n, stage='menu_diffs') as st:
+                st.items = len(repo.menu_diffs(limit=10))
+            with Stage(rows, counter, size=n, stage='menu_as_of') as st:
+                times = [t0 + timedelta(hours=12), t1 + timedelta(minutes=1)]
+                res = menu_as_of(repo, store, times)
+                st.items = len(compare_menus(res[times[0]]['menu'], res[times[1]]['menu']))
+            with Stage(rows, counter, size=n, stage='price_history') as st:
+                st.items = sum(len(repo.price_history(pid)) for pid in sample[:50])
+            cache = HistoryCache(repo.price_history, ttl=3600, generation=repo.history_generation)
+            with Stage(rows, counter, size=n, stage='cache_frio') as st:
+                st.items = sum(len(cache.get(pid)[0]) for pid in sample[:50])
+            with Stage(rows, counter, size=n, stage='cache_quente') as st:
+                since = t1 - timedelta(days=30)
+                st.items = sum(len(cache.get(pid, since=since)[0]) for pid in sample[:50])
+    finally:
+        tracemalloc.stop()
+        server.shutdown()
+    return rows
+
+FIELDS = ['size', 'stage', 'batch_size', 'seconds', 'peak_mb', 'reads', 'writes', 'commits', 'queries',
+          'statements', 'items', 'error']
+
+def write_csv(rows: list[dict], path: str):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=FIELDS, extrasaction='ignore')
+        w.writeheader()
+        w.writerows(rows)
+
+def write_chart(rows: list[dict], path: str):
+    import pandas as pd
+    import plotly.express as px
+    df = pd.DataFrame(rows)
+    df['etapa'] = df['stage'] + df['batch_size'].map(lambda b: f" (lote {int(b)})" if pd.notna(b) else "")
+    parts = []
+    for metric, label in (('seconds', 'Tempo (s)'), ('peak_mb', 'Pico de memória Python (MB)'),
+                          ('reads', 'Leituras'), ('writes', 'Escritas')):
+        fig = px.line(df, x='size', y=metric, color='etapa', markers=True, log_x=True, title=label,
+                      labels={'size': 'Produtos no cardápio', metric: label})
+        parts.append(fig.to_html(full_html=False, include_plotlyjs='cdn' if not parts else False))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<html><head><meta charset='utf-8'></head><body>" + "".join(parts) + "</body></html>")
+
+# -------- Main --------
+def int_list(s: str) -> list[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cardápios sintéticos e bancada de escala")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_srv = sub.add_parser("servir", help="sobe o servidor de páginas sintéticas")
+    p_srv.add_argument("--porta", type=int, default=8800)
+    p_esc = sub.add_parser("escala", help="roda o pipeline em vários tamanhos e gera as curvas")
+    p_esc.add_argument("--tamanhos", type=int_list, default=[500, 5000, 50000])
+    p_esc.add_argument("--backend", choices=["sql", "emulador"], default="sql")
+    p_esc.add_argument("--lotes", type=int_list, default=[200, 400], help="batch_size do upsert")
+    p_esc.add_argument("--max-navegador", type=int, default=2000,
+                       help="maior cardápio que passa pelo navegador (scraping card a card é lento)")
+    p_esc.add_argument("--dias", type=int, default=730, help="dias de histórico sintético")
+    p_esc.add_argument("--produtos-historico", type=int, default=200)
+    p_esc.add_argument("--mudancas-semana", type=float, default=1.0)
+    p_esc.add_argument("--saida", default="curvas_escala.csv")
+    p_esc.add_argument("--grafico", default="curvas_escala.html")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "servir":
+        server, base = start_server(args.porta)
+        print(f"Páginas em {base}/loja/<n>?dia=<d>&semente=<s> (Ctrl+C para sair)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    rows = run_scale(args.tamanhos, "sql" if args.backend == "sql" else "firestore", args.lotes,
+                     args.max_navegador, args.dias, args.produtos_historico, args.mudancas_semana)
+    write_csv(rows, args.saida)
+    print(f"\nCurvas em {args.saida}")
+    if args.grafico:
+        write_chart(rows, args.grafico)
+        print(f"Gráfico em {args.grafico}")
+
+
+if __name__ == "__main__":
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+    except Exception:
+        pass
+    main()
@@ -3,11 +3,13 @@
 # - Lista produtos com filtros
 # - Destaque de variações
 # - Histórico de preço por produto (gráfico)
-# - Botão para rodar o scraping (chama lg1.py)
+# - Botão para rodar o scraping (chama lg1.py em segundo plano, ver tarefas.py)
 
 import os
-import sys
-from datetime import datetime, timedelta, timezone
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone, time as dtime
 import numpy as np
 
 
@@ -19,6 +21,12 @@ import streamlit as st
 import firebase_admin
 from firebase_admin import credentials, firestore
 
+from analiseTempo import compare_menus, menu_frame, products_frame
+from armazenamento import (BACKEND, FirestoreRepository, SQLRepository, menu_as_of, slugify,
+                           store_key)
+from cacheHistorico import HistoryCache
+from tarefas import ScrapeJobManager, DEFAULT_STORE_URL
+
 # ------------- Config -------------
 PROJECT_TITLE = "Acompanhamento de Preços - Cardápio"
 DEFAULT_LIMIT = 300
@@ -42,8 +50,14 @@ def init_firestore():
         st.error(f"Falha ao inicializar Firestore: {e}")
         st.stop()
      
+@st.cache_resource(show_spinner=False)
+def init_repository():
+    # STORAGE_BACKEND=sql lê do banco local em vez do Firestore
+    if BACKEND == "sql":
+        return SQLRepository()
+    return FirestoreRepository(init_firestore())
 
-db = init_firestore()
+repo = init_repository()
 
 # ------------- Helpers -------------
 def ts_to_dt(x):
@@ -53,20 +67,20 @@ def ts_to_dt(x):
         return x
 
 @st.cache_data(show_spinner=False, ttl=30)
-def load_products(hours: int | None, only_changed: bool, search: str | None):
-    col = db.collection('products')
+def load_products(hours: int | None, only_changed: bool, search: str | None, include_delisted: bool = False,
+                  category: str | None = None):
     docs = []
 
     try:
+        since = None
         if hours and hours > 0:
-            cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
-            q = col.where('last_seen_at', '>=', cutoff)
-        else:
-            q = col.limit(DEFAULT_LIMIT)
+            since = datetime.now(timezone.utc) - timedelta(hours=hours)
 
-        for d in q.stream():
-            row = d.to_dict()
-            for key in ('last_seen_at', 'price_changed_at', 'created_at'):
+        # Fora do cardápio (delisted_at, ver armazenamento.update_manifest) e categoria:
+        # filtrados na consulta, antes do limite
+        for row in repo.list_products(since=since, limit=DEFAULT_LIMIT, listed_only=not include_delisted,
+                                      category=category):
+            for key in ('last_seen_at', 'price_changed_at', 'created_at', 'delisted_at'):
                 if key in row and row[key] is not None:
                     row[key] = ts_to_dt(row[key])
             docs.append(row)
@@ -74,71 +88,67 @@ def load_products(hours: int | None, only_changed: bool, search: str | None):
         st.error(f"Erro ao ler produtos: {e}")
         return pd.DataFrame()
 
-    if not docs:
-        return pd.DataFrame()
+    return products_frame(docs, search)
 
-    df = pd.DataFrame(docs)
-    # Garantir numérico
-    df['current_price'] = pd.to_numeric(df.get('current_price', 0), errors='coerce')
-    df['last_price'] = pd.to_numeric(df.get('last_price', np.nan), errors='coerce')
-    # Fallback: se last_price ausente, usa o current_price
-    df['last_price'] = df['last_price'].fillna(df['current_price'])
-    # Cálculos
-    df['delta'] = (df['current_price'] - df['last_price'])
-    df['delta_pct'] = np.where(
-        df['last_price'] > 0,
-        (df['delta'] / df['last_price']) * 100,
-        np.nan
-    )
-    # Filtro: busca por nome
-    if search:
-        s = search.strip().lower()
-        if 'name' in df.columns:
-            df = df[df['name'].str.lower().str.contains(s, na=False)]
+@st.cache_data(show_spinner=False, ttl=60)
+def load_menu_diffs(limit: int = 10) -> list[dict]:
+    try:
+        return repo.menu_diffs(limit=limit)
+    except Exception as e:
+        st.error(f"Erro ao ler mudanças do cardápio: {e}")
+        return []
 
-    return df.reset_index(drop=True)
+@st.cache_data(show_spinner=False, ttl=60)
+def load_categories() -> list[dict]:
+    # Agregados prontos (um doc por categoria): não lê os produtos
+    try:
+        return repo.list_categories()
+    except Exception as e:
+        st.error(f"Erro ao ler categorias: {e}")
+        return []
 
-@st.cache_data(show_spinner=False, ttl=30)
-def load_price_history(product_name: str, hours: int | None = None) -> pd.DataFrame:
-    from unicodedata import normalize
-    import re as regex
+@st.cache_data(show_spinner=False, ttl=300)
+def load_menu_as_of(times: tuple[datetime, ...]) -> dict:
+    # Checkpoint mais próximo + replay curto (armazenamento.menu_as_of)
+    try:
+        return menu_as_of(repo, store_key(DEFAULT_STORE_URL), list(times))
+    except Exception as e:
+        st.error(f"Erro ao reconstruir o cardápio: {e}")
+        return {}
 
-    def slugify(text: str) -> str:
-        text = normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
-        text = regex.sub(r'[^a-zA-Z0-9]+', '-', text).strip('-').lower()
-        return text
+@st.cache_resource(show_spinner=False)
+def get_history_cache() -> HistoryCache:
+    # Um cache por processo, compartilhado entre sessões e períodos
+    return HistoryCache(repo.price_history, generation=repo.history_generation)
 
+def load_price_history(product_name: str, hours: int | None = None) -> pd.DataFrame:
     pid = slugify(product_name)
-    ref = db.collection('products').document(pid).collection('prices')
-    q = ref.order_by('at')
+    since = None
     if hours and hours > 0:
-        cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
-        q = q.where('at', '>=', cutoff)
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
 
-    rows = []
     try:
-        for s in q.stream():
-            d = s.to_dict()
-            at = ts_to_dt(d.get('at'))
-            price = float(d.get('price', 0.0))
-            rows.append({'at': at, 'price': price})
+        at, price = get_history_cache().get(pid, since=since)
     except Exception as e:
         st.error(f"Erro ao ler histórico: {e}")
         return pd.DataFrame()
 
-    df = pd.DataFrame(rows)
-    if not df.empty:
-        df = df.sort_values('at').reset_index(drop=True)
-    return df
+    if len(at) == 0:
+        return pd.DataFrame()
+    return pd.DataFrame({'at': at, 'price': price})
 
-def arrow(delta: float) -> str:
-    if pd.isna(delta):
-        return "—"
-    if delta > 0:
-        return "↑"
-    if delta < 0:
-        return "↓"
-    return "—"
+@st.cache_resource(show_spinner=False)
+def get_job_manager() -> ScrapeJobManager:
+    # Compartilhado entre sessões: um único scraping por loja, mesmo com vários usuários
+    history_cache = get_history_cache()
+
+    def invalidate_caches(job):
+        if job.outcome == "concluído":
+            load_products.clear()
+            load_menu_diffs.clear()
+            load_categories.clear()
+            history_cache.expire()
+    return ScrapeJobManager(on_finish=[invalidate_caches])
 
 # ------------- UI -------------
 st.set_page_config(page_title=PROJECT_TITLE, layout="wide")
@@ -187,111 +197,333 @@ hours_label = st.sidebar.selectbox("Período", list(hours_map.keys()), index=0)
 hours = hours_map[hours_label]
 only_changed = st.sidebar.checkbox("Somente itens que mudaram", value=False)
 search_term = st.sidebar.text_input("Buscar por nome (contém):", value="")
+include_delisted = st.sidebar.checkbox("Incluir itens fora do cardápio", value=False)
+category_ids = {c['name']: c['id'] for c in load_categories() if c.get('count')}
+category_label = st.sidebar.selectbox("Categoria", ["Todas"] + sorted(category_ids))
+category = category_ids.get(category_label)
+category_name = category_label if category else None
 
 # Ações
-colA, colB = st.sidebar.columns(2)
-with colA:
+with st.sidebar:
     refresh = st.button("Atualizar")
-with colB:
-    run_scrape = st.button("Rodar scraping")
-
-# Rodar scraping (executa lg1.py)
-if run_scrape:
-    with st.spinner("Executando scraping..."):
-        try:
-            import subprocess
-            cmd = [sys.executable, "lg1.py"]  # usa o Python do venv atual
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            st.success("Scraping concluído.")
-            with st.expander("Saída do scraping"):
-                st.code(result.stdout or "(sem stdout)")
-                if result.stderr:
-                    st.error(result.stderr)
-        except subprocess.TimeoutExpired:
-            st.error("Scraping demorou demais (timeout).")
-        except Exception as e:
-            st.error(f"Erro ao rodar scraping: {e}")
-
-# Carrega dados
-with st.spinner("Carregando produtos..."):
-    df = load_products(hours, only_changed, search_term)
-
-if df.empty:
-    st.warning("Nenhum produto encontrado com os filtros aplicados.")
-    st.stop()
 
-# KPI cards
-kpi1, kpi2, kpi3, kpi4 = st.columns(4)
-total = len(df)
-mudaram = df['delta'].fillna(0).ne(0).sum()
-maior_alta = df.sort_values('delta', ascending=False).head(1)
-maior_queda = df.sort_values('delta', ascending=True).head(1)
-
-kpi1.metric("Produtos listados", f"{total}")
-kpi2.metric("Mudanças no período", f"{mudaram}")
-if not maior_alta.empty:
-    kpi3.metric("Maior alta (R$)", f"{maior_alta.iloc[0]['delta']:.2f}", delta=f"{maior_alta.iloc[0]['name']}")
-else:
-    kpi3.metric("Maior alta (R$)", "—")
-if not maior_queda.empty:
-    kpi4.metric("Maior queda (R$)", f"{maior_queda.iloc[0]['delta']:.2f}", delta=f"{maior_queda.iloc[0]['name']}")
-else:
-    kpi4.metric("Maior queda (R$)", "—")
-
-# Tabela resumida
-show_cols = ['name', 'current_price', 'last_price', 'delta', 'delta_pct', 'last_seen_at', 'price_changed_at']
-for c in show_cols:
-    if c not in df.columns:
-        df[c] = pd.NA
-
-df_view = df[show_cols].copy()
-df_view['delta_fmt'] = df_view['delta'].apply(lambda d: f"{arrow(d)} {d:.2f}" if pd.notna(d) else "—")
-df_view['delta_pct_fmt'] = df_view['delta_pct'].apply(lambda p: f"{p:+.2f}%" if pd.notna(p) else "—")
-
-st.subheader("Produtos")
-st.caption("Delta = Atual - Último. Seta indica direção (+↑, -↓).")
-st.dataframe(
-    df_view.rename(columns={
-        'name': 'Nome',
-        'current_price': 'Preço Atual (R$)',
-        'last_price': 'Último Preço (R$)',
-        'delta_fmt': 'Delta',
-        'delta_pct_fmt': 'Delta %',
-        'last_seen_at': 'Visto em',
-        'price_changed_at': 'Mudou em'
-    })[['Nome','Preço Atual (R$)','Último Preço (R$)','Delta','Delta %','Visto em','Mudou em']],
-    use_container_width=True,
-    hide_index=True
-)
-
-# Seletor de produto para histórico
-st.subheader("Histórico de preço por produto")
-sel_name = st.selectbox(
-    "Escolha o produto",
-    options=df['name'].tolist(),
-    index=0 if not df.empty else None
-)
+# ------------- Desempenho -------------
+LATENCY_WINDOW = 200
 
+@contextmanager
+def measure(section: str):
+    """Guarda a duração de cada execução da seção (para p95 por interação)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        lat = st.session_state.setdefault("latencias", {})
+        lat.setdefault(section, deque(maxlen=LATENCY_WINDOW)).append((time.perf_counter() - started) * 1000)
+
+def latency_summary() -> pd.DataFrame:
+    rows = []
+    for section, values in st.session_state.get("latencias", {}).items():
+        arr = np.fromiter(values, dtype=float)
+        rows.append({
+            'Seção': section,
+            'Execuções': len(arr),
+            'p50 (ms)': round(float(np.percentile(arr, 50)), 1),
+            'p95 (ms)': round(float(np.percentile(arr, 95)), 1),
+        })
+    return pd.DataFrame(rows)
+
+page_started = time.perf_counter()
+
+# ------------- Scraping (fragmento) -------------
+# Rodar scraping (enfileira lg1.py em segundo plano)
+jobs = get_job_manager()
+
+@st.fragment(run_every=1)
+def scrape_job_panel(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return
+    info = job.snapshot()
+    with st.expander(f"Scraping: {info['status']}", expanded=job.active):
+        st.progress(info['progress'])
+        st.code(info['output'] or "(sem saída ainda)")
+    if not job.active:
+        # Recarrega a página inteira com o cache já invalidado
+        st.rerun()
+
+def scrape_job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return
+    info = job.snapshot()
+    if info['status'] == "concluído":
+        st.success("Scraping concluído.")
+    elif info['status'] == "timeout":
+        st.error("Scraping demorou demais (timeout).")
+    else:
+        st.error(f"Erro ao rodar scraping (código {info['returncode']}).")
+    with st.expander("Saída do scraping"):
+        st.code(info['output'] or "(sem stdout)")
+
+@st.fragment
+def scrape_controls():
+    with measure("scraping"):
+        if st.button("Rodar scraping"):
+            job, created = jobs.submit(DEFAULT_STORE_URL)
+            st.session_state["scrape_job_id"] = job.id
+            if not created:
+                st.info("Já existe um scraping em andamento; acompanhando o mesmo job.")
+
+        job_id = st.session_state.get("scrape_job_id")
+        current = jobs.get(job_id) or jobs.latest(DEFAULT_STORE_URL)
+        if current is not None and current.active:
+            scrape_job_panel(current.id)
+        elif job_id is not None:
+            scrape_job_result(job_id)
+
+with st.sidebar:
+    scrape_controls()
+
+# ------------- Produtos e KPIs (fragmento) -------------
+def format_deltas(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Delta com seta e delta % formatados, vetorizado (sem apply por linha)."""
+    d = pd.to_numeric(df['delta'], errors='coerce').to_numpy(dtype=float)
+    p = pd.to_numeric(df['delta_pct'], errors='coerce').to_numpy(dtype=float)
+    arrows = np.select([d > 0, d < 0], ["↑", "↓"], default="—")
+    delta_fmt = np.char.add(np.char.add(arrows, " "), np.char.mod("%.2f", np.nan_to_num(d)))
+    delta_fmt = np.where(np.isnan(d), "—", delta_fmt)
+    pct_fmt = np.where(np.isnan(p), "—", np.char.add(np.char.mod("%+.2f", np.nan_to_num(p)), "%"))
+    return delta_fmt, pct_fmt
+
+@st.fragment
+def products_section(hours: int | None, only_changed: bool, search: str | None, include_delisted: bool,
+                     category: str | None):
+    with measure("produtos"):
+        with st.spinner("Carregando produtos..."):
+            df = load_products(hours, only_changed, search, include_delisted, category)
+
+        if df.empty:
+            st.warning("Nenhum produto encontrado com os filtros aplicados.")
+            return
+
+        # KPI cards
+        kpi1, kpi2, kpi3, kpi4 = st.columns(4)
+        total = len(df)
+        delta = df['delta'].fillna(0)
+        mudaram = delta.ne(0).sum()
+        # idxmax/idxmin: O(n), sem ordenar a tabela inteira
+        maior_alta = df.loc[[df['delta'].idxmax()]] if df['delta'].notna().any() else df.head(0)
+        maior_queda = df.loc[[df['delta'].idxmin()]] if df['delta'].notna().any() else df.head(0)
+
+        kpi1.metric("Produtos listados", f"{total}")
+        kpi2.metric("Mudanças no período", f"{mudaram}")
+        if not maior_alta.empty:
+            kpi3.metric("Maior alta (R$)", f"{maior_alta.iloc[0]['delta']:.2f}", delta=f"{maior_alta.iloc[0]['name']}")
+        else:
+            kpi3.metric("Maior alta (R$)", "—")
+        if not maior_queda.empty:
+            kpi4.metric("Maior queda (R$)", f"{maior_queda.iloc[0]['delta']:.2f}", delta=f"{maior_queda.iloc[0]['name']}")
+        else:
+            kpi4.metric("Maior queda (R$)", "—")
+
+        # Tabela resumida
+        show_cols = ['name', 'category', 'current_price', 'last_price', 'delta', 'delta_pct', 'last_seen_at',
+                     'price_changed_at', 'price_flag', 'pending_price', 'delisted_at']
+        df_view = df.reindex(columns=show_cols)
+        df_view['delta_fmt'], df_view['delta_pct_fmt'] = format_deltas(df_view)
+        # Alerta: flag da ingestão (anomalias.py) e preço retido aguardando confirmação
+        pending = pd.to_numeric(df_view['pending_price'], errors='coerce')
+        df_view['alerta'] = df_view['price_flag'].fillna('').astype(str).where(
+            pending.isna(), 'retido: R$ ' + pending.map('{:.2f}'.format))
+
+        st.subheader("Produtos")
+        st.caption("Delta = Atual - Último. Seta indica direção (+↑, -↓). "
+                   "Alerta = preço sinalizado na coleta (anomalia/erro_extracao) ou retido até se confirmar.")
+        st.dataframe(
+            df_view.rename(columns={
+                'name': 'Nome',
+                'category': 'Categoria',
+                'current_price': 'Preço Atual (R$)',
+                'last_price': 'Último Preço (R$)',
+                'delta_fmt': 'Delta',
+                'delta_pct_fmt': 'Delta %',
+                'last_seen_at': 'Visto em',
+                'price_changed_at': 'Mudou em',
+                'alerta': 'Alerta',
+                'delisted_at': 'Fora do cardápio desde'
+            })[['Nome','Categoria','Preço Atual (R$)','Último Preço (R$)','Delta','Delta %','Visto em','Mudou em','Alerta']
+               + (['Fora do cardápio desde'] if include_delisted else [])],
+            use_container_width=True,
+            hide_index=True
+        )
+
+# ------------- Categorias (fragmento) -------------
+@st.fragment
+def categories_section(category: str | None):
+    with measure("categorias"):
+        cats = [c for c in load_categories() if c.get('count')]
+        if not cats:
+            return
+        st.subheader("Categorias")
+        df = pd.DataFrame(cats)
+        df['promo_pct'] = (df['promo_count'] / df['count'] * 100).round(1)
+        st.dataframe(df.sort_values('name').rename(columns={
+            'name': 'Categoria',
+            'count': 'Produtos',
+            'min_price': 'Mín (R$)',
+            'avg_price': 'Média (R$)',
+            'max_price': 'Máx (R$)',
+            'promo_count': 'Em promoção',
+            'promo_pct': '% promoção',
+        })[['Categoria', 'Produtos', 'Mín (R$)', 'Média (R$)', 'Máx (R$)', 'Em promoção', '% promoção']],
+            use_container_width=True, hide_index=True)
+
+        selected = next((c for c in cats if c['id'] == category), None)
+        if selected is not None:
+            st.caption(f"Últimas mudanças de preço em {selected['name']}")
+            changes = selected.get('recent_changes') or []
+            if not changes:
+                st.caption("Nenhuma mudança registrada ainda.")
+            else:
+                st.dataframe(pd.DataFrame([{
+                    'Produto': c['name'],
+                    'De (R$)': c['prev_price'],
+                    'Para (R$)': c['price'],
+                    'Em': ts_to_dt(c['at']),
+                } for c in reversed(changes)]), use_container_width=True, hide_index=True)
+
+# ------------- Histórico (fragmento) -------------
 hist_hours_map = {
     "Últimos 7 dias": 24*7,
     "Últimos 30 dias": 24*30,
     "Tudo": None
 }
-hist_label = st.radio("Período do histórico", list(hist_hours_map.keys()), horizontal=True, index=1)
-hist_hours = hist_hours_map[hist_label]
-
-with st.spinner("Carregando histórico..."):
-    hdf = load_price_history(sel_name, hist_hours)
-
-if hdf.empty:
-    st.info("Sem histórico para este produto no período selecionado.")
-else:
-    fig = px.line(
-        hdf, x='at', y='price', markers=True,
-        title=f"Histórico - {sel_name}",
-        labels={'at': 'Data/Hora', 'price': 'Preço (R$)'}
-    )
-    fig.update_layout(height=420, margin=dict(l=20, r=20, t=50, b=20))
-    st.plotly_chart(fig, use_container_width=True)
+
+@st.fragment
+def history_section(hours: int | None, only_changed: bool, search: str | None, include_delisted: bool,
+                    category: str | None):
+    # Trocar produto/período reexecuta só este fragmento
+    with measure("histórico"):
+        names = load_products(hours, only_changed, search, include_delisted, category)
+        if names.empty:
+            return
+        names = names['name'].tolist()
+
+        # Seletor de produto para histórico
+        st.subheader("Histórico de preço por produto")
+        sel_name = st.selectbox("Escolha o produto", options=names, index=0)
+        hist_label = st.radio("Período do histórico", list(hist_hours_map.keys()), horizontal=True, index=1)
+        hist_hours = hist_hours_map[hist_label]
+
+        with st.spinner("Carregando histórico..."):
+            hdf = load_price_history(sel_name, hist_hours)
+
+        if hdf.empty:
+            st.info("Sem histórico para este produto no período selecionado.")
+        else:
+            fig = px.line(
+                hdf, x='at', y='price', markers=True,
+                title=f"Histórico - {sel_name}",
+                labels={'at': 'Data/Hora', 'price': 'Preço (R$)'}
+            )
+            fig.update_layout(height=420, margin=dict(l=20, r=20, t=50, b=20))
+            st.plotly_chart(fig, use_container_width=True)
+
+# ------------- Cardápio em uma data (fragmento) -------------
+def as_of_instant(d: date, t: dtime) -> datetime:
+    return datetime.combine(d, t, tzinfo=timezone.utc)
+
+@st.fragment
+def as_of_section():
+    with measure("cardápio em data"):
+        st.subheader("Cardápio em uma data")
+        compare = st.radio("Modo", ["Uma data", "Comparar duas datas"], horizontal=True) == "Comparar duas datas"
+        today = datetime.now(timezone.utc).date()
+        col_a, col_b = st.columns(2)
+        d_a = col_a.date_input("Data" if not compare else "Data A", value=today - timedelta(days=7),
+                               max_value=today, key="asof_d_a")
+        t_a = col_a.time_input("Hora (UTC)", value=dtime(23, 59), key="asof_t_a")
+        times = [as_of_instant(d_a, t_a)]
+        if compare:
+            d_b = col_b.date_input("Data B", value=today, max_value=today, key="asof_d_b")
+            t_b = col_b.time_input("Hora (UTC) ", value=dtime(23, 59), key="asof_t_b")
+            times.append(as_of_instant(d_b, t_b))
+
+        with st.spinner("Reconstruindo cardápio..."):
+            res = load_menu_as_of(tuple(times))
+        if not res:
+            return
+        for t in times:
+            r = res[t]
+            st.caption(f"{t:%d/%m/%Y %H:%M} UTC: checkpoint {ts_to_dt(r['checkpoint_at'])};"
+                       f" {r['replayed']} eventos reaplicados.")
+
+        if not compare:
+            df = menu_frame(res[times[0]]['menu'])
+            st.metric("Produtos no cardápio", f"{len(df)}")
+            st.dataframe(df.rename(columns={'name': 'Nome', 'price': 'Preço (R$)'})[['Nome', 'Preço (R$)']],
+                         use_container_width=True, hide_index=True)
+            return
+
+        df = compare_menus(res[times[0]]['menu'], res[times[1]]['menu'])
+        counts = df['status'].value_counts()
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("Mudaram", f"{counts.get('mudou', 0)}")
+        k2.metric("Novos", f"{counts.get('novo', 0)}")
+        k3.metric("Removidos", f"{counts.get('removido', 0)}")
+        k4.metric("Iguais", f"{counts.get('igual', 0)}")
+        only_diff = st.checkbox("Somente diferenças", value=True, key="asof_only_diff")
+        if only_diff:
+            df = df[df['status'] != 'igual']
+        df = df.copy()
+        df['delta_fmt'], df['delta_pct_fmt'] = format_deltas(df)
+        st.dataframe(df.rename(columns={
+            'name': 'Nome', 'price_a': 'Preço A (R$)', 'price_b': 'Preço B (R$)',
+            'delta_fmt': 'Delta', 'delta_pct_fmt': 'Delta %', 'status': 'Situação',
+        })[['Nome', 'Preço A (R$)', 'Preço B (R$)', 'Delta', 'Delta %', 'Situação']],
+            use_container_width=True, hide_index=True)
+
+categories_section(category)
+products_section(hours, only_changed, search_term, include_delisted, category_name)
+history_section(hours, only_changed, search_term, include_delisted, category_name)
+as_of_section()
+
+# ------------- Cardápio: entradas e saídas -------------
+with st.expander("Mudanças no cardápio (últimas execuções)"):
+    diffs = load_menu_diffs()
+    if not diffs:
+        st.caption("Nenhuma execução completa registrada ainda.")
+    else:
+        st.dataframe(pd.DataFrame([{
+            'Execução': d.get('run_id'),
+            'Em': ts_to_dt(d.get('at')),
+            'Produtos': d.get('total'),
+            'Entraram': len(d.get('added') or []),
+            'Saíram': len(d.get('removed') or []),
+            'Alterados': len(d.get('changed') or []),
+            'Iguais': d.get('unchanged'),
+        } for d in diffs]), hide_index=True, use_container_width=True)
+        last = diffs[0]
+        col_in, col_out = st.columns(2)
+        col_in.caption("Entraram na última execução")
+        col_in.write(", ".join(last.get('added') or []) or "—")
+        col_out.caption("Saíram na última execução")
+        col_out.write(", ".join(last.get('removed') or []) or "—")
 
 st.caption("Atualize o scraping pelo botão na barra lateral para refletir os preços mais recentes.")
+
+with st.expander("Desempenho"):
+    lat = st.session_state.setdefault("latencias", {})
+    lat.setdefault("página (completa)", deque(maxlen=LATENCY_WINDOW)).append(
+        (time.perf_counter() - page_started) * 1000)
+    st.caption("Duração de cada execução por seção nesta sessão (interações reexecutam só a seção).")
+    st.dataframe(latency_summary(), hide_index=True)
+
+    cs = get_history_cache().stats()
+    st.caption(
+        f"Cache de histórico: {cs['products']} produtos | {cs['points']} pontos | "
+        f"{cs['bytes'] / 1024:.1f} KiB de {cs['max_bytes'] / 1024 / 1024:.0f} MiB | "
+        f"acertos {cs['hit_rate'] if cs['hit_rate'] is not None else '—'} | "
+        f"refresh último {cs['refresh_ms_last']} ms, médio {cs['refresh_ms_avg'] or '—'} ms | "
+        f"despejos {cs['evictions']}"
+    )
@@ -3,10 +3,12 @@
 # Filtragem de itens indesejados e modal de promoções fechada automaticamente.
 
 import os
+import hashlib
 import re as regex
 import unicodedata
 from datetime import datetime, timezone
 import sys
+import time
 try:
     sys.stdout.reconfigure(encoding="utf-8")
     sys.stderr.reconfigure(encoding="utf-8")
@@ -16,19 +18,19 @@ except Exception:
 # Firestore Admin SDK
 import firebase_admin
 from firebase_admin import credentials, firestore
-from google.api_core.retry import Retry
-try:
-    from google.api_core.exceptions import DeadlineExceeded, GoogleAPIError
-except Exception:
-    class DeadlineExceeded(Exception): ...
-    class GoogleAPIError(Exception): ...
-from google.cloud.firestore_v1 import Increment
 
 # Playwright
 from playwright.sync_api import sync_playwright
 
+import wal
+import precos
+import capturas
+import notificacoes
+from anomalias import MIN_PRICE_CONFIDENCE
+from armazenamento import BACKEND, SQLRepository, as_repository, maybe_checkpoint, store_key, update_manifest
+
 # ---------------- Configurações ----------------
-URL = "https://app.cardapioweb.com/acai_moto_food"
+URL = os.getenv("STORE_URL", "https://app.cardapioweb.com/acai_moto_food")
 
 # Seletores do produto (CSS)
 NAME_SEL = 'h3.text-base.font-medium.leading-6.text-gray-700.line-clamp-2'
@@ -37,11 +39,14 @@ PRICE_CURRENT_SEL = 'span.text-base.text-green-500'
 PRICE_PREV_SEL = 'span.text-sm.text-gray-500.line-through'
 # Em CSS, ':' precisa ser escapado:
 PRICE_BASE_SEL = 'div.mt-3.text-base.text-gray-700.md\\:mt-6'
+# Título da seção: o card pertence ao último título que aparece antes dele no documento
+CATEGORY_SEL = os.getenv("CATEGORY_SEL", "h2")
 
 # Variáveis de ambiente
 HEADLESS = os.getenv("HEADLESS", "1") != "0"
 MAX_ITEMS = int(os.getenv("MAX_ITEMS", "0"))  # 0 = sem limite
 DEBUG_LOG = os.getenv("DEBUG_LOG", "0") == "1"
+PROGRESS_LOG = os.getenv("PROGRESS_LOG", "0") == "1"  # linhas "PROGRESSO i/n" (dashboard)
 
 # ---------------- Firestore ----------------
 def init_firestore():
@@ -53,16 +58,20 @@ def init_firestore():
         firebase_admin.initialize_app(cred)
     return firestore.client()
 
+def init_storage():
+    """Firestore (padrão) ou banco SQL local, conforme STORAGE_BACKEND."""
+    if BACKEND == "sql":
+        return SQLRepository()
+    return init_firestore()
+
 def slugify(text: str) -> str:
     text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
     text = regex.sub(r'[^a-zA-Z0-9]+', '-', text).strip('-').lower()
     return text
 # ---------------- Utils ----------------
 def parse_price(text: str) -> float:
-    if not text:
-        return 0.0
-    m = regex.search(r'(\d+(?:[.,]\d{2})?)', text)
-    return float(m.group(1).replace(',', '.')) if m else 0.0
+    # Leitura pt-BR (milhar, "a partir de", "De X por Y"): precos.py
+    return precos.parse_price(text)
 
 def auto_scroll(page):
     page.evaluate("""
@@ -155,27 +164,123 @@ def is_unwanted_product(name: str, price: float) -> bool:
         return True
     return False
 
+def build_products(cards: list[tuple]) -> list[dict | None]:
+    """
+    Cards (name, cur, prev, base, desc[, category]) -> dicts dos produtos (None se indesejado).
+    Todos os textos de preço vão para um precos.parse_unique só (o cardápio repete muito preço).
+    """
+    if not cards:
+        return []
+    n = len(cards)
+    texts = [c[1] for c in cards] + [c[3] for c in cards] + [c[2] for c in cards]
+    parsed = precos.parse_unique(texts)
+    rows = parsed.astype(object).where(parsed.notna(), None).to_dict('records')
+    out = []
+    for i, card in enumerate(cards):
+        name, price_current_text, price_prev_text, price_base_text, desc_text = card[:5]
+        category = card[5] if len(card) > 5 else ""
+        current, base, prev = rows[i], rows[n + i], rows[2 * n + i]
+        price_current, price_base = current['price'], base['price']
+        chosen = current if price_current > 0 else base
+        chosen_price = chosen['price']
+        # Riscado: span próprio ou o "De X" quando o par vem num texto só
+        price_prev = prev['price'] or chosen['prev_price'] or 0.0
+
+        if DEBUG_LOG:
+            print(f"[DEBUG] '{name}' | cur='{price_current_text}' base='{price_base_text}' prev='{price_prev_text}' -> chosen={chosen_price}"
+                  f" ({chosen['kind']}, confiança {chosen['confidence']:.2f})")
+
+        # Pular indesejados / sem preço
+        if is_unwanted_product(name, chosen_price):
+            if DEBUG_LOG:
+                print(f"[SKIP] '{name}' pulado (indesejado/sem preço).")
+            out.append(None)
+            continue
+        if chosen['confidence'] < MIN_PRICE_CONFIDENCE:
+            # Gravado, mas o upsert retém a mudança até a mesma leitura se repetir
+            print(f"AVISO: preço de '{name}' lido com confiança {chosen['confidence']:.2f}"
+                  f" ('{price_current_text or price_base_text}' -> {chosen_price:.2f}).")
+
+        out.append({
+            'name': name,
+            'price': chosen_price,
+            'description': (desc_text or "")[:120],
+            'extracted_prev_price': price_prev,
+            'extracted_base_price': price_base,
+            'extracted_current_price': price_current,
+            'price_confidence': chosen['confidence'],
+            'category': (category or "").strip(),
+        })
+    return out
+
+def build_product(name: str, price_current_text: str, price_prev_text: str,
+                  price_base_text: str, desc_text: str, category: str = "") -> dict | None:
+    """Converte os textos extraídos de um card no dict do produto (None se indesejado)."""
+    return build_products([(name, price_current_text, price_prev_text, price_base_text, desc_text, category)])[0]
+
+def flag_note(r: dict) -> str:
+    """Sufixo do resumo para preço aceito mas sinalizado pelas estatísticas do produto."""
+    if not r.get('flag'):
+        return ""
+    return f" [SUSPEITO: {r['flag']}" + (f", z={r['z']:+.1f}]" if r.get('z') is not None else "]")
+
 # ---------------- Scraping ----------------
-def scrape_products(max_items=None, headless=True, debug=False) -> list[dict]:
-    products = []
+def load_menu(page, reload: bool = False, url: str | None = None):
+    """Abre (ou recarrega) o cardápio até todos os cards estarem no DOM."""
+    if reload:
+        page.reload(wait_until='networkidle')
+    else:
+        page.goto(url or URL, wait_until='networkidle')
+
+    # Fecha modal ao entrar
+    close_promotions_if_any(page)
+
+    # Garante nomes e fecha modal de novo
+    page.wait_for_selector(NAME_SEL, timeout=20000)
+    close_promotions_if_any(page)
+
+    # Scroll e fecha modal de novo, se aparecer
+    auto_scroll(page)
+    close_promotions_if_any(page)
+
+# Categoria de cada card numa chamada só: querySelectorAll devolve títulos e nomes
+# intercalados na ordem do documento
+CARD_CATEGORIES_JS = """
+([nameSel, catSel]) => {
+    const out = [];
+    let current = "";
+    for (const el of document.querySelectorAll(catSel + ", " + nameSel)) {
+        if (el.matches(nameSel)) out.push(current);
+        else current = (el.innerText || "").trim();
+    }
+    return out;
+}
+"""
+
+def card_categories(page) -> list[str]:
+    """Categoria de cada elemento NAME_SEL, na mesma ordem do locator ("" se não houver título)."""
+    try:
+        return page.evaluate(CARD_CATEGORIES_JS, [NAME_SEL, CATEGORY_SEL])
+    except Exception as e:
+        print(f"AVISO: categorias não extraídas ({e}).")
+        return []
+
+def scrape_products(max_items=None, headless=True, debug=False, captured_at: datetime | None = None,
+                    url: str | None = None, capture_dir: str = capturas.CAPTURE_DIR) -> list[dict]:
+    """
+    captured_at: horário da captura bruta (capturas.py); use o mesmo do WAL.
+    url: outra página de cardápio (padrão STORE_URL; ex.: páginas sintéticas do cargaSintetica.py).
+    capture_dir: arquivo de capturas brutas (a bancada usa um diretório temporário).
+    """
+    cards = []  # textos crus; o parse dos preços é um lote só no fim (build_products)
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=headless)
         context = browser.new_context()
         page = context.new_page()
         page.set_default_timeout(30000)
+        responses = capturas.record_responses(page) if capturas.CAPTURE_ENABLED else None
         try:
-            page.goto(URL, wait_until='networkidle')
-
-            # Fecha modal ao entrar
-            close_promotions_if_any(page)
-
-            # Garante nomes e fecha modal de novo
-            page.wait_for_selector(NAME_SEL, timeout=20000)
-            close_promotions_if_any(page)
-
-            # Scroll e fecha modal de novo, se aparecer
-            auto_scroll(page)
-            close_promotions_if_any(page)
+            load_menu(page, url=url)
 
             name_locator = page.locator(NAME_SEL)
             count = name_locator.count()
@@ -184,10 +289,13 @@ def scrape_products(max_items=None, headless=True, debug=False) -> list[dict]:
                 print("DEBUG: Nenhum item encontrado. Screenshot salvo em debug_sem_itens.png")
 
             take = count if not max_items or max_items <= 0 else min(count, max_items)
+            categories = card_categories(page)
 
             seen = set()  # deduplicação por slug do nome
 
             for i in range(take):
+                if PROGRESS_LOG and ((i + 1) % 10 == 0 or i + 1 == take):
+                    print(f"PROGRESSO {i + 1}/{take}", flush=True)
                 name_el = name_locator.nth(i)
                 name = name_el.inner_text().strip()
                 if not name:
@@ -253,27 +361,18 @@ def scrape_products(max_items=None, headless=True, debug=False) -> list[dict]:
                         name_el.locator('xpath=following::*[contains(@class,"text-sm") and contains(@class,"text-gray-500")][1]')
                     )
 
-                price_current = parse_price(price_current_text)
-                price_base = parse_price(price_base_text)
-                chosen_price = price_current if price_current > 0 else price_base
-
                 if DEBUG_LOG:
-                    print(f"[DEBUG] {len(seen)}/{take} '{name}' | cur='{price_current_text}' base='{price_base_text}' prev='{price_prev_text}' -> chosen={chosen_price}")
+                    print(f"[DEBUG] {len(seen)}/{take} '{name}'")
+                category = categories[i] if i < len(categories) else ""
+                cards.append((name, price_current_text, price_prev_text, price_base_text, desc_text, category))
 
-                # Pular indesejados / sem preço
-                if is_unwanted_product(name, chosen_price):
-                    if DEBUG_LOG:
-                        print(f"[SKIP] '{name}' pulado (indesejado/sem preço).")
-                    continue
-
-                products.append({
-                    'name': name,
-                    'price': chosen_price,
-                    'description': (desc_text or "")[:120],
-                    'extracted_prev_price': parse_price(price_prev_text),
-                    'extracted_base_price': price_base,
-                    'extracted_current_price': price_current,
-                })
+            # Página bruta para re-extração offline (falha aqui não derruba a coleta)
+            if responses is not None:
+                try:
+                    capturas.capture_page(page, responses, captured_at or datetime.now(timezone.utc), url or URL,
+                                          capture_dir)
+                except Exception as e:
+                    print(f"AVISO: captura bruta não salva ({e}).")
 
         except Exception as e:
             if debug:
@@ -293,12 +392,18 @@ def scrape_products(max_items=None, headless=True, debug=False) -> list[dict]:
             except Exception:
                 pass
 
-    return products
+    return [p for p in build_products(cards) if p is not None]
 # ---------------- Upsert em lote ----------------
-def batch_upsert_products(db, products: list[dict], batch_size: int = 400) -> list[dict]:
+def batch_upsert_products(db, products: list[dict], batch_size: int = 400,
+                          now: datetime | None = None, strict: bool = False) -> list[dict]:
+    """
+    Upsert dos produtos + ponto em 'prices' quando o preço muda (ou o produto é novo).
+    db: cliente Firestore ou um Repository (armazenamento.py).
+    now: instante da coleta (o replay do WAL passa o horário original).
+    strict: se True, falha na leitura propaga a exceção em vez de tratar tudo como novo.
+    """
     if not products:
         return []  # garante retorno de lista
-    now = datetime.now(timezone.utc)
 
     # Filtra (garantia extra): remove indesejados e sem preço
     filtered = []
@@ -308,183 +413,321 @@ def batch_upsert_products(db, products: list[dict], batch_size: int = 400) -> li
         if is_unwanted_product(name, price):
             continue
         filtered.append(p)
-    products = filtered
 
-    # 1) Refs e mapa
-    refs, by_id = [], {}
-    for p in products:
-        pid = slugify(p['name'])
-        ref = db.collection('products').document(pid)
-        refs.append(ref)
-        by_id[pid] = {'ref': ref, 'product': p}
+    repo = as_repository(db)
+    return repo.upsert_products(filtered, now=now, strict=strict, batch_size=batch_size)  # <- não pode faltar
 
-    # 2) Lê todos de uma vez
-    existing = {}
+def notify(applied: dict[str, list[dict]]):
+    """Notifica as mudanças de tudo que o wal.replay aplicou; falha aqui só gera aviso."""
     try:
-        snapshots = db.get_all(refs, field_paths=('current_price', 'name', 'last_price'), timeout=20, retry=Retry())
-        for snap in snapshots:
-            if snap.exists:
-                existing[snap.id] = snap.to_dict()
-    except DeadlineExceeded:
-        print("AVISO: Timeout ao ler documentos existentes. Tratando como novos.")
-        existing = {}
-    except GoogleAPIError as e:
-        print(f"AVISO: Falha ao ler documentos existentes: {e}. Prosseguindo.")
-        existing = {}
-
-    results = []
-    writes = []
-
-    # 3) Monta operações
-    for pid, item in by_id.items():
-        ref = item['ref']
-        p = item['product']
-        current_price = float(p.get('price', 0.0))
-        description = p.get('description', '')
-        name = p.get('name', '').strip()
-
-        extracted_prev = float(p.get('extracted_prev_price', 0.0))
-        extracted_base = float(p.get('extracted_base_price', 0.0))
-        extracted_current = float(p.get('extracted_current_price', 0.0))
-
-        if pid in existing:
-            prev = existing[pid]
-            prev_price = float(prev.get('current_price', 0.0))
-            changed = (current_price != prev_price)
-
-            update_data = {
-                'name': name,
-                'description': description,
-                'last_seen_at': now,
-                'display_prev_price': extracted_prev,
-                'display_base_price': extracted_base,
-                'display_current_green': extracted_current,
-            }
-            if changed:
-                update_data.update({
-                    'last_price': prev_price,
-                    'current_price': current_price,
-                    'price_changed_at': now,
-                    'change_count': Increment(1),
-                })
-                subdoc = ref.collection('prices').document() # gera ID automático writes.append(('set', subdoc, {'price': current_price, 'at': now}, False))
-
-            writes.append(('set', ref, update_data, True))
-            results.append({
-                'name': name,
-                'prev_price': prev_price,
-                'current_price': current_price,
-                'changed': changed,
-                'delta': round(current_price - prev_price, 2) if changed else 0.0
-            })
-        else:
-            create_data = {
-                'name': name,
-                'description': description,
-                'current_price': current_price,
-                'last_price': current_price,
-                'created_at': now,
-                'last_seen_at': now,
-                'change_count': 0,
-                'display_prev_price': extracted_prev,
-                'display_base_price': extracted_base,
-                'display_current_green': extracted_current,
+        sent = notificacoes.notify_applied(applied, store_url=URL)
+    except Exception as e:
+        print(f"AVISO: notificações não enviadas ({e}).")
+    else:
+        if sent:
+            print(f"Notificações -> Enviadas: {sent['sent']} | Falharam: {sent['failed']}"
+                  f" ({notificacoes.DEAD_LETTER_PATH}) | {sent['elapsed_s']:.1f}s")
+
+# ---------------- Modo watch ----------------
+WATCH_INTERVAL = int(os.getenv("WATCH_INTERVAL", "300"))  # segundos entre verificações
+WATCH_FULL_EVERY = int(os.getenv("WATCH_FULL_EVERY", "12"))  # a cada N ciclos, envia tudo (atualiza last_seen_at)
+
+# Extração + diff dentro do navegador, numa única chamada.
+# Reproduz a lógica de scrape_products (ancestrais div/article/li até 6 níveis e
+# fallback "following::"), guarda o último título de categoria visto (títulos e nomes
+# vêm intercalados na ordem do documento), compara cada card com a assinatura
+# anterior e devolve só os que mudaram. Cards são identificados pelo mesmo slug de
+# slugify() (o id do produto), não pelo nome cru: "Pão de Queijo" e "Pao de queijo"
+# são o mesmo produto e ficam só com o primeiro, como em scrape_products.
+EXTRACT_DIFF_JS = """
+([sel, prevSigs]) => {
+    const text = (el) => (el ? (el.innerText || "").trim() : "");
+    const css = (root, s) => text(root.querySelector(s));
+    const xp = (ctx, path) => text(document.evaluate(
+        path, ctx, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue);
+    const BASE_ANY = './/div[contains(@class,"mt-3") and contains(@class,"text-base") and contains(@class,"text-gray-700")]';
+    // Mesmo resultado de slugify() em Python
+    const slugify = (s) => s.normalize("NFKD").replace(/[^\\x00-\\x7F]/g, "")
+        .replace(/[^a-zA-Z0-9]+/g, "-").replace(/^-+|-+$/g, "").toLowerCase();
+
+    const changed = [];
+    const sigs = {};
+    const names = {};
+    let cat = "";
+    for (const nameEl of document.querySelectorAll(sel.cat + ", " + sel.name)) {
+        if (!nameEl.matches(sel.name)) { cat = text(nameEl); continue; }
+        const name = text(nameEl);
+        const pid = slugify(name);
+        if (!pid || pid in sigs) continue;
+        names[pid] = name;
+
+        let cur = "", prev = "", base = "", desc = "", found = false;
+        let el = nameEl.parentElement, depth = 0;
+        while (el && depth < 6) {
+            if (["DIV", "ARTICLE", "LI"].includes(el.tagName)) {
+                depth++;
+                cur = css(el, sel.cur);
+                prev = css(el, sel.prev);
+                base = css(el, sel.base) || xp(el, BASE_ANY);
+                desc = css(el, sel.desc);
+                if (cur || base) { found = true; break; }
             }
-            writes.append(('set', ref, create_data, False))
-            ref.collection('prices').document() # gera ID automático writes.append(('set', subdoc, {'price': current_price, 'at': now}, False))
-            results.append({
-                'name': name,
-                'prev_price': None,
-                'current_price': current_price,
-                'changed': False,
-                'delta': 0.0
-            })
-
-        # 4) Commit em lotes
-    def commit_batch(pending_ops): 
-        batch = db.batch() 
-        ops_in_batch = 0 
-        for op in pending_ops: 
-            if op[0] == 'set': _, ref, data, merge = op 
-            batch.set(ref, data, merge=merge) 
-            ops_in_batch += 1 # Segurança extra: se por alguma razão estourar o tamanho do batch if ops_in_batch >= 450: # abaixo do limite de 500 batch.commit() batch = db.batch() ops_in_batch = 0 if ops_in_batch: batch.commit()
-    
-    chunk = []
-    for op in writes:
-        chunk.append(op)
-        if len(chunk) >= batch_size:
-            commit_batch(chunk)
-            chunk = []
-    if chunk:
-        commit_batch(chunk)
-    return results  # <- não pode faltar
-
-    
+            el = el.parentElement;
+        }
+        if (!found) {
+            cur = xp(nameEl, 'following::span[contains(@class,"text-green-500")][1]');
+            base = xp(nameEl, 'following::div[contains(@class,"mt-3") and contains(@class,"text-base") and '
+                            + 'contains(@class,"text-gray-700") and contains(@class,"md:mt-6")][1]')
+                || xp(nameEl, 'following::div[contains(@class,"mt-3") and contains(@class,"text-base") and '
+                            + 'contains(@class,"text-gray-700")][1]');
+            prev = xp(nameEl, 'following::span[contains(@class,"line-through")][1]');
+            desc = xp(nameEl, 'following::*[contains(@class,"text-sm") and contains(@class,"text-gray-500")][1]');
+        }
+
+        const sig = [cur, prev, base, desc, cat].join("\u0001");
+        sigs[pid] = sig;
+        if (prevSigs[pid] !== sig) changed.push({name, cur, prev, base, desc, cat});
+    }
+    const removed = Object.keys(prevSigs).filter((pid) => !(pid in sigs));
+    return {changed, removed, sigs, names, total: Object.keys(sigs).length};
+}
+"""
+
+def extract_changed_cards(page, prev_sigs: dict) -> dict:
+    sel = {'name': NAME_SEL, 'cur': PRICE_CURRENT_SEL, 'prev': PRICE_PREV_SEL,
+           'base': PRICE_BASE_SEL, 'desc': DESC_SEL, 'cat': CATEGORY_SEL}
+    return page.evaluate(EXTRACT_DIFF_JS, [sel, prev_sigs])
+
+def menu_data_hashes(responses) -> dict[str, str]:
+    """sha256 do corpo de cada JSON do cardápio recebido no carregamento, por URL."""
+    hashes = {}
+    for resp in responses:
+        try:
+            if resp.ok and resp.request.method == "GET":
+                hashes[resp.url] = hashlib.sha256(resp.body()).hexdigest()
+        except Exception:
+            pass
+    return hashes
+
+def refetch_hashes(page, urls) -> dict[str, str] | None:
+    """Busca de novo os JSON (pelo contexto da página, sem renderizar). None se algum falhar."""
+    hashes = {}
+    for url in urls:
+        resp = page.request.get(url)
+        if not resp.ok:
+            return None
+        hashes[url] = hashlib.sha256(resp.body()).hexdigest()
+    return hashes
+
+def watch_products(db, interval: int = WATCH_INTERVAL, headless: bool = True, max_cycles: int | None = None):
+    """
+    Mantém a página aberta e compara os cards no próprio navegador a cada 'interval'
+    segundos. Só os produtos alterados vão para batch_upsert_products.
+
+    Recarregar (e rolar a página inteira) só a cada WATCH_FULL_EVERY ciclos. Nos
+    ciclos intermediários:
+    - se o cardápio chegou por JSON (xhr/fetch) no último carregamento, busca esses
+      JSON de novo e só recarrega quando algum corpo mudou;
+    - senão, reavalia EXTRACT_DIFF_JS no DOM atual (pega o que a página atualizou sozinha).
+    """
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        context = browser.new_context()
+        page = context.new_page()
+        page.set_default_timeout(30000)
+        responses = capturas.record_responses(page)
+        sigs: dict = {}
+        names: dict = {}
+        data_hashes: dict = {}
+        cycle = 0
+        opened = False
+        try:
+            while max_cycles is None or cycle < max_cycles:
+                started = time.perf_counter()
+                full = cycle % WATCH_FULL_EVERY == 0 or not opened
+                try:
+                    if full:
+                        # Primeira vez navega; depois só recarrega a mesma página
+                        responses.clear()
+                        load_menu(page, reload=opened)
+                        opened = True
+                        data_hashes = menu_data_hashes(responses)
+                        mode = "completo"
+                        diff = extract_changed_cards(page, {})
+                    elif data_hashes:
+                        current = refetch_hashes(page, data_hashes)
+                        if current == data_hashes:
+                            mode = "sem mudança"
+                            diff = {'changed': [], 'removed': [], 'sigs': sigs, 'names': names,
+                                    'total': len(sigs)}
+                        else:
+                            responses.clear()
+                            load_menu(page, reload=True)
+                            data_hashes = menu_data_hashes(responses)
+                            mode = "recarregado"
+                            diff = extract_changed_cards(page, sigs)
+                    else:
+                        mode = "diff"
+                        diff = extract_changed_cards(page, sigs)
+                    responses.clear()
+                except Exception as e:
+                    print(f"AVISO: falha na verificação ({e}). Reabrindo a página.")
+                    try:
+                        page.close()
+                    except Exception:
+                        pass
+                    page = context.new_page()
+                    page.set_default_timeout(30000)
+                    responses = capturas.record_responses(page)
+                    opened = False
+                    sigs, names, data_hashes = {}, {}, {}
+                    cycle = 0
+                    time.sleep(interval)
+                    continue
+
+                prev_names, names = names, diff['names']
+                sigs = diff['sigs']
+                products = [p for p in build_products([(c['name'], c['cur'], c['prev'], c['base'], c['desc'], c['cat'])
+                                                       for c in diff['changed']]) if p is not None]
+
+                results, applied = [], {}
+                if products:
+                    run_id = wal.append(products, store_url=URL)
+                    try:
+                        applied = wal.replay(db, batch_upsert_products)
+                        results = applied.get(run_id) or []
+                    except Exception as e:
+                        print(f"AVISO: Firestore indisponível ({e}). Alterações guardadas no WAL.")
+                elapsed = time.perf_counter() - started
+                stamp = datetime.now(timezone.utc).strftime('%H:%M:%S')
+                print(f"[{stamp}] {mode}: {diff['total']} cards | "
+                      f"{len(diff['changed'])} alterados | {len(diff['removed'])} sumiram | "
+                      f"{len(products)} enviados | {elapsed:.1f}s")
+                for r in results:
+                    if r['held']:
+                        print(f"- RETIDO ({r['flag']}): {r['name']} | lido R$ {r['pending_price']:.2f},"
+                              f" mantido R$ {r['current_price']:.2f}")
+                    elif r['changed']:
+                        print(f"- MUDOU: {r['name']} | atual R$ {r['current_price']:.2f} (Δ {r['delta']:+.2f})"
+                              f"{flag_note(r)}")
+                    elif r['prev_price'] is None:
+                        print(f"- NOVO: {r['name']} | atual R$ {r['current_price']:.2f}")
+                for pid in diff['removed']:
+                    print(f"- SUMIU: {prev_names.get(pid, pid)}")
+                if applied:
+                    notify(applied)
+
+                cycle += 1
+                if max_cycles is None or cycle < max_cycles:
+                    time.sleep(max(0.0, interval - elapsed))
+        except KeyboardInterrupt:
+            print("Watch encerrado.")
+        finally:
+            try:
+                context.close()
+            except Exception:
+                pass
+            try:
+                browser.close()
+            except Exception:
+                pass
 
 # ---------------- Utilitário de limpeza (opcional) ----------------
 def delete_product_and_history(db, product_name: str):
-    """Apaga um produto específico e toda a subcoleção 'prices'."""
+    """Apaga um produto específico e toda a subcoleção 'prices'.
+    Para muitos produtos de uma vez, use manutencao.py (purgar)."""
     pid = slugify(product_name)
-    ref = db.collection('products').document(pid)
-
-    # Apaga subcoleção 'prices'
-    prices = ref.collection('prices').stream()
-    batch = db.batch()
-    count = 0
-    for s in prices:
-        batch.delete(s.reference)
-        count += 1
-        if count % 400 == 0:
-            batch.commit()
-            batch = db.batch()
-    if count % 400 != 0:
-        batch.commit()
-
-    # Apaga o doc principal
-    ref.delete()
-    print(f"Apagado: {product_name} (slug={pid}), {count} históricos removidos.")
+    # Doc e membros da categoria numa transação; o histórico em seguida
+    count = as_repository(db).delete_product(pid)
+    print(f"Apagado: {product_name} (slug={pid}), {max(count - 1, 0)} históricos removidos.")
 
 
 # -------- Main --------
 def main():
+    if "--watch" in sys.argv:
+        print(f"Modo watch: verificando a cada {WATCH_INTERVAL}s. HEADLESS={HEADLESS}")
+        watch_products(init_storage(), interval=WATCH_INTERVAL, headless=HEADLESS)
+        return
+
     print(f"Iniciando scraping. HEADLESS={HEADLESS} | MAX_ITEMS={MAX_ITEMS or 'sem limite'}")
-    db = init_firestore()
+    db = init_storage()
 
-    # Scraping
+    # Scraping (o mesmo horário vai para a captura bruta e para o WAL)
+    scraped_at = datetime.now(timezone.utc)
     products = scrape_products(
         max_items=(MAX_ITEMS if MAX_ITEMS > 0 else None),
         headless=HEADLESS,
-        debug=True
+        debug=True,
+        captured_at=scraped_at
     )
 
     if not products:
         print("Nenhum produto encontrado. Verifique seletores e use HEADLESS=0 para depurar visualmente.")
         return
 
-    # Upsert em lote
-    results = batch_upsert_products(db, products, batch_size=200) or []
+    # Grava no WAL local antes de qualquer escrita; o replay aplica tudo que estiver pendente
+    run_id = wal.append(products, scraped_at=scraped_at, store_url=URL)
+    try:
+        applied = wal.replay(db, batch_upsert_products)
+    except Exception as e:
+        print(f"AVISO: Firestore indisponível ({e}). Resultado guardado no WAL ({wal.WAL_PATH});"
+              f" rode 'python wal.py replay' ou aguarde a próxima execução.")
+        sys.exit(1)
+    results = applied.get(run_id) or []
+    wal.prune()
+
+    # Manifesto do cardápio: o que entrou/saiu desde a última coleta completa.
+    # Mesmo horário da coleta: o replay "as of" ordena preços e diffs pelo mesmo relógio.
+    try:
+        repo = as_repository(db)
+        menu = update_manifest(repo, store_key(URL), products, run_id, now=scraped_at,
+                               complete=not MAX_ITEMS)
+        checkpointed = (not menu['skipped'] and bool(results)
+                        and maybe_checkpoint(repo, store_key(URL), results, at=scraped_at))
+    except Exception as e:
+        print(f"AVISO: manifesto/checkpoint do cardápio não atualizado ({e}).")
+    else:
+        print(f"\nCardápio -> Entraram: {len(menu['added'])} | Saíram: {len(menu['removed'])} |"
+              f" Alterados: {len(menu['changed'])} | Iguais: {menu['unchanged']} |"
+              f" Marcados fora do cardápio: {menu['delisted']}"
+              + (f" (não gravado: {menu['skipped']})" if menu['skipped'] else ""))
+        for pid in ([] if menu['skipped'] else menu['removed'][:20]):
+            print(f"- SAIU: {pid}")
+        if checkpointed:
+            print("Checkpoint do cardápio gravado (consultas por data).")
 
     # Tratar caso vazio (nenhuma alteração)
     if not results:
         print("\nResumo de alterações:")
         print("- Nenhuma alteração encontrada.")
+        notify(applied)
         return
 
     # Resumo
-    novos, mudaram, iguais = 0, 0, 0
+    novos, mudaram, iguais, retidos, suspeitos = 0, 0, 0, 0, 0
     print("\nResumo de alterações:")
     for r in results:
+        suspeitos += bool(r['flag'])
         if r['prev_price'] is None:
             novos += 1
             print(f"- NOVO: {r['name']} | atual R$ {r['current_price']:.2f}")
+        elif r['held']:
+            retidos += 1
+            print(f"- RETIDO ({r['flag']}): {r['name']} | lido R$ {r['pending_price']:.2f},"
+                  f" mantido R$ {r['current_price']:.2f}")
         elif r['changed']:
             mudaram += 1
-            print(f"- MUDOU: {r['name']} | atual R$ {r['current_price']:.2f} (Δ {r['delta']:+.2f})")
+            print(f"- MUDOU: {r['name']} | atual R$ {r['current_price']:.2f} (Δ {r['delta']:+.2f}){flag_note(r)}")
         else:
             iguais += 1
             print(f"- IGUAL: {r['name']} | atual R$ {r['current_price']:.2f}")
 
-    print(f"\nTotais -> Novos: {novos} | Mudaram: {mudaram} | Iguais: {iguais}")
+    print(f"\nTotais -> Novos: {novos} | Mudaram: {mudaram} | Iguais: {iguais}"
+          f" | Suspeitos: {suspeitos} | Retidos: {retidos}")
+
+    # Notificações só depois da coleta gravada (falha aqui não afeta o resultado).
+    # Inclui entradas antigas do WAL aplicadas agora: ninguém mais as notificaria.
+    notify(applied)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,262 @@
+# manutencao.py
+# Manutenção do Firestore: remoção em massa e compactação do histórico de preço
+# - purgar: apaga vários produtos (doc + subcoleção 'prices') em paralelo
+# - compactar: mantém resolução total por N dias; antes disso, só o último preço de cada dia
+#   (cada ponto do histórico é uma mudança: as mudanças do mesmo dia somem também das
+#   taxas por hora do agendador.py, que só enxerga o período com resolução total)
+# Ambos aceitam --dry-run e mostram progresso e vazão (docs/s).
+# - checkpoint-inicial: primeiro checkpoint do cardápio da loja, no diff mais antigo (o
+#   "cardápio em data" recusa instantes anteriores ao primeiro checkpoint)
+
+import os
+import sys
+import time
+import argparse
+import threading
+import unicodedata
+import re as regex
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+from armazenamento import as_repository, bootstrap_checkpoint, store_key
+
+# ---------------- Configurações ----------------
+WORKERS = int(os.getenv("MAINT_WORKERS", "8"))
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "30"))
+PROGRESS_EVERY_S = 2.0
+STORE_URL = os.getenv("STORE_URL", "https://app.cardapioweb.com/acai_moto_food")
+
+# ---------------- Firestore ----------------
+def init_firestore():
+    cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "serviceAccountKey.json")
+    if not os.path.isfile(cred_path):
+        raise FileNotFoundError(f"Credencial não encontrada: {cred_path}")
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(cred_path)
+        firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+def slugify(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return regex.sub(r'[^a-zA-Z0-9]+', '-', text).strip('-').lower()
+
+def to_utc(x) -> datetime:
+    if x.tzinfo is None:
+        return x.replace(tzinfo=timezone.utc)
+    return x.astimezone(timezone.utc)
+
+# ---------------- Progresso ----------------
+class Progress:
+    """Contadores thread-safe com relatório periódico de vazão."""
+
+    def __init__(self, label: str, total: int):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.docs = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+        self._last_print = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, docs: int = 0, error: bool = False):
+        with self._lock:
+            self.done += 1
+            self.docs += docs
+            self.errors += int(error)
+            now = time.perf_counter()
+            if now - self._last_print >= PROGRESS_EVERY_S or self.done == self.total:
+                self._last_print = now
+                self._print(now)
+
+    def _print(self, now: float):
+        elapsed = max(now - self.started, 1e-9)
+        print(f"[{self.label}] {self.done}/{self.total} produtos | {self.docs} docs | "
+              f"{self.docs / elapsed:.1f} docs/s | {self.done / elapsed:.1f} produtos/s", flush=True)
+
+    def summary(self) -> dict:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            'products': self.done,
+            'docs': self.docs,
+            'errors': self.errors,
+            'seconds': round(elapsed, 2),
+            'docs_per_s': round(self.docs / elapsed, 1),
+        }
+
+def run_parallel(label: str, items: list, fn, workers: int = WORKERS) -> dict:
+    progress = Progress(label, len(items))
+    if not items:
+        return progress.summary()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fn, it): it for it in items}
+        for fut in as_completed(futures):
+            try:
+                progress.add(fut.result())
+            except Exception as e:
+                print(f"AVISO: falha em {futures[fut]}: {e}")
+                progress.add(error=True)
+    return progress.summary()
+
+# ---------------- Purga ----------------
+def select_products(db, names: list[str] | None = None, unseen_days: int | None = None) -> list:
+    """Refs dos produtos a apagar: por nome e/ou não vistos há 'unseen_days' dias."""
+    refs = {}
+    col = db.collection('products')
+    for name in names or []:
+        ref = col.document(slugify(name))
+        refs[ref.id] = ref
+    if unseen_days:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=unseen_days)
+        for d in col.where('last_seen_at', '<', cutoff).select([]).stream():
+            refs[d.id] = d.reference
+    return list(refs.values())
+
+def purge_products(db, refs: list, dry_run: bool = False, workers: int = WORKERS) -> dict:
+    """
+    Apaga cada produto com Repository.delete_product (doc e membros da categoria numa
+    transação, depois o histórico via BulkWriter), vários ao mesmo tempo.
+    Em dry-run só conta os documentos que seriam apagados (agregação count()).
+    """
+    repo = as_repository(db)
+
+    def count_one(ref) -> int:
+        res = ref.collection('prices').count().get()
+        return int(res[0][0].value) + (1 if ref.get(field_paths=[]).exists else 0)
+
+    def delete_one(ref) -> int:
+        return repo.delete_product(ref.id)
+
+    label = "purga (dry-run)" if dry_run else "purga"
+    return run_parallel(label, refs, count_one if dry_run else delete_one, workers)
+
+# ---------------- Compactação ----------------
+def compact_points(points: list[tuple], cutoff: datetime) -> list:
+    """
+    points: [(at, ref)] ordenados por 'at'. Retorna as refs a apagar:
+    antes do cutoff, mantém só o último ponto de cada dia (UTC).
+    """
+    to_delete = []
+    last_by_day = {}
+    for at, ref in points:
+        if at >= cutoff:
+            break
+        day = at.date()
+        if day in last_by_day:
+            to_delete.append(last_by_day[day])
+        last_by_day[day] = ref
+    return to_delete
+
+def compact_history(db, retention_days: int = RETENTION_DAYS, dry_run: bool = False,
+                    workers: int = WORKERS) -> dict:
+    """
+    Compacta a subcoleção 'prices' de todos os produtos. Guarda em
+    'history_compacted_until' até onde já foi compactado, para que a próxima
+    execução leia só o trecho novo (nunca recua: rodar com mais dias de retenção
+    não faz a marca voltar).
+    Atenção: as mudanças intradiárias antes do corte deixam de existir como eventos
+    para o agendador.py.
+    """
+    # Corte no início do dia: o dia do corte fica com resolução total
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+    products = list(db.collection('products').select(['history_compacted_until']).stream())
+
+    def compact_one(snap) -> int:
+        ref = snap.reference
+        since = (snap.to_dict() or {}).get('history_compacted_until')
+        q = ref.collection('prices').where('at', '<', cutoff).order_by('at').select(['at'])
+        if since is not None:
+            # Recomeça do início do dia já compactado (ele tem no máximo 1 ponto)
+            start = to_utc(since).replace(hour=0, minute=0, second=0, microsecond=0)
+            q = q.where('at', '>=', start)
+        points = []
+        for s in q.stream():
+            at = (s.to_dict() or {}).get('at')
+            if at is not None:
+                points.append((to_utc(at), s.reference))
+        to_delete = compact_points(points, cutoff)
+        if dry_run:
+            return len(to_delete)
+
+        if to_delete:
+            bw = db.bulk_writer()
+            for r in to_delete:
+                bw.delete(r)
+            bw.close()
+        until = cutoff if since is None else max(to_utc(since), cutoff)
+        ref.set({'history_compacted_until': until}, merge=True)
+        return len(to_delete)
+
+    label = "compactação (dry-run)" if dry_run else "compactação"
+    return run_parallel(label, products, compact_one, workers)
+
+# -------- Main --------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do histórico de preços no Firestore")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_purge = sub.add_parser("purgar", help="apaga produtos e todo o histórico deles")
+    p_purge.add_argument("nomes", nargs="*", help="nomes dos produtos")
+    p_purge.add_argument("--arquivo", help="arquivo com um nome de produto por linha")
+    p_purge.add_argument("--nao-vistos-dias", type=int, help="apaga produtos não vistos há N dias")
+
+    p_comp = sub.add_parser(
+        "compactar", help="aplica a política de retenção ao histórico",
+        description="Antes do corte, mantém só o último preço de cada dia. Cada ponto do histórico é "
+                    "uma mudança de preço: as mudanças intradiárias apagadas deixam de contar nas taxas "
+                    "por hora do agendador.py (use --dias >= a janela que o agendador deve aprender).")
+    p_comp.add_argument("--dias", type=int, default=RETENTION_DAYS,
+                        help=f"dias com resolução total (padrão {RETENTION_DAYS})")
+
+    p_ck = sub.add_parser("checkpoint-inicial", help="grava o primeiro checkpoint do cardápio da loja")
+    p_ck.add_argument("--loja", default=store_key(STORE_URL), help="chave da loja (padrão: de STORE_URL)")
+
+    for p in (p_purge, p_comp):
+        p.add_argument("--dry-run", action="store_true", help="só conta, não apaga")
+        p.add_argument("--workers", type=int, default=WORKERS)
+
+    args = parser.parse_args(argv)
+    db = init_firestore()
+
+    if args.cmd == "checkpoint-inicial":
+        at = bootstrap_checkpoint(as_repository(db), args.loja)
+        if at is None:
+            print(f"Nada gravado: '{args.loja}' não tem diffs do cardápio ou já tem checkpoint no primeiro.")
+        else:
+            print(f"Checkpoint inicial de '{args.loja}' em {at:%d/%m/%Y %H:%M} UTC.")
+        return
+
+    if args.cmd == "purgar":
+        names = list(args.nomes)
+        if args.arquivo:
+            with open(args.arquivo, encoding="utf-8") as f:
+                names.extend(line.strip() for line in f if line.strip())
+        refs = select_products(db, names, args.nao_vistos_dias)
+        if not refs:
+            print("Nenhum produto selecionado.")
+            return
+        print(f"Produtos selecionados: {len(refs)}")
+        stats = purge_products(db, refs, dry_run=args.dry_run, workers=args.workers)
+    else:
+        stats = compact_history(db, retention_days=args.dias, dry_run=args.dry_run,
+                                workers=args.workers)
+
+    if not args.dry_run and stats['docs']:
+        # Caches de histórico (dashboard/API) descartam o que tinham da versão antiga
+        as_repository(db).bump_history_generation()
+
+    verb = "seriam apagados" if args.dry_run else "apagados"
+    print(f"\nResumo: {stats['products']} produtos | {stats['docs']} docs {verb} | "
+          f"{stats['errors']} erros | {stats['seconds']}s | {stats['docs_per_s']} docs/s")
+
+
+if __name__ == "__main__":
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+    except Exception:
+        pass
+    main()
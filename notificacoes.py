@@ -0,0 +1,345 @@
+# notificacoes.py
+# Notificação das mudanças de preço (webhook / chat), fora do caminho do scraping
+# - Roda depois da coleta gravada: o tempo do scraping não depende dos endpoints remotos
+# - Um digest por assinante por execução (todas as mudanças que passaram no filtro dele)
+# - Filtros (padrão de nome, delta % mínimo) avaliados em bloco com pandas
+# - Entrega concorrente (asyncio + semáforo), novas tentativas com backoff e
+#   arquivo de falhas (JSONL) para reenvio posterior
+#
+# Assinantes: arquivo JSON (NOTIFY_SUBSCRIBERS_PATH) ou o próprio JSON em
+# NOTIFY_SUBSCRIBERS_JSON (útil para secrets no CI). Formato:
+#   [{"id": "grupo", "url": "https://...", "pattern": "burger|pizza",
+#     "min_delta_pct": 5, "format": "json" | "text"}]
+
+import os
+import sys
+import json
+import time
+import uuid
+import re as regex
+import random
+import asyncio
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+import pandas as pd
+
+# ---------------- Configurações ----------------
+SUBSCRIBERS_PATH = os.getenv("NOTIFY_SUBSCRIBERS_PATH", "assinantes.json")
+SUBSCRIBERS_JSON = os.getenv("NOTIFY_SUBSCRIBERS_JSON", "")
+DEAD_LETTER_PATH = os.getenv("NOTIFY_DEAD_LETTER", "notificacoes_falhas.jsonl")
+CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "8"))
+RETRIES = int(os.getenv("NOTIFY_RETRIES", "3"))  # tentativas além da primeira
+TIMEOUT_S = float(os.getenv("NOTIFY_TIMEOUT", "10"))
+BACKOFF_S = 0.5  # base do backoff exponencial (com jitter)
+MAX_LINES = 30  # linhas de mudança no texto do digest
+
+# ---------------- Assinantes ----------------
+def compile_pattern(pattern: str):
+    """Regex do filtro de nome (sem diferenciar maiúsculas); None se inválida."""
+    try:
+        return regex.compile(pattern, regex.IGNORECASE)
+    except regex.error:
+        return None
+
+def load_subscribers(path: str = SUBSCRIBERS_PATH, inline: str = SUBSCRIBERS_JSON) -> list[dict]:
+    if inline.strip():
+        subs = json.loads(inline)
+    elif os.path.isfile(path):
+        with open(path, encoding='utf-8') as f:
+            subs = json.load(f)
+    else:
+        return []
+    out = []
+    for i, s in enumerate(subs):
+        if not s.get('url'):
+            continue
+        if s.get('pattern') and compile_pattern(s['pattern']) is None:
+            print(f"AVISO: assinante '{s.get('id') or i}' ignorado: padrão inválido {s['pattern']!r}.")
+            continue
+        out.append({
+            'id': s.get('id') or f"assinante-{i}",
+            'url': s['url'],
+            'pattern': s.get('pattern') or '',
+            'min_delta_pct': float(s.get('min_delta_pct') or 0.0),
+            'format': s.get('format', 'json'),
+        })
+    return out
+
+# ---------------- Filtros e digests ----------------
+def changes_frame(results: list[dict]) -> pd.DataFrame:
+    """Só as mudanças efetivas do resumo (r['changed']), com delta %."""
+    df = pd.DataFrame([r for r in results if r.get('changed')])
+    if df.empty:
+        return df
+    df['delta_pct'] = (df['delta'] / df['prev_price'].where(df['prev_price'] > 0)) * 100
+    if 'flag' not in df.columns:
+        df['flag'] = None
+    return df.reset_index(drop=True)
+
+def match_subscribers(df: pd.DataFrame, subscribers: list[dict]) -> dict[str, pd.Index]:
+    """
+    Índices das mudanças que cada assinante recebe.
+    Cada padrão distinto é compilado e avaliado uma vez sobre a coluna inteira; o delta
+    mínimo é uma comparação vetorizada. Custo ~ (padrões distintos + assinantes)
+    operações de coluna, em vez de assinantes x mudanças testes em Python.
+    Assinante com padrão inválido fica de fora (aviso) sem impedir os demais.
+    """
+    if df.empty or not subscribers:
+        return {}
+    names = df['name'].astype(str)
+    abs_pct = df['delta_pct'].abs().fillna(float('inf'))  # sem preço anterior: sempre passa
+    by_pattern = {}
+    for pattern in {s['pattern'] for s in subscribers}:
+        if not pattern:
+            by_pattern[pattern] = pd.Series(True, index=df.index)
+            continue
+        compiled = compile_pattern(pattern)
+        if compiled is None:
+            print(f"AVISO: padrão inválido {pattern!r}; assinantes com ele não recebem este digest.")
+            continue
+        by_pattern[pattern] = names.str.contains(compiled, regex=True, na=False)
+    return {s['id']: df.index[by_pattern[s['pattern']] & (abs_pct >= s['min_delta_pct'])]
+            for s in subscribers if s['pattern'] in by_pattern}
+
+def digest_text(rows: list[dict], store_url: str | None) -> str:
+    lines = [f"{len(rows)} mudança(s) de preço" + (f" em {store_url}" if store_url else "")]
+    for r in rows[:MAX_LINES]:
+        pct = f" ({r['delta_pct']:+.1f}%)" if r.get('delta_pct') is not None else ""
+        flag = f" [{r['flag']}]" if r.get('flag') else ""
+        lines.append(f"- {r['name']}: R$ {r['prev_price']:.2f} -> R$ {r['current_price']:.2f}{pct}{flag}")
+    if len(rows) > MAX_LINES:
+        lines.append(f"... e mais {len(rows) - MAX_LINES}")
+    return "\n".join(lines)
+
+def build_digests(results: list[dict], subscribers: list[dict], run_id: str | None = None,
+                  store_url: str | None = None) -> list[dict]:
+    df = changes_frame(results)
+    matched = match_subscribers(df, subscribers)
+    if not matched:
+        return []
+    records = df[['name', 'prev_price', 'current_price', 'delta', 'delta_pct', 'flag']].astype(object)
+    records = records.where(records.notna(), None).to_dict(orient='records')
+    generated_at = datetime.now(timezone.utc).isoformat()
+    digests = []
+    for s in subscribers:
+        idx = matched.get(s['id'])
+        if idx is None or not len(idx):
+            continue
+        rows = [records[i] for i in idx]
+        text = digest_text(rows, store_url)
+        body = {'text': text} if s['format'] == 'text' else {
+            'subscriber': s['id'], 'run_id': run_id, 'store_url': store_url,
+            'generated_at': generated_at, 'count': len(rows), 'changes': rows, 'text': text,
+        }
+        digests.append({'subscriber': s['id'], 'url': s['url'], 'run_id': run_id, 'body': body})
+    return digests
+
+# ---------------- Entrega ----------------
+class PermanentError(Exception):
+    """Resposta que não adianta repetir (4xx exceto 408/429)."""
+
+def post_json(url: str, body: dict, timeout: float = TIMEOUT_S) -> int:
+    data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    req = urllib.request.Request(url, data=data, method='POST',
+                                 headers={'Content-Type': 'application/json; charset=utf-8'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        if 400 <= e.code < 500 and e.code not in (408, 429):
+            raise PermanentError(f"HTTP {e.code}") from e
+        raise
+
+async def deliver(digest: dict, sem: asyncio.Semaphore, retries: int, timeout: float) -> dict:
+    attempts, error = 0, None
+    started = time.perf_counter()
+    while attempts <= retries:
+        attempts += 1
+        try:
+            # urllib é bloqueante: vai para uma thread; o semáforo limita quantas ao mesmo tempo
+            # e é liberado durante o backoff (quem espera não ocupa vaga)
+            async with sem:
+                await asyncio.to_thread(post_json, digest['url'], digest['body'], timeout)
+            error = None
+            break
+        except PermanentError as e:
+            error = str(e)
+            break
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            if attempts <= retries:
+                await asyncio.sleep(BACKOFF_S * 2 ** (attempts - 1) * (1 + random.random()))
+    return {'subscriber': digest['subscriber'], 'ok': error is None, 'attempts': attempts,
+            'error': error, 'ms': round((time.perf_counter() - started) * 1000, 1)}
+
+async def dispatch_async(digests: list[dict], concurrency: int = CONCURRENCY, retries: int = RETRIES,
+                         timeout: float = TIMEOUT_S) -> list[dict]:
+    sem = asyncio.Semaphore(max(1, concurrency))
+    return await asyncio.gather(*(deliver(d, sem, retries, timeout) for d in digests))
+
+def dispatch(digests: list[dict], concurrency: int = CONCURRENCY, retries: int = RETRIES,
+             timeout: float = TIMEOUT_S, dead_letter_path: str = DEAD_LETTER_PATH) -> dict:
+    """Entrega os digests e grava os que falharam em todas as tentativas no arquivo de falhas."""
+    if not digests:
+        return {'sent': 0, 'failed': 0, 'elapsed_s': 0.0, 'outcomes': []}
+    started = time.perf_counter()
+    outcomes = asyncio.run(dispatch_async(digests, concurrency, retries, timeout))
+    failed = [(d, o) for d, o in zip(digests, outcomes) if not o['ok']]
+    if failed:
+        with open(dead_letter_path, 'a', encoding='utf-8') as f:
+            for d, o in failed:
+                f.write(json.dumps({**d, 'error': o['error'], 'attempts': o['attempts'],
+                                    'failed_at': datetime.now(timezone.utc).isoformat()},
+                                   ensure_ascii=False) + "\n")
+    return {'sent': len(digests) - len(failed), 'failed': len(failed),
+            'elapsed_s': round(time.perf_counter() - started, 3), 'outcomes': outcomes}
+
+def notify_changes(results: list[dict], run_id: str | None = None, store_url: str | None = None,
+                   subscribers: list[dict] | None = None) -> dict | None:
+    """Monta os digests de uma execução e entrega. None se não há assinantes."""
+    subscribers = load_subscribers() if subscribers is None else subscribers
+    if not subscribers:
+        return None
+    return dispatch(build_digests(results, subscribers, run_id=run_id, store_url=store_url))
+
+def notify_applied(applied: dict[str, list[dict]], store_url: str | None = None,
+                   subscribers: list[dict] | None = None) -> dict | None:
+    """
+    Notifica tudo o que wal.replay aplicou ({run_id: resultados}): a coleta atual, as
+    entradas antigas que estavam pendentes e os ciclos do modo watch. Um digest por
+    assinante por entrada, todos numa entrega só. None se não há assinantes.
+    """
+    if not any(r.get('changed') for results in applied.values() for r in results):
+        return None
+    subscribers = load_subscribers() if subscribers is None else subscribers
+    if not subscribers:
+        return None
+    digests = [d for run_id, results in applied.items()
+               for d in build_digests(results, subscribers, run_id=run_id, store_url=store_url)]
+    return dispatch(digests)
+
+def redeliver(path: str = DEAD_LETTER_PATH) -> dict:
+    """
+    Reenvia o arquivo de falhas; o que falhar de novo volta para o arquivo.
+    O arquivo é renomeado antes da leitura (falhas gravadas durante o reenvio vão para
+    um arquivo novo) para um nome único: um reenvio interrompido deixa o seu
+    '.reenvio-*' intacto em vez de ser sobrescrito pelo próximo.
+    """
+    if not os.path.isfile(path):
+        return {'sent': 0, 'failed': 0, 'elapsed_s': 0.0, 'outcomes': []}
+    work = f"{path}.reenvio-{uuid.uuid4().hex[:8]}"
+    os.replace(path, work)
+    with open(work, encoding='utf-8') as f:
+        digests = [json.loads(line) for line in f if line.strip()]
+    summary = dispatch([{k: d[k] for k in ('subscriber', 'url', 'run_id', 'body')} for d in digests],
+                       dead_letter_path=path)
+    os.remove(work)
+    return summary
+
+# ---------------- Servidor local de teste ----------------
+def start_test_server(port: int = 0, fail_rate: float = 0.0, delay_s: float = 0.0):
+    """
+    Stand-in HTTP local: aceita POSTs, guarda os corpos recebidos e pode falhar (503)
+    uma fração das requisições ou atrasar as respostas. Retorna (server, received, url).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    received: list[dict] = []
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if delay_s:
+                time.sleep(delay_s)
+            if random.random() < fail_rate:
+                self.send_response(503)
+                self.end_headers()
+                return
+            with lock:
+                received.append({'path': self.path, 'body': json.loads(body or b'{}')})
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received, f"http://127.0.0.1:{server.server_address[1]}"
+
+def simulate(n_subscribers: int, n_changes: int, fail_rate: float, delay_s: float, concurrency: int) -> dict:
+    """Ciclo completo contra o servidor local com assinantes e mudanças sintéticas."""
+    server, received, base = start_test_server(fail_rate=fail_rate, delay_s=delay_s)
+    try:
+        words = ['burger', 'pizza', 'combo', 'suco', 'batata', 'sobremesa']
+        results = []
+        for i in range(n_changes):
+            prev = round(random.uniform(10, 80), 2)
+            cur = round(prev * random.uniform(0.7, 1.3), 2)
+            results.append({'name': f"{random.choice(words).title()} {i}", 'prev_price': prev,
+                            'current_price': cur, 'changed': cur != prev, 'delta': round(cur - prev, 2)})
+        subscribers = [{'id': f"s{i}", 'url': f"{base}/s{i}", 'pattern': random.choice(words + ['']),
+                        'min_delta_pct': random.choice([0, 5, 10]), 'format': 'json'}
+                       for i in range(n_subscribers)]
+        t0 = time.perf_counter()
+        digests = build_digests(results, subscribers, run_id='simulacao')
+        build_ms = (time.perf_counter() - t0) * 1000
+        summary = dispatch(digests, concurrency=concurrency, dead_letter_path=DEAD_LETTER_PATH + ".sim")
+        summary.update({'digests': len(digests), 'build_ms': round(build_ms, 1), 'received': len(received)})
+        return summary
+    finally:
+        server.shutdown()
+
+# -------- Main --------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Notificações de mudança de preço")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("assinantes", help="lista os assinantes configurados")
+    sub.add_parser("reenviar", help=f"reenvia as falhas de {DEAD_LETTER_PATH}")
+    p_srv = sub.add_parser("servidor-teste", help="sobe um endpoint local que imprime o que recebe")
+    p_srv.add_argument("--porta", type=int, default=8765)
+    p_srv.add_argument("--falhar", type=float, default=0.0, help="fração de respostas 503")
+    p_sim = sub.add_parser("simular", help="assinantes e mudanças sintéticas contra o servidor local")
+    p_sim.add_argument("--assinantes", type=int, default=200)
+    p_sim.add_argument("--mudancas", type=int, default=500)
+    p_sim.add_argument("--falhar", type=float, default=0.1)
+    p_sim.add_argument("--atraso", type=float, default=0.05, help="segundos por resposta")
+    p_sim.add_argument("--concorrencia", type=int, default=CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "assinantes":
+        for s in load_subscribers():
+            print(f"- {s['id']}: {s['url']} | padrão '{s['pattern'] or '*'}' | delta >= {s['min_delta_pct']:g}%")
+    elif args.cmd == "reenviar":
+        r = redeliver()
+        print(f"Reenviados: {r['sent']} | Falharam de novo: {r['failed']} | {r['elapsed_s']:.1f}s")
+    elif args.cmd == "servidor-teste":
+        server, received, url = start_test_server(args.porta, fail_rate=args.falhar)
+        print(f"Recebendo em {url} (Ctrl+C para sair)")
+        seen = 0
+        try:
+            while True:
+                time.sleep(0.5)
+                for item in received[seen:]:
+                    print(f"[{item['path']}] {item['body'].get('text', item['body'])}\n")
+                seen = len(received)
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        r = simulate(args.assinantes, args.mudancas, args.falhar, args.atraso, args.concorrencia)
+        attempts = sum(o['attempts'] for o in r['outcomes'])
+        print(f"Digests: {r['digests']} (montados em {r['build_ms']:.1f} ms) | entregues: {r['sent']} |"
+              f" falhas: {r['failed']} | tentativas: {attempts} | recebidos: {r['received']} |"
+              f" {r['elapsed_s']:.2f}s com concorrência {args.concorrencia}")
+
+
+if __name__ == "__main__":
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+    except Exception:
+        pass
+    main()
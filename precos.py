@@ -0,0 +1,230 @@
+# precos.py
+# Leitura de preços em reais (pt-BR) a partir do texto dos cards
+# - "R$ 1.234,90": ponto de milhar, vírgula decimal (o parse antigo lia 1.234)
+# - "A partir de R$ 19,90": preço mínimo de item com opções (kind 'a_partir_de')
+# - "De R$ 20,00 por R$ 15,00" ou "R$ 20,00 R$ 15,00" (riscado + promo): price=15, prev_price=20
+# - "R$ 10,00 - R$ 20,00" / "R$ 10 a R$ 20" / "R$ 15 a 20": faixa (price = mínimo, max_price = máximo)
+# - Números sem "R$" quando o texto tem valores com "R$" (300ml, 2 unidades) são ignorados
+# - "R$ 12.90": decimal com ponto é aceito; só é ambíguo se o ponto também marca milhar
+#   ("1.234.56") ou se o mesmo texto usa as duas convenções ("R$ 10,00 ou R$ 12.90")
+# Resultado: dict {'price', 'prev_price', 'max_price', 'kind', 'confidence'}; confiança
+# baixa para formato ambíguo (acima, ou "1.234" sem R$), número sem R$ ou números
+# sobrando; abaixo de anomalias.MIN_PRICE_CONFIDENCE o upsert retém o preço como
+# leitura ambígua.
+# Lote: parse_unique deduplica o array e lê cada texto distinto uma vez, em Python
+# (não é vetorizado; o ganho vem de o cardápio repetir muito preço).
+# Casos com resposta conhecida e textos aleatórios: test_precos.py.
+
+import sys
+import time
+import random
+import argparse
+import re as regex
+
+import pandas as pd
+
+# ---------------- Padrões (compilados uma vez) ----------------
+# Milhar com ponto (1.234 / 12.345.678) ou inteiro simples; decimal com vírgula (ou ponto)
+AMOUNT_RE = regex.compile(
+    r'(?P<rs>R\$\s*)?(?<![\d.,])(?P<int>\d{1,3}(?:\.\d{3})+|\d+)(?:(?P<sep>[,.])(?P<dec>\d{1,2}))?(?!\d)',
+    regex.I)
+PROMO_RE = regex.compile(r'\bpor\b', regex.I)  # "De X por Y"
+RANGE_RE = regex.compile(r'^\s*(?:-|–|a|at[eé])\s*$', regex.I)  # "X - Y", "X a Y", "X até Y"
+FROM_RE = regex.compile(r'a\s+partir\s+de', regex.I)
+UNIT_RE = regex.compile(r'[^\W\d_]')  # letra colada no número: 300ml, 2x
+# Caminho rápido: o card típico é só "R$ 19,90" (um valor, vírgula decimal)
+PLAIN_RE = regex.compile(r'\s*R\$\s*(\d{1,3}(?:\.\d{3})+|\d+),(\d{2})\s*', regex.I)
+
+EMPTY = "vazio"
+SIMPLE = "simples"
+FROM = "a_partir_de"
+PROMO = "de_por"
+RANGE = "faixa"
+
+FIELDS = ('price', 'prev_price', 'max_price', 'kind', 'confidence')
+_EMPTY_RESULT = (0.0, None, None, EMPTY, 0.0)
+
+# ---------------- Parse ----------------
+def _amounts(text: str) -> list[tuple[float, bool, bool, int, int]]:
+    """(valor, tem R$, formato ambíguo, início, fim) de cada número do texto."""
+    matches = list(AMOUNT_RE.finditer(text))
+    # Vírgula e ponto como decimal no mesmo texto: não dá para saber qual convenção vale
+    mixed = len({m.group('sep') for m in matches if m.group('dec')}) > 1
+    out = []
+    for m in matches:
+        rs, integer, sep, dec = m.groups()
+        rs = rs is not None
+        value = float(integer.replace('.', '') + ('.' + dec.ljust(2, '0') if dec else ''))
+        # "12.90" é decimal; ambíguo só com ponto de milhar junto ("1.234.56"), convenções
+        # misturadas ou "1.234" sem R$ (três dígitos depois do ponto: milhar ou decimal?)
+        ambiguous = (sep == '.' and ('.' in integer or mixed)) or ('.' in integer and not dec and not rs)
+        out.append((value, rs, ambiguous, m.start(), m.end()))
+    return out
+
+def _parse(text) -> tuple:
+    if not text or not isinstance(text, str):
+        return _EMPTY_RESULT
+    m = PLAIN_RE.fullmatch(text)
+    if m:
+        return float(m.group(1).replace('.', '') + '.' + m.group(2)), None, None, SIMPLE, 1.0
+    found = _amounts(text)
+    if not found:
+        return _EMPTY_RESULT
+    # Com algum "R$" no texto, só os valores com "R$" são preço
+    money = [a for a in found if a[1]] or found
+    if len(money) == 1 and money[0][1]:
+        # "R$ 15 a 20": o limite de cima da faixa sem "R$" (mas não "R$ 10 até 300ml")
+        k = found.index(money[0])
+        nxt = found[k + 1] if k + 1 < len(found) else None
+        if (nxt and nxt[0] > money[0][0] and RANGE_RE.match(text[money[0][4]:nxt[3]])
+                and not UNIT_RE.match(text, nxt[4])):
+            money.append(nxt)
+    confidence = 1.0 - 0.1 * (len(found) - len(money))
+    if not money[0][1]:
+        confidence -= 0.2
+
+    first = money[0]
+    price, prev, high, kind = first[0], None, None, SIMPLE
+    used = [first]
+    if len(money) >= 2:
+        second = money[1]
+        between = text[first[4]:second[3]]
+        if PROMO_RE.search(between):
+            kind, prev, price = PROMO, first[0], second[0]
+        elif RANGE_RE.match(between):
+            kind, price, high = RANGE, min(first[0], second[0]), max(first[0], second[0])
+        elif first[0] > second[0] and not between.strip():
+            # Riscado e promo lado a lado (innerText do container inteiro)
+            kind, prev, price = PROMO, first[0], second[0]
+            confidence -= 0.2
+        if kind != SIMPLE:
+            used.append(second)
+        confidence -= 0.2 * (len(money) - len(used))  # valores que sobraram sem explicação
+    if any(a[2] for a in used):
+        confidence -= 0.2
+    if kind == SIMPLE and FROM_RE.search(text[:first[3]]):
+        kind = FROM
+    return price, prev, high, kind, round(min(1.0, max(0.1, confidence)), 2)
+
+def parse(text: str | None) -> dict:
+    """Lê um texto de preço. Sem número: price 0.0, kind 'vazio', confidence 0."""
+    return dict(zip(FIELDS, _parse(text)))
+
+def parse_price(text: str | None) -> float:
+    """Só o preço cobrado (o promocional em "De X por Y"; o mínimo em faixas)."""
+    return _parse(text)[0]
+
+def parse_unique(texts) -> pd.DataFrame:
+    """
+    Lê um array de textos deduplicando antes: cada texto distinto passa uma vez pelo
+    parse escalar (laço em Python, não vetorizado) e o resultado é espalhado pelos
+    índices (factorize + take). O ganho é proporcional à repetição de textos.
+    Retorna DataFrame com as colunas de FIELDS, na ordem de 'texts' (NaN onde o parse dá None).
+    """
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object).fillna(''), sort=False)
+    table = pd.DataFrame([_parse(t) for t in uniques], columns=list(FIELDS))
+    if len(table) == 0:
+        return pd.DataFrame(columns=list(FIELDS))
+    return table.take(codes).reset_index(drop=True)
+
+# ---------------- Casos sintéticos e bancada ----------------
+def legacy_parse_price(text: str) -> float:
+    """Implementação anterior do lg1.parse_price (referência da bancada)."""
+    if not text:
+        return 0.0
+    m = regex.search(r'(\d+(?:[.,]\d{2})?)', text)
+    return float(m.group(1).replace(',', '.')) if m else 0.0
+
+def brl(value: float, thousands: bool = True, cents: bool = True, prefix: str = "R$ ") -> str:
+    integer, dec = f"{value:.2f}".split('.')
+    if thousands:
+        integer = f"{int(integer):,}".replace(',', '.')
+    return prefix + integer + (',' + dec if cents else '')
+
+def random_case(r: random.Random) -> tuple[str, dict]:
+    """Texto de preço sintético e o resultado esperado (price, prev_price, max_price, kind)."""
+    def value(lo=0.5, hi=20000.0):
+        v = round(r.uniform(lo, hi) if r.random() < 0.3 else r.uniform(lo, 150.0), 2)
+        return v if r.random() < 0.7 else float(round(v))
+
+    def fmt(v, prefix=None):
+        cents = v != round(v) or r.random() < 0.8
+        return brl(v, thousands=r.random() < 0.8, cents=cents,
+                   prefix=prefix if prefix is not None else r.choice(["R$ ", "R$", "R$\u00a0", "r$ "]))
+
+    kind = r.choice([SIMPLE, SIMPLE, FROM, PROMO, PROMO, RANGE])
+    if kind == SIMPLE:
+        v = value()
+        template = r.choice(["{}", "{}", "{} cada", "Açaí 300ml {}", "{} /un", "2 unidades por {}"])
+        # Sem "R$" só onde não há outro número no texto
+        text = template.format(fmt(v, "" if template in ("{}", "{} cada") and r.random() < 0.2 else None))
+        return text, {'price': v, 'prev_price': None, 'max_price': None, 'kind': SIMPLE}
+    if kind == FROM:
+        v = value()
+        text = r.choice(["A partir de {}", "a partir de {}", "A PARTIR DE {}"]).format(fmt(v))
+        return text, {'price': v, 'prev_price': None, 'max_price': None, 'kind': FROM}
+    lo = value(0.5, 500.0)
+    hi = round(lo + r.choice([0.5, 1.0, 5.0, r.uniform(0.01, 200.0)]), 2)
+    if kind == PROMO:
+        text = r.choice(["De {} por {}", "de {} por {}", "{} {}", "{}\n{}"]).format(fmt(hi), fmt(lo))
+        return text, {'price': lo, 'prev_price': hi, 'max_price': None, 'kind': PROMO}
+    template = r.choice(["{} - {}", "{} a {}", "{} até {}", "{} – {}"])
+    # Limite de cima às vezes sem "R$" ("R$ 15 a 20")
+    text = template.format(fmt(lo), fmt(hi, "" if r.random() < 0.25 else None))
+    return text, {'price': lo, 'prev_price': None, 'max_price': hi, 'kind': RANGE}
+
+def bench(n: int = 1_000_000, unique: int = 20_000, plain: float = 0.8, seed: int = 1) -> list[dict]:
+    """
+    Um milhão de textos (sorteados de 'unique' distintos; 0 = todos distintos):
+    função antiga x parse x parse_unique. 'plain': fração no formato típico do card
+    ("R$ 19,90"); o resto vem de random_case (milhar, faixas, de/por).
+    """
+    r = random.Random(seed)
+    pool = [brl(round(r.uniform(1.0, 150.0), 2)) if r.random() < plain else random_case(r)[0]
+            for _ in range(unique or n)]
+    texts = pool if not unique else [pool[r.randrange(len(pool))] for _ in range(n)]
+
+    rows = []
+
+    def timed(label, fn):
+        started = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - started
+        rows.append({'método': label, 'segundos': round(elapsed, 3), 'textos/s': int(len(texts) / elapsed)})
+        return out
+
+    old = timed("lg1.parse_price antigo", lambda: [legacy_parse_price(t) for t in texts])
+    new = timed("precos.parse_price", lambda: [parse_price(t) for t in texts])
+    timed("precos.parse (dict)", lambda: [parse(t) for t in texts])
+    timed("precos.parse_unique", lambda: parse_unique(texts))
+    diverged = sum(1 for a, b in zip(old, new) if abs(a - b) >= 0.005)
+    rows.append({'método': f"divergências antigo x novo: {diverged} ({diverged / len(texts):.1%})",
+                 'segundos': None, 'textos/s': None})
+    return rows
+
+# -------- Main --------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leitura de preços em reais (pt-BR)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_ler = sub.add_parser("ler", help="mostra o resultado do parse de cada texto")
+    p_ler.add_argument("textos", nargs="+")
+    p_bench = sub.add_parser("bench", help="função antiga x parse x parse_unique")
+    p_bench.add_argument("--n", type=int, default=1_000_000)
+    p_bench.add_argument("--unicos", type=int, default=20_000, help="textos distintos (0 = todos distintos)")
+    p_bench.add_argument("--simples", type=float, default=0.8, help="fração de textos 'R$ 19,90'")
+    p_bench.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "ler":
+        for t in args.textos:
+            print(f"{t!r}: {parse(t)}")
+    else:
+        print(pd.DataFrame(bench(args.n, args.unicos, args.simples, args.seed)).to_string(index=False))
+
+
+if __name__ == "__main__":
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+    except Exception:
+        pass
+    main()
@@ -0,0 +1,200 @@
+# tarefas.py
+# Jobs de scraping em segundo plano para o dashboard
+# - Fila com no máximo MAX_PARALLEL execuções simultâneas
+# - Single-flight por loja: cliques concorrentes se anexam ao job em andamento
+# - Saída do lg1.py capturada linha a linha (progresso incremental)
+# - Callbacks ao terminar (ex.: invalidar cache de produtos), antes do job aparecer como
+#   terminado: quem acompanha o status não recarrega com o cache antigo
+
+import os
+import re
+import sys
+import uuid
+import signal
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# ---------------- Configurações ----------------
+DEFAULT_STORE_URL = os.getenv("STORE_URL", "https://app.cardapioweb.com/acai_moto_food")
+SCRAPER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lg1.py")
+JOB_TIMEOUT = int(os.getenv("SCRAPE_JOB_TIMEOUT", "300"))
+MAX_PARALLEL = int(os.getenv("SCRAPE_MAX_PARALLEL", "2"))
+MAX_OUTPUT_LINES = 2000
+MAX_FINISHED_JOBS = 50
+
+# Linha emitida pelo lg1.py durante a extração: "PROGRESSO 12/340"
+PROGRESS_RE = re.compile(r"^PROGRESSO (\d+)/(\d+)")
+
+QUEUED, RUNNING, DONE, FAILED, TIMEOUT = "na fila", "rodando", "concluído", "erro", "timeout"
+ACTIVE = (QUEUED, RUNNING)
+
+
+class ScrapeJob:
+    """Estado de uma execução do lg1.py. Leitura segura entre threads via snapshot()."""
+
+    def __init__(self, store_url: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.store_url = store_url
+        self.status = QUEUED
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at = None
+        self.finished_at = None
+        self.returncode = None
+        self.outcome = None  # status final, já visível para os callbacks de término
+        self.progress = 0.0
+        self.attached = 0  # quantos cliques foram anexados a este job
+        self._output = deque(maxlen=MAX_OUTPUT_LINES)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def append_line(self, line: str):
+        line = line.rstrip("\n")
+        m = PROGRESS_RE.match(line)
+        with self._lock:
+            if m:
+                done, total = int(m.group(1)), int(m.group(2))
+                # Extração vale até 90%; o restante é o upsert
+                self.progress = 0.9 * done / total if total else self.progress
+            else:
+                self._output.append(line)
+
+    def _set(self, **fields):
+        with self._lock:
+            for k, v in fields.items():
+                setattr(self, k, v)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done.wait(timeout)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'id': self.id,
+                'store_url': self.store_url,
+                'status': self.status,
+                'progress': self.progress,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'returncode': self.returncode,
+                'attached': self.attached,
+                'output': "\n".join(self._output),
+            }
+
+
+def kill_tree(proc: subprocess.Popen):
+    """Mata o lg1.py e os filhos dele (Chromium do Playwright), não só o processo Python."""
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)  # grupo criado com start_new_session=True
+        else:
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class ScrapeJobManager:
+    """
+    Gerenciador compartilhado (um por processo). Use com st.cache_resource
+    para que todas as sessões do Streamlit vejam os mesmos jobs.
+    """
+
+    def __init__(self, max_workers: int = MAX_PARALLEL, timeout: int = JOB_TIMEOUT,
+                 on_finish=None):
+        self.timeout = timeout
+        self.on_finish = list(on_finish or [])
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape")
+        self._lock = threading.Lock()
+        self._jobs: dict[str, ScrapeJob] = {}
+        self._active_by_store: dict[str, ScrapeJob] = {}
+        self._latest_by_store: dict[str, ScrapeJob] = {}
+
+    def submit(self, store_url: str = DEFAULT_STORE_URL) -> tuple[ScrapeJob, bool]:
+        """Enfileira um scraping. Se já houver um ativo para a loja, retorna ele (created=False)."""
+        with self._lock:
+            job = self._active_by_store.get(store_url)
+            if job is not None and job.active:
+                job._set(attached=job.attached + 1)
+                return job, False
+            job = ScrapeJob(store_url)
+            self._jobs[job.id] = job
+            self._active_by_store[store_url] = job
+            self._latest_by_store[store_url] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        return job, True
+
+    def get(self, job_id: str | None) -> ScrapeJob | None:
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def latest(self, store_url: str = DEFAULT_STORE_URL) -> ScrapeJob | None:
+        with self._lock:
+            return self._latest_by_store.get(store_url)
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if not j.active]
+        for j in sorted(finished, key=lambda j: j.created_at)[:-MAX_FINISHED_JOBS or None]:
+            if self._latest_by_store.get(j.store_url) is not j:
+                self._jobs.pop(j.id, None)
+
+    def _run(self, job: ScrapeJob):
+        env = dict(os.environ, STORE_URL=job.store_url, PROGRESS_LOG="1", PYTHONIOENCODING="utf-8")
+        job._set(status=RUNNING, started_at=datetime.now(timezone.utc))
+        status, returncode = FAILED, None
+        try:
+            # -u: sem buffer, para a saída chegar linha a linha
+            proc = subprocess.Popen(
+                [sys.executable, "-u", SCRAPER_PATH],
+                cwd=os.path.dirname(SCRAPER_PATH),
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                bufsize=1,
+                start_new_session=(os.name == "posix"),  # grupo próprio: o timeout mata o Chromium junto
+            )
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                kill_tree(proc)
+
+            watchdog = threading.Timer(self.timeout, kill)
+            watchdog.start()
+            try:
+                for line in proc.stdout:
+                    job.append_line(line)
+                returncode = proc.wait()
+            finally:
+                watchdog.cancel()
+
+            if timed_out.is_set():
+                status = TIMEOUT
+                job.append_line(f"Scraping demorou demais (timeout de {self.timeout}s).")
+            elif returncode == 0:
+                status = DONE
+        except Exception as e:
+            job.append_line(f"Erro ao rodar scraping: {e}")
+        finally:
+            job._set(outcome=status, returncode=returncode, finished_at=datetime.now(timezone.utc))
+            # Callbacks primeiro: enquanto rodam, o job continua ativo para quem acompanha
+            for cb in self.on_finish:
+                try:
+                    cb(job)
+                except Exception as e:
+                    job.append_line(f"AVISO: callback de término falhou: {e}")
+            job._set(status=status, progress=1.0 if status == DONE else job.progress)
+            with self._lock:
+                if self._active_by_store.get(job.store_url) is job:
+                    del self._active_by_store[job.store_url]
+            job._done.set()
@@ -0,0 +1,25 @@
+# test_agendador.py
+# Decisão de rodar fora do plano (acompanhamento pós-mudança), sem Firestore
+
+from datetime import datetime, timedelta, timezone
+
+from agendador import FOLLOWUP_WINDOW, should_run
+
+def test_followup_runs_every_hour_after_a_change():
+    # Cron às :05; a coleta grava last_seen_at uns minutos depois
+    cron = datetime(2026, 3, 2, 10, 5, tzinfo=timezone.utc)
+    last_change = cron + timedelta(minutes=2)
+    last_run = last_change
+    runs = []
+    for h in range(1, FOLLOWUP_WINDOW + 2):
+        now = cron + timedelta(hours=h)
+        run, reason = should_run(now, slots=[], last_run=last_run, last_change=last_change)
+        if run:
+            runs.append(h)
+            last_run = now + timedelta(minutes=2)
+    assert runs == list(range(1, FOLLOWUP_WINDOW + 1))  # uma por hora até o fim da janela
+
+def test_same_hour_is_skipped():
+    now = datetime(2026, 3, 2, 10, 55, tzinfo=timezone.utc)
+    run, reason = should_run(now, slots=[], last_run=now - timedelta(minutes=40), last_change=now)
+    assert not run and reason == "já rodou nesta hora"
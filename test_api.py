@@ -0,0 +1,91 @@
+# test_api.py
+# Rotas da API contra um SQLite temporário, chamando o app ASGI direto
+
+import asyncio
+import gzip
+import json
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+import api
+from armazenamento import SQLRepository, update_manifest
+
+def call(app, path, query=b"", headers=()):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request'}
+
+    async def send(msg):
+        sent.append(msg)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query,
+             'headers': [(k.encode(), v.encode()) for k, v in headers]}
+    asyncio.run(app(scope, receive, send))
+    status = sent[0]['status']
+    hdrs = {k.decode(): v.decode() for k, v in sent[0]['headers']}
+    return status, hdrs, sent[1]['body']
+
+@pytest.fixture
+def app(tmp_path):
+    repo = SQLRepository(str(tmp_path / "api.sqlite3"))
+    now = datetime.now(timezone.utc)
+    repo.upsert_products([{'name': f"Produto {i:03d} com descrição longa", 'price': 10.0 + i}
+                          for i in range(40)], now=now)
+    return api.create_app(repo)
+
+def test_history_of_unknown_slug_is_404_without_db(app, monkeypatch):
+    status, _, _ = call(app, '/products')
+    assert status == 200
+    calls = []
+    monkeypatch.setattr(SQLRepository, 'price_history', lambda *a, **kw: calls.append(a) or [])
+    status, _, body = call(app, '/products/nao-existe/history')
+    assert status == 404 and calls == []
+    assert call(app, '/products/produto-001-com-descricao-longa/history')[0] == 200
+
+def test_etag_differs_per_encoding(app):
+    _, plain, _ = call(app, '/products')
+    _, gz, body = call(app, '/products', headers=[('accept-encoding', 'gzip')])
+    assert gz['content-encoding'] == 'gzip' and json.loads(gzip.decompress(body))['count'] == 40
+    assert plain['etag'] != gz['etag']
+    # Revalidação: só o ETag da mesma representação (forte ou fraco) dá 304
+    assert call(app, '/products', headers=[('if-none-match', plain['etag'])])[0] == 304
+    assert call(app, '/products', headers=[('if-none-match', 'W/' + plain['etag'])])[0] == 304
+    assert call(app, '/products', headers=[('accept-encoding', 'gzip'),
+                                          ('if-none-match', plain['etag'])])[0] == 200
+
+def test_cache_keys_are_normalized_and_bounded(app, monkeypatch):
+    monkeypatch.setattr(api, 'API_CACHE_MAX', 3)
+    call(app, '/products', b'search=%20Produto%20')
+    call(app, '/products', b'search=produto')
+    call(app, '/products', b'hours=999999999')
+    call(app, '/products', b'hours=87600')
+    _, _, body = call(app, '/_stats')
+    stats = json.loads(body)
+    assert (stats['cache_misses'], stats['cache_hits']) == (2, 2)
+    for h in range(1, 6):
+        call(app, '/products', f'hours={h}'.encode())
+    _, _, body = call(app, '/_stats')
+    stats = json.loads(body)
+    assert stats['cache_entries'] == 3 and stats['cache_evictions'] == 4
+
+def test_products_hides_delisted(tmp_path):
+    repo = SQLRepository(str(tmp_path / "api.sqlite3"))
+    now = datetime.now(timezone.utc)
+    items = [{'name': f"Item {i}", 'price': 5.0 + i} for i in range(3)]
+    repo.upsert_products(items, now=now)
+    update_manifest(repo, "loja", items, "r1", now=now)
+    update_manifest(repo, "loja", items[:2], "r2", now=now)
+    _, _, body = call(api.create_app(repo), '/products')
+    assert sorted(p['name'] for p in json.loads(body)['products']) == ["Item 0", "Item 1"]
+
+def test_mirror_poll_runs_off_the_event_loop(app, monkeypatch):
+    call(app, '/products')
+    threads = []
+    poll = api.ProductMirror.poll
+    monkeypatch.setattr(api.ProductMirror, 'poll', lambda self, *a, **kw: threads.append(threading.current_thread())
+                        or poll(self, *a, **kw))
+    assert call(app, '/products/produto-001-com-descricao-longa/history')[0] == 200
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,275 @@
+# test_armazenamento.py
+# Contrato do repositório, igual para os dois backends:
+# - sql: arquivo SQLite temporário
+# - firestore: só com o emulador (FIRESTORE_EMULATOR_HOST); cada teste usa nomes
+#   únicos e apaga o que gravou
+# Rodar: python -m pytest -q test_armazenamento.py
+
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import armazenamento
+from armazenamento import (FirestoreRepository, SQLRepository, bootstrap_checkpoint, build_manifest,
+                           category_id, init_firestore, join_lists, menu_as_of, plan_upsert, replay_menu,
+                           slugify, split_lists, update_manifest)
+
+def purge_firestore(db, pids, cids, store):
+    for pid in pids:
+        db.recursive_delete(db.collection('products').document(pid))
+    for cid in cids:
+        db.recursive_delete(db.collection('categories').document(cid))
+    db.recursive_delete(db.collection('manifests').document(store))
+    for snap in db.collection('menu_diffs').where('store', '==', store).stream():
+        db.recursive_delete(snap.reference)
+    db.recursive_delete(db.collection('menu_checkpoints').document(store))
+
+@pytest.fixture
+def tag():
+    return uuid.uuid4().hex[:8]
+
+@pytest.fixture(params=["sql", "firestore"])
+def repo(request, tmp_path, tag):
+    if request.param == "sql":
+        r = SQLRepository(str(tmp_path / "precos.sqlite3"))
+        yield r
+        r.conn.close()
+        return
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        pytest.skip("FIRESTORE_EMULATOR_HOST não definido (emulador do Firestore)")
+    r = FirestoreRepository(init_firestore())
+    r.created = set()
+    yield r
+    purge_firestore(r.db, r.created, {category_id(f"zz-{tag} {c}") for c in ("Açaís", "Bolos")}, f"zz-{tag}")
+
+def product(tag, name, price, **extra):
+    return {'name': f"zz-{tag} {name}", 'price': price, 'description': 'teste', 'category': f"zz-{tag} Açaís",
+            **extra}
+
+def upsert(repo, products, now):
+    if isinstance(repo, FirestoreRepository):
+        repo.created.update(slugify(p['name']) for p in products)
+    return repo.upsert_products(products, now=now)
+
+@pytest.fixture
+def t0():
+    return datetime.now(timezone.utc).replace(microsecond=0) - timedelta(minutes=10)
+
+def test_upsert_detects_changes_and_is_idempotent(repo, tag, t0):
+    t1 = t0 + timedelta(minutes=5)
+    a, b = product(tag, "Açaí 300ml", 10.0), product(tag, "Açaí 500ml", 15.0)
+
+    r = upsert(repo, [a, b], t0)
+    assert [x['prev_price'] for x in r] == [None, None]
+
+    r = upsert(repo, [dict(a, price=12.0), b], t1)
+    assert r[0]['changed'] and r[0]['delta'] == 2.0
+    assert not r[1]['changed']
+
+    # Replay da mesma coleta (WAL): não conta a mudança de novo
+    r = upsert(repo, [dict(a, price=12.0), b], t1)
+    assert not r[0]['changed']
+
+    pid = slugify(a['name'])
+    assert [h['price'] for h in repo.price_history(pid)] == [10.0, 12.0]
+    assert [h['price'] for h in repo.price_history(pid, since=t1)] == [12.0]
+    doc = next(p for p in repo.recent_changes(t1) if p['name'] == a['name'])
+    assert doc['change_count'] == 1 and doc['last_price'] == 10.0
+
+def test_upsert_dedups_by_pid(repo, tag, t0):
+    # Mesmo slug: vale a última leitura, um resultado e um ponto de histórico
+    r = upsert(repo, [product(tag, "Pão de Queijo", 5.0), product(tag, "Pao de queijo", 6.0)], t0)
+    assert len(r) == 1 and r[0]['current_price'] == 6.0
+    assert [h['price'] for h in repo.price_history(slugify(f"zz-{tag} Pão de Queijo"))] == [6.0]
+
+def test_queries(repo, tag, t0):
+    t1 = t0 + timedelta(minutes=5)
+    a, b = product(tag, "Açaí 300ml", 10.0), product(tag, "Açaí 500ml", 15.0)
+    upsert(repo, [a, b], t0)
+    upsert(repo, [dict(a, price=12.0), b], t1)
+
+    names = [p['name'] for p in repo.search_prefix(f"zz-{tag} Açaí", limit=10)]
+    assert sorted(names) == sorted([a['name'], b['name']])
+    changes = [p['name'] for p in repo.recent_changes(t1, limit=10)]
+    assert a['name'] in changes and b['name'] not in changes
+    seen = [p['name'] for p in repo.list_products(since=t1)]
+    assert a['name'] in seen and b['name'] in seen
+
+def test_manifest_delists_and_relists(repo, tag, t0):
+    store = f"zz-{tag}"
+    a, b = product(tag, "Açaí 300ml", 12.0), product(tag, "Açaí 500ml", 15.0, extracted_prev_price=18.0)
+    upsert(repo, [a, b], t0)
+    run = t0.strftime('%Y%m%dT%H%M%S') + f"-{tag}"
+
+    update_manifest(repo, store, [a, b], run + '1', now=t0)
+    d = update_manifest(repo, store, [dict(a, price=13.0)], run + '2', now=t0 + timedelta(seconds=1))
+    assert d['removed'] == [slugify(b['name'])] and d['changed'] == [slugify(a['name'])]
+    assert repo.load_manifest(store) == build_manifest([dict(a, price=13.0)])
+    assert any(x.get('run_id') == run + '2' for x in repo.menu_diffs(limit=10))
+
+    def doc_b():
+        return next(p for p in repo.search_prefix(b['name']) if p['name'] == b['name'])
+
+    assert doc_b().get('delisted_at') is not None
+    upsert(repo, [b], t0 + timedelta(seconds=2))
+    assert doc_b().get('delisted_at') is None
+    assert doc_b().get('category') == b['category']
+
+def test_list_products_filters_before_limit(repo, tag, t0):
+    # Os primeiros por pid estão fora do cardápio ou em outra categoria: o filtro vem antes do limite
+    gone = [product(tag, f"A{i:02d}", 5.0) for i in range(5)]
+    bolos = [product(tag, f"B{i:02d}", 8.0, category=f"zz-{tag} Bolos") for i in range(5)]
+    keep = [product(tag, f"C{i:02d}", 9.0) for i in range(3)]
+    upsert(repo, gone + bolos + keep, t0)
+    store = f"zz-{tag}"
+    run = t0.strftime('%Y%m%dT%H%M%S') + f"-{tag}"
+    update_manifest(repo, store, gone + bolos + keep, run + '1', now=t0)
+    update_manifest(repo, store, bolos + keep, run + '2', now=t0 + timedelta(seconds=1))
+
+    mine = lambda rows: sorted(p['name'] for p in rows if p['name'].startswith(f"zz-{tag}"))
+    listed = mine(repo.list_products(since=t0, listed_only=True))
+    assert listed == sorted(p['name'] for p in bolos + keep)
+    açaís = mine(repo.list_products(since=t0, listed_only=True, category=f"zz-{tag} Açaís"))
+    assert açaís == sorted(p['name'] for p in keep)
+    if isinstance(repo, SQLRepository):
+        assert mine(repo.list_products(limit=3, listed_only=True, category=f"zz-{tag} Açaís")) == açaís
+
+def test_category_aggregates(repo, tag, t0):
+    a, b = product(tag, "Açaí 300ml", 10.0), product(tag, "Açaí 500ml", 15.0, extracted_prev_price=18.0)
+    bolo = product(tag, "Bolo", 8.0, category=f"zz-{tag} Bolos")
+    upsert(repo, [a, b, bolo], t0)
+    upsert(repo, [dict(a, price=12.0), b], t0 + timedelta(minutes=1))
+
+    cats = {c['id']: c for c in repo.list_categories()}
+    cat = cats[category_id(a['category'])]
+    assert (cat['count'], cat['min_price'], cat['max_price'], cat['promo_count']) == (2, 12.0, 15.0, 1)
+    assert [c['pid'] for c in cat['recent_changes']] == [slugify(a['name'])]
+    assert 'members' not in cat
+    assert cats[category_id(bolo['category'])]['count'] == 1
+
+    # Mudou de categoria: sai do agregado antigo
+    upsert(repo, [dict(bolo, category=a['category'])], t0 + timedelta(minutes=2))
+    cats = {c['id']: c for c in repo.list_categories()}
+    assert cats[category_id(a['category'])]['count'] == 3
+    assert cats[category_id(bolo['category'])]['count'] == 0
+
+def test_purged_products_leave_category(repo, tag, t0):
+    store = f"zz-{tag}"
+    a, b = product(tag, "Açaí 300ml", 10.0), product(tag, "Açaí 500ml", 15.0)
+    bolo = product(tag, "Bolo", 8.0, category=f"zz-{tag} Bolos")
+    bolos = [product(tag, f"Bolo {i}", 9.0, category=f"zz-{tag} Bolos") for i in range(8)]
+    upsert(repo, [a, b, bolo] + bolos, t0)
+    update_manifest(repo, store, [a, b, bolo] + bolos, f"{tag}-1", now=t0)
+
+    # Purga pelo repositório: doc, histórico e membro da categoria juntos
+    assert repo.delete_product(slugify(a['name'])) >= 1
+    assert repo.delete_product(slugify(a['name'])) == 0
+    cats = {c['id']: c for c in repo.list_categories()}
+    assert (cats[category_id(a['category'])]['count'], cats[category_id(a['category'])]['min_price']) == (1, 15.0)
+
+    # Apagado por fora (sem tocar nos agregados): sai dos membros quando some do cardápio
+    if isinstance(repo, FirestoreRepository):
+        repo.db.recursive_delete(repo.db.collection('products').document(slugify(bolo['name'])))
+    else:
+        with repo.conn:
+            repo.conn.execute("DELETE FROM products WHERE pid = ?", (slugify(bolo['name']),))
+    diff = update_manifest(repo, store, [b] + bolos, f"{tag}-2", now=t0 + timedelta(minutes=1))
+    assert diff['skipped'] is None
+    cats = {c['id']: c for c in repo.list_categories()}
+    assert (cats[category_id(bolo['category'])]['count'], cats[category_id(bolo['category'])]['min_price']) == (8, 9.0)
+    assert cats[category_id(a['category'])]['count'] == 1
+
+def test_checkpoint_and_menu_as_of(repo, tag, t0):
+    store = f"zz-{tag}"
+    entries = [(slugify(f"zz-{tag} Item {i}"), f"zz-{tag} Item {i}", float(i)) for i in range(3)]
+    repo.save_checkpoint(store, t0, entries)
+    assert repo.latest_checkpoint_at(store) == t0
+    assert repo.load_checkpoint(store, t0 + timedelta(minutes=1)) == (t0, entries)
+    assert repo.load_checkpoint(store, t0 - timedelta(minutes=1)) is None
+
+    snap = menu_as_of(repo, store, [t0 + timedelta(minutes=1)])[t0 + timedelta(minutes=1)]
+    assert snap['checkpoint_at'] == t0
+    assert {pid: v['price'] for pid, v in snap['menu'].items()} == {e[0]: e[2] for e in entries}
+
+def test_menu_as_of_bootstrap_and_other_stores(repo, tag, t0):
+    store, other = f"zz-{tag}", f"zz-{tag}-outra"
+    a, b = product(tag, "Açaí 300ml", 10.0), product(tag, "Açaí 500ml", 15.0)
+    x = product(tag, "Outra loja", 7.0)
+    t1, t2 = t0 + timedelta(minutes=1), t0 + timedelta(minutes=2)
+    upsert(repo, [a, b, x], t0)
+    update_manifest(repo, store, [a, b], f"{tag}-1", now=t0)
+    update_manifest(repo, other, [x], f"{tag}-2", now=t0)
+    upsert(repo, [dict(a, price=11.0), dict(x, price=8.0)], t1)
+
+    # Sem checkpoint: recusa em vez de reaplicar tudo desde o início
+    with pytest.raises(ValueError):
+        menu_as_of(repo, store, [t2])
+    assert bootstrap_checkpoint(repo, store) == t0
+    assert bootstrap_checkpoint(repo, store) is None
+    menu = menu_as_of(repo, store, [t2])[t2]['menu']
+    assert {v['name']: v['price'] for v in menu.values()} == {a['name']: 11.0, b['name']: 15.0}
+    if isinstance(repo, FirestoreRepository):
+        purge_firestore(repo.db, [], [], other)
+
+def test_history_generation(repo):
+    before = repo.history_generation()
+    repo.bump_history_generation()
+    assert repo.history_generation() == before + 1
+
+# ---------------- Regras do upsert (sem banco) ----------------
+def apply(existing, products, now):
+    results, ops = plan_upsert(products, existing, now)
+    for op in ops:
+        existing[op['pid']] = {**existing.get(op['pid'], {}), **op['data']}
+    return results
+
+def test_stats_advance_only_on_applied_changes(t0):
+    existing = {}
+    p = {'name': 'Bolo', 'price': 10.0}
+    apply(existing, [p], t0)
+    for i, price in enumerate([11.0, 11.0, 12.0], start=1):
+        apply(existing, [dict(p, price=price)], t0 + timedelta(hours=i))
+    stats = existing['bolo']['price_stats']
+    assert stats['n'] == 3 and stats['last'] == [10.0, 11.0, 12.0]
+    # Replay de uma coleta já aplicada ou mais antiga que a estatística
+    apply(existing, [dict(p, price=12.0)], t0 + timedelta(hours=3))
+    apply(existing, [dict(p, price=11.0)], t0 + timedelta(hours=1))
+    assert existing['bolo']['price_stats']['n'] == 3
+
+def test_held_flag_is_cleared_when_price_returns(t0, monkeypatch):
+    monkeypatch.setattr(armazenamento, 'HOLD_ANOMALIES', True)
+    existing = {}
+    p = {'name': 'Bolo', 'price': 10.0}
+    apply(existing, [p], t0)
+    r = apply(existing, [dict(p, price=100.0)], t0 + timedelta(hours=1))
+    assert r[0]['held'] and existing['bolo']['price_flag']
+    apply(existing, [p], t0 + timedelta(hours=2))
+    doc = existing['bolo']
+    assert doc['current_price'] == 10.0 and doc['pending_price'] is None
+    assert doc['price_flag'] is None and doc['price_score'] is None
+
+def test_ambiguous_read_is_held_until_repeated(t0):
+    existing = {}
+    p = {'name': 'Bolo', 'price': 10.0}
+    apply(existing, [p], t0)
+    low = dict(p, price=1.234, price_confidence=0.6)
+    r = apply(existing, [low], t0 + timedelta(hours=1))
+    assert r[0]['held'] and r[0]['flag'] == 'leitura_ambigua'
+    assert existing['bolo']['current_price'] == 10.0 and existing['bolo']['price_stats']['n'] == 1
+    r = apply(existing, [low], t0 + timedelta(hours=2))
+    assert r[0]['changed'] and existing['bolo']['current_price'] == 1.234
+
+def test_replay_fills_name_of_price_before_diff(t0):
+    t1, t2 = t0 + timedelta(minutes=1), t0 + timedelta(minutes=2)
+    snap = replay_menu([('a', 'A', 1.0)], [{'pid': 'b', 'at': t1, 'price': 5.0}],
+                       [{'at': t1, 'added': ['b'], 'added_entries': [['b', 'Bolo', 5.0]]}], [t2])[t2]
+    assert snap == {'a': {'name': 'A', 'price': 1.0}, 'b': {'name': 'Bolo', 'price': 5.0}}
+
+def test_split_and_join_lists():
+    lists = {'pids': [f"p{i}" for i in range(7)], 'hashes': [f"h{i}" for i in range(7)], 'vazio': []}
+    chunks = split_lists(lists, 4)
+    assert [sum(len(v) for v in c.values()) for c in chunks] == [4, 4, 4, 2]
+    assert join_lists(chunks, ('pids', 'hashes', 'vazio')) == lists
+    assert split_lists({'added': []}, 4) == [{}]
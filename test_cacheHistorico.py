@@ -0,0 +1,44 @@
+# test_cacheHistorico.py
+# Refresh incremental, reescrita de pontos antigos (geração) e recarga completa
+
+from datetime import datetime, timedelta, timezone
+
+from cacheHistorico import HistoryCache
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+class FakeHistory:
+    def __init__(self, prices):
+        self.points = [{'at': T0 + timedelta(hours=i), 'price': p} for i, p in enumerate(prices)]
+        self.generation = 0
+        self.calls = []
+
+    def fetch(self, pid, since=None):
+        self.calls.append(since)
+        return [p for p in self.points if since is None or p['at'] >= since]
+
+def test_incremental_refresh_appends_new_points():
+    h = FakeHistory([10.0, 12.0])
+    cache = HistoryCache(h.fetch, ttl=0, full_reload=3600)
+    assert list(cache.get('a')[1]) == [10.0, 12.0]
+    h.points.append({'at': T0 + timedelta(hours=5), 'price': 13.0})
+    assert list(cache.get('a')[1]) == [10.0, 12.0, 13.0]
+    assert h.calls[0] is None and h.calls[1] == T0 + timedelta(hours=1)
+
+def test_generation_change_drops_rewritten_points():
+    h = FakeHistory([10.0, 11.0, 12.0])
+    cache = HistoryCache(h.fetch, ttl=0, full_reload=3600, generation=lambda: h.generation)
+    assert len(cache.get('a')[0]) == 3
+    # Compactação apaga o ponto do meio: o incremental não enxergaria
+    del h.points[1]
+    h.generation += 1
+    assert list(cache.get('a')[1]) == [10.0, 12.0]
+    assert cache.stats()['bytes'] == cache.get('a')[0].nbytes + cache.get('a')[1].nbytes
+
+def test_full_reload_after_interval():
+    h = FakeHistory([10.0, 11.0])
+    cache = HistoryCache(h.fetch, ttl=0, full_reload=0)
+    cache.get('a')
+    h.points[0]['price'] = 9.0  # reescrito fora dos comandos que sobem a geração
+    assert list(cache.get('a')[1]) == [9.0, 11.0]
+    assert cache.stats()['full_reloads'] == 2
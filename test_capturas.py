@@ -0,0 +1,76 @@
+# test_capturas.py
+# Extração offline do HTML salvo e backfill do histórico a partir da re-extração
+
+from datetime import datetime, timedelta, timezone
+
+from armazenamento import SQLRepository
+from capturas import backfill_history, extract_cards, history_points, list_captures, reextract, save_capture
+
+T0 = datetime(2026, 3, 1, 12, tzinfo=timezone.utc)
+
+PAGE = """<html><body><main>
+<h2>Lanches</h2>
+<ul><li><div><h3 class="text-base font-medium leading-6 text-gray-700 line-clamp-2">X-Burger</h3>
+<p class="mt-1 text-sm font-light text-gray-500 line-clamp-3">Pão e carne</p>
+<div><span class="text-sm text-gray-500 line-through">R$ 30,00</span><span class="text-base text-green-500">R$ 25,00</span></div>
+</div></li></ul>
+<h2>Bebidas</h2>
+<section><h3 class="text-base font-medium leading-6 text-gray-700 line-clamp-2">Suco</h3></section>
+<section><div class="mt-3 text-base text-gray-700 md:mt-6">A partir de R$ 8,00</div></section>
+<section><h3 class="text-base font-medium leading-6 text-gray-700 line-clamp-2">X-BURGER</h3></section>
+</main></body></html>"""
+
+def test_extract_cards_inside_card_and_following():
+    cards = extract_cards(PAGE)
+    assert [c[0] for c in cards] == ["X-Burger", "Suco"]
+    assert cards[0][1:3] == ("R$ 25,00", "R$ 30,00") and cards[0][5] == "Lanches"
+    # Sem ancestral com preço: primeiro elemento depois do nome
+    assert cards[1][3] == "A partir de R$ 8,00" and cards[1][5] == "Bebidas"
+
+def test_reextract_builds_products_from_saved_pages(tmp_path):
+    d = str(tmp_path / "capturas")
+    save_capture(PAGE, [], T0, "loja", capture_dir=d)
+    save_capture(PAGE, [], T0 + timedelta(hours=1), "loja", capture_dir=d)
+    r = reextract(list_captures(capture_dir=d), workers=1, capture_dir=d)
+    assert (r['pages'], r['cards']) == (1, 2)
+    assert [[(p['name'], p['price']) for p in products] for _, _, products in r['runs']] == \
+        [[("X-Burger", 25.0), ("Suco", 8.0)]] * 2
+
+def run(hours, price):
+    return (T0 + timedelta(hours=hours), f"c{hours}", [{'name': 'Bolo', 'price': price}])
+
+def test_history_points_only_on_change():
+    runs = [run(0, 10.0), run(1, 10.0), run(2, 12.0), run(3, 12.0)]
+    assert [(p['at'], p['price']) for p in history_points(runs)] == [(T0, 10.0), (T0 + timedelta(hours=2), 12.0)]
+    assert [p['price'] for p in history_points(runs, previous={'bolo': 10.0})] == [12.0]
+
+def test_backfill_replaces_wrong_points_and_current_price(tmp_path):
+    repo = SQLRepository(str(tmp_path / "bf.sqlite3"))
+    repo.upsert_products([{'name': 'Bolo', 'price': 10.0}], now=T0 - timedelta(days=1))
+    # Extração antiga leu "1.234" como 1,234 na coleta das 13h e nunca corrigiu
+    repo.upsert_products([{'name': 'Bolo', 'price': 1.234}], now=T0 + timedelta(hours=1))
+    runs = [run(0, 10.0), run(1, 10.0), run(2, 10.0)]
+    counts = backfill_history(repo, runs)
+    assert counts == {'written': 0, 'deleted': 1, 'fixed': 1, 'products': 1}
+    assert [h['price'] for h in repo.price_history('bolo')] == [10.0]
+    doc = repo.search_prefix('Bolo')[0]
+    assert doc['current_price'] == 10.0 and doc['last_price'] == 10.0
+    assert repo.history_generation() == 1
+
+def test_backfill_keeps_later_changes(tmp_path):
+    repo = SQLRepository(str(tmp_path / "bf.sqlite3"))
+    repo.upsert_products([{'name': 'Bolo', 'price': 10.0}], now=T0)
+    repo.upsert_products([{'name': 'Bolo', 'price': 15.0}], now=T0 + timedelta(days=2))
+    backfill_history(repo, [run(0, 10.0), run(5, 11.0)])
+    assert [h['price'] for h in repo.price_history('bolo')] == [10.0, 11.0, 15.0]
+    assert repo.search_prefix('Bolo')[0]['current_price'] == 15.0
+
+def test_backfill_keeps_points_between_captures(tmp_path):
+    repo = SQLRepository(str(tmp_path / "bf.sqlite3"))
+    repo.upsert_products([{'name': 'Bolo', 'price': 10.0}], now=T0 - timedelta(days=1))
+    # Mudança vista pelo modo watch às 12h30, entre duas coletas com captura
+    repo.upsert_products([{'name': 'Bolo', 'price': 12.0}], now=T0 + timedelta(minutes=30))
+    counts = backfill_history(repo, [run(0, 10.0), run(2, 12.0)])
+    assert counts['deleted'] == 0
+    assert [h['price'] for h in repo.price_history('bolo')] == [10.0, 12.0, 12.0]
+    assert repo.prices_before(['bolo', 'nada'], T0 + timedelta(hours=1)) == {'bolo': 12.0}
@@ -0,0 +1,60 @@
+# test_notificacoes.py
+# Filtros dos assinantes, entrega por entrada do WAL e reenvio, contra o servidor local
+
+import json
+
+import pytest
+
+import notificacoes
+from notificacoes import build_digests, notify_applied, redeliver, start_test_server
+
+def change(name, prev, cur):
+    return {'name': name, 'prev_price': prev, 'current_price': cur, 'changed': cur != prev,
+            'delta': round(cur - prev, 2)}
+
+@pytest.fixture
+def server():
+    srv, received, url = start_test_server()
+    yield received, url
+    srv.shutdown()
+
+def test_invalid_pattern_skips_only_that_subscriber():
+    results = [change("Burger Duplo", 20.0, 25.0), change("Pizza", 40.0, 41.0)]
+    subs = [{'id': 'ruim', 'url': 'http://x', 'pattern': 'burger(', 'min_delta_pct': 0, 'format': 'json'},
+            {'id': 'burger', 'url': 'http://x', 'pattern': 'BURGER', 'min_delta_pct': 0, 'format': 'json'},
+            {'id': 'todos', 'url': 'http://x', 'pattern': '', 'min_delta_pct': 10, 'format': 'json'}]
+    digests = {d['subscriber']: d['body']['count'] for d in build_digests(results, subs)}
+    assert digests == {'burger': 1, 'todos': 1}
+
+def test_load_subscribers_drops_invalid_pattern():
+    subs = notificacoes.load_subscribers(inline=json.dumps([
+        {'id': 'a', 'url': 'http://x', 'pattern': '[z'}, {'id': 'b', 'url': 'http://x', 'pattern': 'z'}]))
+    assert [s['id'] for s in subs] == ['b']
+
+def test_notify_applied_sends_every_wal_entry(server):
+    received, url = server
+    subs = [{'id': 's', 'url': f"{url}/s", 'pattern': '', 'min_delta_pct': 0, 'format': 'json'}]
+    applied = {'run-antiga': [change("Suco", 8.0, 9.0)], 'run-atual': [change("Bolo", 5.0, 6.0)],
+               'run-igual': [change("Pão", 1.0, 1.0)]}
+    r = notify_applied(applied, subscribers=subs)
+    assert r['sent'] == 2
+    assert sorted(x['body']['run_id'] for x in received) == ['run-antiga', 'run-atual']
+
+def test_redeliver_keeps_new_failures(server, tmp_path, monkeypatch):
+    received, url = server
+    path = tmp_path / "falhas.jsonl"
+    digest = {'subscriber': 's', 'url': f"{url}/s", 'run_id': 'r1', 'body': {'text': 'oi'}}
+    path.write_text(json.dumps(digest) + "\n", encoding='utf-8')
+    # Durante o reenvio, outra execução grava uma falha nova no arquivo original
+    real_dispatch = notificacoes.dispatch
+
+    def dispatch(digests, dead_letter_path):
+        with open(dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(digest, run_id='r2')) + "\n")
+        return real_dispatch(digests, dead_letter_path=dead_letter_path)
+
+    monkeypatch.setattr(notificacoes, 'dispatch', dispatch)
+    assert redeliver(str(path))['sent'] == 1
+    assert [x['body'] for x in received] == [{'text': 'oi'}]
+    assert [json.loads(line)['run_id'] for line in path.read_text(encoding='utf-8').splitlines()] == ['r2']
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['falhas.jsonl']
@@ -0,0 +1,80 @@
+# test_precos.py
+# Leitura de preços pt-BR: casos conhecidos, casos sintéticos (random_case) e textos
+# aleatórios; o lote (parse_unique) tem de bater com o parse escalar
+# Rodar: python -m pytest -q test_precos.py
+
+import random
+
+import pandas as pd
+import pytest
+
+import lg1
+from anomalias import MIN_PRICE_CONFIDENCE
+from precos import FROM, PROMO, RANGE, SIMPLE, _parse, parse, parse_unique, random_case
+
+def close(got, exp) -> bool:
+    return (got is None) == (exp is None) and (exp is None or abs(got - exp) < 0.005)
+
+@pytest.mark.parametrize("text, price, prev, high, kind", [
+    ("R$ 19,90", 19.9, None, None, SIMPLE),
+    ("R$ 1.234,90", 1234.9, None, None, SIMPLE),
+    ("A partir de R$ 19,90", 19.9, None, None, FROM),
+    ("De R$ 20,00 por R$ 15,00", 15.0, 20.0, None, PROMO),
+    ("R$ 10,00 - R$ 20,00", 10.0, None, 20.0, RANGE),
+    ("R$ 15 a 20", 15.0, None, 20.0, RANGE),
+    ("R$ 10 até 300ml", 10.0, None, None, SIMPLE),
+    ("Açaí 300ml R$ 12,00", 12.0, None, None, SIMPLE),
+])
+def test_known_cases(text, price, prev, high, kind):
+    got = parse(text)
+    assert close(got['price'], price) and close(got['prev_price'], prev) and close(got['max_price'], high)
+    assert got['kind'] == kind
+
+def test_ambiguous_formats_lower_confidence():
+    assert parse("R$ 19,90")['confidence'] == 1.0
+    assert parse("1.234")['confidence'] < MIN_PRICE_CONFIDENCE
+    assert parse("R$ 1.234.56")['confidence'] < 1.0
+    assert parse("R$ 10,00 - R$ 12.90")['confidence'] < parse("R$ 10,00 - R$ 12,90")['confidence']
+    assert parse("")['kind'] == "vazio" and parse(None)['price'] == 0.0
+
+def test_dot_decimal_is_not_held():
+    # Cardápio com "12.90": decimal com ponto não é ambíguo, não cai abaixo do limiar
+    assert parse("R$ 12.90") == parse("R$ 12,90")
+    assert parse("De R$ 20.00 por R$ 15.00")['confidence'] == 1.0
+    got = parse("12.90")
+    assert got['price'] == 12.9 and got['confidence'] >= MIN_PRICE_CONFIDENCE
+
+def test_synthetic_cases():
+    r = random.Random(1)
+    failures = []
+    for _ in range(20_000):
+        text, exp = random_case(r)
+        got = parse(text)
+        if not (close(got['price'], exp['price']) and got['kind'] == exp['kind']
+                and close(got['prev_price'], exp['prev_price']) and close(got['max_price'], exp['max_price'])):
+            failures.append((text, exp, got))
+    assert failures == []
+
+def test_random_text_never_breaks_and_batch_matches_scalar():
+    r = random.Random(2)
+    alphabet = "0123456789.,R$ -–aédeporpartirDEPOR \n/()xXml"
+    texts = ["".join(r.choice(alphabet) for _ in range(r.randint(0, 30))) for _ in range(5_000)]
+    texts += [random_case(r)[0] for _ in range(5_000)] + [None, ""]
+    for t in texts:
+        got = parse(t)
+        assert got['price'] >= 0 and 0.0 <= got['confidence'] <= 1.0
+    batch = parse_unique(texts)
+    assert [tuple(None if pd.isna(x) else x for x in row) for row in batch.itertuples(index=False)] == \
+        [_parse(t) for t in texts]
+
+def test_build_products_parses_once_and_keeps_confidence():
+    cards = [("Bolo", "R$ 19,90", "R$ 25,00", "", "", "Doces"),
+             ("Torta", "", "", "A partir de R$ 30,00", "", "Doces"),
+             ("Tel novo (11) 99999-9999", "R$ 1,00", "", "", "", ""),
+             ("Suco", "12.90", "", "", "", "Bebidas")]
+    out = lg1.build_products(cards)
+    assert out[2] is None
+    assert (out[0]['price'], out[0]['extracted_prev_price'], out[0]['price_confidence']) == (19.9, 25.0, 1.0)
+    assert out[1]['price'] == 30.0 and out[1]['extracted_base_price'] == 30.0
+    assert out[3]['price'] == 12.9 and MIN_PRICE_CONFIDENCE <= out[3]['price_confidence'] < 1.0
+    assert lg1.build_product(*cards[0]) == out[0]
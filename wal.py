@@ -0,0 +1,167 @@
+# wal.py
+# Write-ahead log local dos resultados do scraping (SQLite, payload JSON comprimido)
+# - append(): grava a coleta antes de qualquer escrita no Firestore
+# - replay(): aplica as entradas pendentes em ordem, em lotes grandes e idempotentes,
+#   e marca cada uma como confirmada
+# Se o Firestore estiver fora, o trabalho do navegador não se perde: a próxima
+# execução (ou 'python wal.py replay') drena o acumulado.
+
+import os
+import sys
+import json
+import zlib
+import uuid
+import sqlite3
+import argparse
+from datetime import datetime, timedelta, timezone
+
+# ---------------- Configurações ----------------
+WAL_PATH = os.getenv("WAL_PATH", "scrape_wal.sqlite3")
+REPLAY_BATCH_SIZE = int(os.getenv("WAL_REPLAY_BATCH_SIZE", "450"))  # máx. 500 ops por batch
+KEEP_COMMITTED_DAYS = int(os.getenv("WAL_KEEP_DAYS", "7"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    seq          INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id       TEXT NOT NULL UNIQUE,
+    scraped_at   TEXT NOT NULL,
+    store_url    TEXT,
+    n_products   INTEGER NOT NULL,
+    payload      BLOB NOT NULL,
+    committed_at TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    last_error   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entries_pending ON entries(committed_at, seq);
+"""
+
+def connect(path: str = WAL_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")  # a entrada precisa sobreviver a queda do processo
+    conn.executescript(SCHEMA)
+    return conn
+
+def encode(products: list[dict]) -> bytes:
+    return zlib.compress(json.dumps(products, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+def decode(payload: bytes) -> list[dict]:
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+# ---------------- Escrita ----------------
+def append(products: list[dict], scraped_at: datetime | None = None, store_url: str | None = None,
+           path: str = WAL_PATH) -> str:
+    """Grava uma coleta no log e retorna o run_id."""
+    scraped_at = scraped_at or datetime.now(timezone.utc)
+    run_id = f"{scraped_at.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO entries (run_id, scraped_at, store_url, n_products, payload) VALUES (?, ?, ?, ?, ?)",
+                (run_id, scraped_at.isoformat(), store_url, len(products), encode(products)),
+            )
+    finally:
+        conn.close()
+    return run_id
+
+# ---------------- Replay ----------------
+def pending(path: str = WAL_PATH) -> list[dict]:
+    conn = connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT seq, run_id, scraped_at, n_products, attempts, last_error FROM entries "
+            "WHERE committed_at IS NULL ORDER BY seq"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [
+        {'seq': r[0], 'run_id': r[1], 'scraped_at': r[2], 'n_products': r[3],
+         'attempts': r[4], 'last_error': r[5]}
+        for r in rows
+    ]
+
+def replay(db, upsert, path: str = WAL_PATH, batch_size: int = REPLAY_BATCH_SIZE,
+           limit: int | None = None) -> dict[str, list[dict]]:
+    """
+    Aplica as entradas pendentes em ordem com upsert(db, products, batch_size=, now=, strict=True)
+    (lg1.batch_upsert_products). O upsert é idempotente: usa o horário original da coleta
+    e IDs determinísticos no histórico, então reaplicar uma entrada parcialmente gravada
+    não duplica pontos nem conta mudança duas vezes.
+    Para na primeira falha (a ordem importa) e propaga a exceção.
+    Retorna {run_id: resultados} das entradas aplicadas.
+    """
+    conn = connect(path)
+    applied = {}
+    try:
+        q = "SELECT seq, run_id, scraped_at, payload FROM entries WHERE committed_at IS NULL ORDER BY seq"
+        if limit:
+            q += f" LIMIT {int(limit)}"
+        for seq, run_id, scraped_at, payload in conn.execute(q).fetchall():
+            try:
+                results = upsert(db, decode(payload), batch_size=batch_size,
+                                 now=datetime.fromisoformat(scraped_at), strict=True) or []
+            except Exception as e:
+                with conn:
+                    conn.execute("UPDATE entries SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                                 (str(e)[:500], seq))
+                raise
+            with conn:
+                conn.execute(
+                    "UPDATE entries SET committed_at = ?, attempts = attempts + 1, last_error = NULL WHERE seq = ?",
+                    (datetime.now(timezone.utc).isoformat(), seq),
+                )
+            applied[run_id] = results
+    finally:
+        conn.close()
+    return applied
+
+def prune(keep_days: int = KEEP_COMMITTED_DAYS, path: str = WAL_PATH) -> int:
+    """Remove entradas já confirmadas há mais de 'keep_days' dias."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=keep_days)).isoformat()
+    conn = connect(path)
+    try:
+        with conn:
+            cur = conn.execute("DELETE FROM entries WHERE committed_at IS NOT NULL AND committed_at < ?", (cutoff,))
+        return cur.rowcount
+    finally:
+        conn.close()
+
+# -------- Main --------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WAL local dos resultados do scraping")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="lista entradas pendentes")
+    p_replay = sub.add_parser("replay", help="aplica entradas pendentes no Firestore")
+    p_replay.add_argument("--limite", type=int, help="no máximo N entradas")
+    p_prune = sub.add_parser("limpar", help="remove entradas confirmadas antigas")
+    p_prune.add_argument("--dias", type=int, default=KEEP_COMMITTED_DAYS)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "status":
+        rows = pending()
+        print(f"Pendentes em {WAL_PATH}: {len(rows)}")
+        for r in rows:
+            err = f" | erro: {r['last_error']}" if r['last_error'] else ""
+            print(f"- {r['run_id']} ({r['scraped_at']}) {r['n_products']} produtos, {r['attempts']} tentativas{err}")
+    elif args.cmd == "replay":
+        import time
+        from lg1 import init_storage, batch_upsert_products, notify
+        db = init_storage()
+        started = time.perf_counter()
+        applied = replay(db, batch_upsert_products, limit=args.limite)
+        elapsed = time.perf_counter() - started
+        n = sum(len(r) for r in applied.values())
+        print(f"Aplicadas {len(applied)} entradas ({n} produtos) em {elapsed:.1f}s"
+              f" ({n / max(elapsed, 1e-9):.0f} produtos/s). Pendentes: {len(pending())}")
+        notify(applied)
+    else:
+        print(f"Removidas: {prune(args.dias)}")
+
+
+if __name__ == "__main__":
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+    except Exception:
+        pass
+    main()